@@ -0,0 +1,113 @@
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+
+# --- FUNÇÕES ---
+
+def prazos_em_dias(df_chamados, data_inicio, n_dias):
+    """
+    Converte os prazos opcionais da planilha de chamados em um limite de dias (1..n_dias).
+    Aceita a coluna 'prazo' (data limite) ou 'prazo_dias' (nº de dias a partir do início).
+    Chamados sem prazo podem ser agendados em qualquer dia do período.
+    """
+    prazo = np.full(len(df_chamados), n_dias, dtype=np.int64)
+
+    if 'prazo' in df_chamados.columns:
+        datas = pd.to_datetime(df_chamados['prazo'], errors='coerce', dayfirst=True)
+        dias = (datas - pd.Timestamp(data_inicio)).dt.days + 1
+        prazo = np.where(dias.notna(), dias.fillna(n_dias), prazo)
+    elif 'prazo_dias' in df_chamados.columns:
+        dias = pd.to_numeric(df_chamados['prazo_dias'], errors='coerce')
+        prazo = np.where(dias.notna(), dias.fillna(n_dias), prazo)
+
+    # Prazo vencido (<= 0) ainda tenta o primeiro dia
+    return np.clip(prazo, 1, n_dias).astype(np.int64)
+
+
+def prioridades(df_chamados):
+    """Lê a coluna opcional 'prioridade' (maior = mais urgente). Sem a coluna, todos valem 0."""
+    if 'prioridade' not in df_chamados.columns:
+        return np.zeros(len(df_chamados), dtype=np.int64)
+    return pd.to_numeric(df_chamados['prioridade'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+
+def agendar_chamados(dist_km, capacidade, n_dias=1, prazo_dia=None, prioridade=None):
+    """
+    Distribui os chamados entre técnicos e dias minimizando a distância total percorrida.
+
+    - `dist_km`: matriz chamados x técnicos (infinito = técnico inelegível/fora do raio).
+    - `capacidade`: chamados por dia de cada técnico (escalar ou array; 0 = ilimitado).
+    - `prazo_dia`: último dia (1..n_dias) permitido para cada chamado.
+    - `prioridade`: desempate entre chamados com o mesmo prazo (maior primeiro).
+
+    Heurística gulosa por faixas: os chamados são agrupados por (prazo, prioridade) e,
+    dentro de cada faixa, os pares chamado-técnico são alocados do mais barato para o
+    mais caro, sempre no primeiro dia em que o técnico ainda tem capacidade.
+    Retorna (tecnico_idx, dia_idx, carga) com -1 para chamados não alocados.
+    """
+    dist_km = np.asarray(dist_km, dtype=float)
+    n, m = dist_km.shape
+    capacidade = np.broadcast_to(np.asarray(capacidade, dtype=np.int64), (m,))
+    ilimitado = capacidade <= 0
+
+    prazo_dia = np.full(n, n_dias, dtype=np.int64) if prazo_dia is None else np.asarray(prazo_dia, dtype=np.int64)
+    prioridade = np.zeros(n, dtype=np.int64) if prioridade is None else np.asarray(prioridade, dtype=np.int64)
+
+    tecnico_idx = np.full(n, -1, dtype=np.int64)
+    dia_idx = np.full(n, -1, dtype=np.int64)
+    carga = np.zeros(m, dtype=np.int64)  # total de chamados já alocados por técnico
+
+    # Ordena as faixas: prazo mais curto primeiro, depois maior prioridade
+    faixas = pd.DataFrame({'prazo': prazo_dia, 'prioridade': -prioridade}).groupby(['prazo', 'prioridade'], sort=True).indices
+
+    for (prazo, _), idx_faixa in faixas.items():
+        sub = dist_km[idx_faixa]
+        ii, jj = np.nonzero(np.isfinite(sub))
+        if ii.size == 0:
+            continue
+        ordem = np.argsort(sub[ii, jj], kind='stable')
+
+        pendentes = len(idx_faixa)
+        for k in ordem:
+            i = idx_faixa[ii[k]]
+            if tecnico_idx[i] >= 0:
+                continue
+            j = jj[k]
+            # Dias são preenchidos em ordem, então o primeiro dia livre é carga // capacidade
+            dia = 0 if ilimitado[j] else carga[j] // capacidade[j]
+            if dia >= prazo:
+                continue
+            tecnico_idx[i] = j
+            dia_idx[i] = dia
+            carga[j] += 1
+            pendentes -= 1
+            if pendentes == 0:
+                break
+
+    return tecnico_idx, dia_idx, carga
+
+
+def montar_plano_diario(df_resultado, data_inicio):
+    """
+    Gera o plano dia a dia por técnico a partir do resultado da alocação
+    (colunas 'Dia_Atendimento', 'Técnico_Mais_Próximo', 'Distância_km', 'Custo_Estimado_RS').
+    """
+    alocados = df_resultado[df_resultado['Dia_Atendimento'].notna()]
+    if alocados.empty:
+        return pd.DataFrame(columns=['Data', 'Técnico', 'Chamados', 'Distância Total (km)', 'Custo Total (R$)', 'Endereços'])
+
+    plano = alocados.groupby(['Dia_Atendimento', 'Técnico_Mais_Próximo'], sort=True).agg(
+        Chamados=('endereco', 'size'),
+        Distancia=('Distância_km', 'sum'),
+        Custo=('Custo_Estimado_RS', 'sum'),
+        Enderecos=('endereco', lambda s: ' | '.join(s.astype(str)))
+    ).reset_index()
+
+    plano.insert(0, 'Data', [data_inicio + timedelta(days=int(d) - 1) for d in plano['Dia_Atendimento']])
+    plano = plano.drop(columns='Dia_Atendimento').rename(columns={
+        'Técnico_Mais_Próximo': 'Técnico',
+        'Distancia': 'Distância Total (km)',
+        'Custo': 'Custo Total (R$)',
+        'Enderecos': 'Endereços'
+    })
+    return plano.round({'Distância Total (km)': 2, 'Custo Total (R$)': 2})
@@ -0,0 +1,83 @@
+import json
+
+from cobertura import AREA_BRASIL_KM2, analisar_cobertura, cobertura_por_uf, contar_descobertos, densidade_por_uf, municipios_descobertos, tecnicos_para_cobertura
+
+# --- FUNÇÕES ---
+
+def _especificacao(fig):
+    """Figura Plotly serializada (dict JSON), que pode ser guardada em cache e passada ao st.plotly_chart."""
+    return json.loads(fig.to_json())
+
+
+def figura_cobertura(cobertura, raio, geojson_ufs=None):
+    """
+    Mapa dos municípios sem técnico a até `raio`: coroplético do % de municípios
+    descobertos por UF (com o GeoJSON das UFs) ou, sem ele, os centroides descobertos
+    com tamanho proporcional ao volume de chamados.
+    """
+    import plotly.express as px
+
+    if geojson_ufs is not None:
+        fig = px.choropleth(
+            cobertura_por_uf(cobertura, raio), geojson=geojson_ufs, locations='uf', color='pct_descobertos',
+            hover_data=['municipios', 'descobertos', 'chamados_descobertos'], color_continuous_scale='Reds',
+            range_color=(0, 100), labels={'pct_descobertos': '% descobertos'},
+            title=f'Municípios sem Técnico a {raio} km (% por UF)',
+        )
+        fig.update_geos(fitbounds='locations', visible=False)
+        return fig
+
+    descobertos = municipios_descobertos(cobertura, raio)
+    fig = px.scatter_geo(
+        descobertos, lat='latitude', lon='longitude', size=descobertos['chamados'] + 1, color='distancia_km',
+        hover_name='nome', hover_data=['uf', 'chamados', 'tecnico'], color_continuous_scale='Reds',
+        labels={'distancia_km': 'Distância (km)'}, title=f'Municípios sem Técnico a {raio} km',
+    )
+    fig.update_geos(fitbounds='locations', showcountries=True)
+    return fig
+
+
+def montar_analise_tecnicos(df_tecnicos, df_municipios, modelo, raios, matriz=None, historico=None, geojson_ufs=None):
+    """
+    Todos os agregados da aba "Análise de Dados" de uma vez (para guardar em cache por
+    versão da tabela de técnicos): métricas gerais, especificações dos gráficos por UF e
+    por coordenador, densidade de técnicos por UF e a cobertura dos municípios em cada
+    raio, com um mapa por raio (None sem o cadastro de municípios).
+    """
+    import plotly.express as px
+
+    metricas = {
+        "Total de Técnicos": len(df_tecnicos),
+        "Total de Coordenadores": df_tecnicos['coordenador'].nunique(),
+        "Total de UFs Cobertas": df_tecnicos['uf'].nunique(),
+    }
+
+    df_uf = df_tecnicos.groupby('uf')['tecnico'].count().reset_index(name='Total de Técnicos')
+    fig_uf = px.bar(df_uf.sort_values('Total de Técnicos', ascending=False).head(10),
+                    x='uf', y='Total de Técnicos', title='Top 10 UFs por Número de Técnicos',
+                    color='uf', template='plotly_white')
+
+    df_coord = df_tecnicos.groupby('coordenador')['tecnico'].count().reset_index(name='Total de Técnicos')
+    df_coord = df_coord[df_coord['Total de Técnicos'] > 0] # Remove coordenadores sem técnicos
+    fig_coord = px.pie(df_coord, values='Total de Técnicos', names='coordenador',
+                       title='Distribuição de Técnicos por Coordenador', hole=0.3)
+
+    # Cobertura: só técnicos ativos com coordenadas confiáveis
+    tecnicos = tecnicos_para_cobertura(df_tecnicos)
+    cobertura, descobertos, figuras_cobertura = None, None, {}
+    if not df_municipios.empty:
+        cobertura = analisar_cobertura(df_municipios, tecnicos, modelo, raios, matriz, historico)
+        descobertos = contar_descobertos(cobertura, raios)
+        figuras_cobertura = {raio: _especificacao(figura_cobertura(cobertura, raio, geojson_ufs)) for raio in raios}
+
+    return {
+        'metricas': metricas,
+        'fig_uf': _especificacao(fig_uf),
+        'fig_coord': _especificacao(fig_coord),
+        'densidade_uf': densidade_por_uf(tecnicos),
+        'tecnicos_por_100mil_km2': len(tecnicos) / AREA_BRASIL_KM2 * 100_000,
+        'descobertos': descobertos,
+        'cobertura': cobertura,
+        'fig_cobertura': figuras_cobertura,
+        'total_municipios': len(df_municipios),
+    }
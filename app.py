@@ -1,20 +1,45 @@
 import streamlit as st
 import pandas as pd
-import requests
-import streamlit.components.v1 as components
-import io
-import plotly.express as px
 from math import radians, sin, cos, sqrt, asin
 import os
 import numpy as np
 import warnings
-import json
 from pandas.errors import EmptyDataError 
 from datetime import datetime
 
+from analise import montar_analise_tecnicos
+from cobertura import carregar_geojson_ufs, municipios_descobertos, tecnicos_para_cobertura
+from contratacao import ROTULOS_OBJETIVO, simular_contratacoes
+from historico_chamados import ORIGEM_FATURAMENTO, ORIGEM_LOTE, carregar_historico, ids_do_lote, mes_dos_chamados, registrar_chamados, versao_historico
+from base_tecnicos import BaseTecnicos, construir_facetas, filtrar_por_facetas
+from enderecos import canonicalizar_endereco, canonicalizar_enderecos, consulta_geocodificador
+from municipios import carregar_municipios, construir_indice, referencia_dos_tecnicos, reconciliar_cidades, colunas_cidade_uf, normalizar_nome
+from isocronas import carregar_isocronas, geojson_isocronas, tecnicos_na_isocrona
+from grade import NIVEIS_ZOOM, agregar_grade, descrever_nivel, tamanho_celula
+from mapa import MAX_CELULAS_MAPA, ROTULOS_MODO_GRADE, mapa_busca, mapa_grade, mapa_lote
+from matriz_municipios import carregar_matriz, montar_matriz_municipios, tecnicos_fora_da_matriz, versao_matriz
+from coordenadas import QUALIDADE_OK, QUALIDADE_REGEOCODIFICAR, FilaRegeocodificacao, avaliar_coordenadas, casar_correcoes, carregar_poligonos_uf, coordenadas_confiaveis
+from faturamento import ABA_FATURAMENTO, TOLERANCIA_RS, ROTULOS_CONCILIACAO, AGRUPAMENTOS_TOTAIS, carregar_faturamento, conciliar_revisao, resumir_conciliacao, totais_faturamento, comparar_revisoes
+from geocodificacao import geocodificar_canonico, geocodificar_tecnicos, normalizar_cep
+from roteamento import haversine_vetorizado, montar_matriz_chamados
+from desvio import FOLGA_FIXA, PARAMETROS_PADRAO, ajustar_modelo, carregar_observacoes, estimador, estimar_rotas, folga_por_par, observacoes_da_matriz, parametros_por_uf, registrar_rotas, ufs_dos_chamados, versao_modelo
+from agendamento import agendar_chamados, prazos_em_dias, prioridades, montar_plano_diario
+from sequenciamento import sequenciar_rotas, resumir_rotas_por_dia
+from progresso import ETAPA_ALOCACAO, ETAPA_GEOCODIFICACAO, ETAPA_ROTEAMENTO, ETAPA_SEQUENCIAMENTO, BarraStreamlit, Progresso, TabelaSituacao
+from resultados import STATUS_ALOCADO, STATUS_ERRO, classificar_status, montar_resultado_lote, resumir_status, rotulos_status, formatar_resultado
+from exportacao import FORMATOS_EXPORTACAO, LINHAS_SUGERIR_CSV, exportar, exportar_excel
+from elegibilidade import preparar_colunas_elegibilidade, capacidades_tecnicos, tecnicos_ativos, matriz_elegibilidade
+
 # Suprime FutureWarnings do Pandas para um Streamlit mais limpo
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+# Copy-on-Write (padrão a partir do pandas 3.0) para todo o processo do app: filtros e
+# visões não copiam os dados (a tabela compartilhada de técnicos é lida sem cópia a cada
+# rerun) e alterar uma visão nunca altera o DataFrame de origem. Com ele, atribuições
+# encadeadas (df['col'][mascara] = valor) não têm efeito; use df.loc[mascara, 'col'].
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # --- CONFIGURAÇÃO INICIAL E CSS ---
 # Título atualizado para refletir a mudança de API
 st.set_page_config(page_title="Localizador de Técnicos (v3.0 - Open Source)", layout="wide") 
@@ -40,18 +65,6 @@ st.markdown("""
             width: 100% !important;
         }
     }
-    /* Estilo para os botões alinhados */
-    .button-group a {
-        display: inline-block;
-        padding: 8px 15px;
-        color: white;
-        text-align: center;
-        text-decoration: none;
-        border-radius: 5px;
-        font-size: 14px;
-        margin-right: 10px; /* Espaço entre os botões */
-        margin-top: 5px;
-    }
     /* Ajuste visual para o st.radio */
     div[data-testid="stRadio"] label {
         margin-right: 15px;
@@ -69,6 +82,12 @@ RAIOS = [30, 100, 200]
 # CUSTO ATUALIZADO: R$ 1,00/km (ida) * 2 (ida e volta) = R$ 2,00/km
 CUSTO_POR_KM = 2.0 
 ARQUIVO_TECNICOS = 'tecnicos.xlsx'
+# Colunas das listas de técnicos (st.dataframe) e links de contato com o coordenador
+CONFIG_TECNICOS = {'tecnico': "Técnico", 'cidade': "Cidade", 'uf': "UF", 'coordenador': "Coordenador"}
+CONFIG_LINKS_COORDENADOR = {
+    'teams': st.column_config.LinkColumn("Teams", display_text="📞 Falar com Coordenador"),
+    'email': st.column_config.LinkColumn("E-mail", display_text="✉️ Enviar E-mail"),
+}
 
 # --- FUNÇÕES ---
 
@@ -87,48 +106,14 @@ def haversine(lat1, lon1, lat2, lon2):
 
 # --- FUNÇÕES DE API SUBSTITUÍDAS ---
 
-@st.cache_data(show_spinner=False)
-def geocodificar_endereco(endereco): # USA NOMINATIM (GRATUITO/OSM)
-    """
-    Converte um endereço em coordenadas (latitude e longitude) usando a API
-    gratuita do Nominatim (OpenStreetMap).
-    """
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": endereco,
-        "format": "json",
-        "limit": 1,
-        "addressdetails": 0 # Diminui o payload
-    }
-    # Adicionar um User-Agent é uma boa prática
-    headers = {'User-Agent': 'LocalizadorDeTecnicosApp/1.0 (Streamlit/Python)'} 
-    
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status() # Lança exceção para códigos de erro HTTP
-        data = response.json()
-        
-        if data:
-            lat = float(data[0]['lat'])
-            lng = float(data[0]['lon'])
-            return lat, lng
-        else:
-            return None, None
-    except requests.exceptions.Timeout:
-        # st.error("Tempo limite excedido para geocodificação (Nominatim).")
-        return None, None
-    except requests.exceptions.RequestException:
-        # st.error(f"Erro na requisição Nominatim: {e}") 
-        return None, None
-    except Exception:
-        return None, None
-
 @st.cache_data(show_spinner=False) # Adição do cache para evitar recálculo para o mesmo par de coordenadas.
 def get_route_distance_osrm(origem_lat, origem_lng, destino_lat, destino_lng):
     """
     Obtém a distância de carro (km) e tempo (texto e segundos) do OSRM (GRATUITO/OSM).
     Substitui o Google Maps Distance Matrix.
     """
+    import requests
+
     # Serviço OSRM Público para Rotas
     url = f"http://router.project-osrm.org/route/v1/driving/{origem_lng},{origem_lat};{destino_lng},{destino_lat}"
     
@@ -184,6 +169,18 @@ def load_data(file_path):
                 df[col] = df[col].astype(str).str.replace(',', '.', regex=False)
                 df[col] = pd.to_numeric(df[col], errors='coerce')
         
+        # CEP e número como texto (o Excel costuma ler como número e perder o zero à esquerda)
+        if 'cep' in df.columns:
+            df['cep'] = df['cep'].map(normalizar_cep)
+        if 'numero' in df.columns:
+            df['numero'] = df['numero'].astype('string').str.replace(r'\.0$', '', regex=True)
+        
+        # Colunas opcionais: capacidade por técnico, habilidades e disponibilidade
+        df = preparar_colunas_elegibilidade(df)
+        
+        # Qualidade das coordenadas (Brasil, UF, cidade declarada, lat/lng trocadas ou sem sinal)
+        df['qualidade_coord'] = avaliar_coordenadas(df, obter_indice_municipios(), obter_poligonos_uf())['qualidade_coord']
+        
         return df
     except FileNotFoundError:
         st.error(f"Erro: O arquivo '{file_path}' não foi encontrado.")
@@ -198,24 +195,14 @@ def load_data(file_path):
 def save_data(df, file_path):
     """Salva os dados de volta para o arquivo Excel."""
     try:
-        df.to_excel(file_path, index=False)
+        # 'qualidade_coord' é recalculada a cada carga, não vai para a planilha
+        df.drop(columns=['qualidade_coord'], errors='ignore').to_excel(file_path, index=False)
         st.success("Dados salvos com sucesso!")
         return True
     except Exception as e:
         st.error(f"Erro ao salvar a planilha: {e}")
         return False
 
-def preencher_resultado_vazio(resultado):
-    """Função auxiliar para preencher campos de técnico vazio na análise em lote."""
-    resultado['Técnico_Mais_Próximo'] = 'N/A'
-    resultado['Coordenador_Técnico'] = 'N/A'
-    resultado['UF_Técnico'] = 'N/A'
-    resultado['Distância_km'] = 'N/A'
-    resultado['Tempo_Estimado'] = 'N/A'
-    resultado['Custo_Estimado_RS'] = 'N/A'
-    resultado['Chamados_Alocados_Tecnico'] = 0 # Adicionado para garantir a coluna no merge
-    return resultado
-
 # FUNÇÃO MODIFICADA PARA USAR OSRM
 def encontrar_tecnico_proximo(endereco_cliente, df_filtrado, max_distance_km):
     """
@@ -223,13 +210,15 @@ def encontrar_tecnico_proximo(endereco_cliente, df_filtrado, max_distance_km):
     geocodificação Nominatim e rotas de carro OSRM.
     """
     
-    df_validos = df_filtrado.dropna(subset=['latitude', 'longitude']).copy()
+    df_validos = df_filtrado[coordenadas_confiaveis(df_filtrado)].copy() # Ignora coordenadas ausentes ou inválidas
+    df_validos = df_validos[tecnicos_ativos(df_validos)] # Ignora técnicos inativos/em férias
     
     if df_validos.empty:
         return None, None
 
-    # 1. GEOCODIFICAR ENDEREÇO DO CLIENTE (USA NOMINATIM)
-    lat_cliente, lng_cliente = geocodificar_endereco(endereco_cliente)
+    # 1. GEOCODIFICAR ENDEREÇO DO CLIENTE (USA NOMINATIM, COM O ENDEREÇO CANONICALIZADO)
+    consulta, cep, chave = canonicalizar_endereco(endereco_cliente, obter_indice_municipios()['uf_unica'])
+    lat_cliente, lng_cliente = geocodificar_canonico(chave, consulta_geocodificador(consulta, cep))
     
     if lat_cliente is None:
         # st.error(f"Não foi possível geocodificar o endereço do cliente: {endereco_cliente}")
@@ -238,14 +227,19 @@ def encontrar_tecnico_proximo(endereco_cliente, df_filtrado, max_distance_km):
     localizacao_cliente = {'lat': lat_cliente, 'lng': lng_cliente}
 
     # 2. PRÉ-FILTRO HAVERSINE PARA OTIMIZAÇÃO (SEM CHAMADA DE API)
-    FATOR_FOLGA = 1.5  
-    RAIO_MAXIMO_AEREO = max_distance_km * FATOR_FOLGA
-
+    # Raio aéreo por técnico: raio / menor fator de desvio observado na UF do cliente
+    # (a do técnico mais próximo) e na UF do técnico
     df_temp = df_validos.copy()
     df_temp['distancia_aerea_km'] = df_temp.apply(
         lambda x: haversine(lat_cliente, lng_cliente, x['latitude'], x['longitude']), axis=1
     )
-    df_candidatos = df_temp[df_temp['distancia_aerea_km'] <= RAIO_MAXIMO_AEREO].copy()
+    modelo = obter_modelo_desvio()
+    uf_cliente = df_temp.loc[df_temp['distancia_aerea_km'].idxmin(), 'uf']
+    raio_maximo_aereo = max_distance_km * folga_por_par(modelo, [uf_cliente], df_temp['uf'])[0]
+    parametros = parametros_por_uf(modelo, df_temp['uf'])
+    no_raio = (df_temp['distancia_aerea_km'] <= raio_maximo_aereo).to_numpy()
+    df_candidatos = df_temp[no_raio].copy()
+    parametros = parametros[no_raio].reset_index(drop=True)
 
     if df_candidatos.empty:
         return pd.DataFrame(), localizacao_cliente # Retorna vazio, mas com localização do cliente
@@ -269,6 +263,22 @@ def encontrar_tecnico_proximo(endereco_cliente, df_filtrado, max_distance_km):
     
     # 4. CONSOLIDAR RESULTADOS E FILTRAR
     df_candidatos = df_candidatos.join(df_rotas)
+
+    # Rotas reais alimentam o modelo de desvio; sem rota (OSRM fora do ar), estima pela distância aérea
+    sem_rota = ~np.isfinite(df_candidatos['distancia_km'].to_numpy(dtype=float))
+    registrar_rotas(
+        lat_cliente, lng_cliente, df_candidatos['latitude'][~sem_rota], df_candidatos['longitude'][~sem_rota],
+        df_candidatos['distancia_km'][~sem_rota], df_candidatos['tempo_seconds'][~sem_rota], df_candidatos['uf'][~sem_rota]
+    )
+    df_candidatos['rota_estimada'] = sem_rota
+    if sem_rota.any():
+        dist_est, tempo_est, dist_min, dist_max = estimar_rotas(df_candidatos['distancia_aerea_km'], parametros)
+        df_candidatos.loc[sem_rota, 'distancia_km'] = dist_est[sem_rota]
+        df_candidatos.loc[sem_rota, 'tempo_seconds'] = tempo_est[sem_rota]
+        df_candidatos.loc[sem_rota, 'tempo_text'] = [
+            f"~{int(t // 60)} min (estimado: {d_min:.0f} a {d_max:.0f} km)"
+            for t, d_min, d_max in zip(tempo_est[sem_rota], dist_min[sem_rota], dist_max[sem_rota])
+        ]
     
     # Cálculo de Custo R$ 2/km (ida e volta)
     df_candidatos["custo_rs"] = df_candidatos["distancia_km"] * CUSTO_POR_KM
@@ -279,155 +289,398 @@ def encontrar_tecnico_proximo(endereco_cliente, df_filtrado, max_distance_km):
     # Retorna todos os técnicos dentro do limite, ordenados
     return df_dentro_limite.sort_values("distancia_km"), localizacao_cliente
 
-# LÓGICA DE BUSCA EM LOTE (MODIFICADA PARA USAR OSRM)
+def encontrar_tecnicos_por_isocrona(endereco_cliente, df_filtrado, limite_min):
+    """
+    Técnicos cuja isócrona de `limite_min` minutos contém o endereço do cliente, sem
+    nenhuma rota por chamado: elegibilidade por ponto-no-polígono e distância/tempo
+    estimados pelo modelo de desvio.
+    """
+    df_validos = df_filtrado[coordenadas_confiaveis(df_filtrado)].copy()
+    df_validos = df_validos[tecnicos_ativos(df_validos)]
+
+    if df_validos.empty:
+        return None, None
+
+    consulta, cep, chave = canonicalizar_endereco(endereco_cliente, obter_indice_municipios()['uf_unica'])
+    lat_cliente, lng_cliente = geocodificar_canonico(chave, consulta_geocodificador(consulta, cep))
+
+    if lat_cliente is None:
+        return None, None
+
+    localizacao_cliente = {'lat': lat_cliente, 'lng': lng_cliente}
+
+    dentro = tecnicos_na_isocrona(obter_isocronas(), [lat_cliente], [lng_cliente], df_validos, limite_min)[0]
+    df_candidatos = df_validos[dentro].copy()
+    if df_candidatos.empty:
+        return pd.DataFrame(), localizacao_cliente
+
+    df_candidatos['distancia_aerea_km'] = haversine_vetorizado(
+        lat_cliente, lng_cliente, df_candidatos['latitude'].to_numpy(dtype=float), df_candidatos['longitude'].to_numpy(dtype=float)
+    )
+    dist_est, tempo_est, _, _ = estimar_rotas(df_candidatos['distancia_aerea_km'], parametros_por_uf(obter_modelo_desvio(), df_candidatos['uf']))
+    df_candidatos['distancia_km'] = dist_est
+    df_candidatos['tempo_seconds'] = tempo_est
+    df_candidatos['tempo_text'] = [f"~{int(t // 60)} min (isócrona de {limite_min} min)" for t in tempo_est]
+    df_candidatos['rota_estimada'] = True
+    df_candidatos["custo_rs"] = df_candidatos["distancia_km"] * CUSTO_POR_KM
+
+    return df_candidatos.sort_values("distancia_km"), localizacao_cliente
+
+
+def links_coordenador(df):
+    """
+    Links de chat no Teams e de e-mail do coordenador de cada técnico (None sem e-mail),
+    para as LinkColumn das listas de técnicos. Retorna (teams, email).
+    """
+    emails = df['email_coordenador'] if 'email_coordenador' in df.columns else pd.Series(pd.NA, index=df.index)
+    emails = emails.astype('string').str.strip()
+    tem_email = (emails.notna() & (emails != '')).to_numpy(dtype=bool)
+    return (
+        ("https://teams.microsoft.com/l/chat/0/0?users=" + emails).where(tem_email),
+        ("mailto:" + emails).where(tem_email),
+    )
+
+
+def tabela_exportacao_busca(tecnicos_proximos):
+    """Técnicos encontrados na busca individual, com as colunas e os nomes da planilha exportada."""
+    df_to_export = tecnicos_proximos[[
+        'tecnico', 'coordenador', 'cidade', 'uf', 
+        'distancia_km', 'tempo_text', 'custo_rs', 
+        'email_coordenador'
+    ]].copy()
+    df_to_export['distancia_km'] = df_to_export['distancia_km'].round(2)
+    df_to_export['custo_rs'] = df_to_export['custo_rs'].round(2)
+    return df_to_export.rename(columns={
+        'tecnico': 'Técnico',
+        'coordenador': 'Coordenador',
+        'distancia_km': 'Distância (km)',
+        'tempo_text': 'Tempo Estimado',
+        'custo_rs': f'Custo Estimado (R$ {CUSTO_POR_KM:.2f}/km - Ida e Volta)',
+    })
+
+
+def download_sob_demanda(chave, gerar, rotulo, nome_arquivo, mime, key):
+    """
+    Gera o arquivo só quando o usuário pede ("Gerar Arquivo") e o guarda na sessão em
+    `key` junto com a `chave` do conteúdo; o botão de download aparece enquanto a chave
+    não mudar, e os reruns não montam de novo arquivos que ninguém pediu.
+    """
+    if st.button("📦 Gerar Arquivo para Download", key=f"gerar_{key}"):
+        with st.spinner("Gerando arquivo..."):
+            st.session_state[key] = (chave, gerar())
+    arquivo = st.session_state.get(key)
+    if arquivo is not None and arquivo[0] == chave:
+        # on_click="ignore" mantém a tela como está após o download
+        st.download_button(label=rotulo, data=arquivo[1], file_name=nome_arquivo, mime=mime, on_click="ignore")
+
+
+@st.cache_resource(show_spinner=False)
+def obter_indice_municipios():
+    """Índice de busca aproximada do cadastro de municípios do IBGE (montado uma vez por processo)."""
+    return construir_indice(carregar_municipios())
+
+
+@st.cache_resource(show_spinner=False)
+def obter_poligonos_uf():
+    """Polígonos das UFs (opcional, dados/ufs.geojson); sem eles a validação usa o retângulo de cada UF."""
+    return carregar_poligonos_uf()
+
+
+@st.cache_resource(show_spinner=False)
+def obter_fila_regeocodificacao():
+    """Fila de nova geocodificação em segundo plano, compartilhada entre as sessões."""
+    return FilaRegeocodificacao(geocodificar_tecnicos)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def abrir_matriz_municipios(versao):
+    """Memory-map da matriz de uma versão (só a última fica aberta)."""
+    return carregar_matriz()
+
+
+def obter_matriz_municipios():
+    """
+    Matriz técnico x município pré-calculada (memory-map; None se `python matriz_municipios.py`
+    não foi rodado), reaberta quando o job de atualização grava uma nova versão.
+    """
+    return abrir_matriz_municipios(versao_matriz())
+
+
+@st.cache_resource(show_spinner=False)
+def obter_isocronas():
+    """Isócronas de tempo de carro por técnico (memory-map; None se `python isocronas.py` não foi rodado)."""
+    return carregar_isocronas()
+
+
+@st.cache_resource(show_spinner=False, ttl=3600)
+def obter_modelo_desvio():
+    """
+    Modelo de desvio (rota / distância aérea) por UF/região, ajustado com as rotas já
+    calculadas e, se existir, com a matriz técnico x município. Reajustado a cada hora.
+    """
+    observacoes = [carregar_observacoes()]
+    matriz = obter_matriz_municipios()
+    if matriz is not None and os.path.exists(ARQUIVO_TECNICOS):
+        observacoes.append(observacoes_da_matriz(matriz, carregar_municipios(), load_data(ARQUIVO_TECNICOS)))
+    observacoes = [df for df in observacoes if not df.empty]
+    if not observacoes:
+        return pd.DataFrame(columns=list(PARAMETROS_PADRAO))
+    return ajustar_modelo(pd.concat(observacoes, ignore_index=True))
+
+
+def raio_aereo_maximo(max_distance_km):
+    """Maior raio aéreo do pré-filtro entre as UFs (texto do status 'fora do raio aéreo')."""
+    modelo = obter_modelo_desvio()
+    fator_min = min([PARAMETROS_PADRAO['fator_min'], *modelo['fator_min']])
+    return max_distance_km / fator_min
+
+
+@st.cache_resource(show_spinner=False)
+def obter_base_tecnicos():
+    """
+    Tabela de técnicos compartilhada por todas as sessões (carregada uma vez por processo).
+    Coordenadas suspeitas vão para a fila de nova geocodificação (em segundo plano).
+    """
+    df = load_data(ARQUIVO_TECNICOS)
+    if 'qualidade_coord' in df.columns:
+        suspeitas = df['qualidade_coord'].isin(QUALIDADE_REGEOCODIFICAR)
+        if suspeitas.any():
+            obter_fila_regeocodificacao().enfileirar(df[suspeitas])
+    return BaseTecnicos(df)
+
+
+def aquecer_recursos():
+    """
+    Carrega os recursos compartilhados (técnicos, índice de municípios, matriz, isócronas
+    e modelo de desvio) no cache do processo. Chamado na tela de login, enquanto a senha
+    é digitada, para a primeira execução depois do login já encontrar tudo pronto.
+    """
+    obter_base_tecnicos()
+    obter_indice_municipios()
+    obter_matriz_municipios()
+    obter_isocronas()
+    obter_modelo_desvio()
+
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4)
+def obter_analise_tecnicos(versao, versao_hist, versao_desvio, versao_mat, _df_tecnicos):
+    """
+    Agregados e gráficos da aba de análise, calculados uma vez por versão da tabela de
+    técnicos, do histórico de chamados, do modelo de desvio e da matriz técnico x município.
+    """
+    return montar_analise_tecnicos(_df_tecnicos, carregar_municipios(), obter_modelo_desvio(), RAIOS,
+                                   obter_matriz_municipios(), carregar_historico(), carregar_geojson_ufs())
+
+
+@st.cache_data(show_spinner=False)
+def obter_meses_historico(versao_hist):
+    """Meses com chamados no histórico, do mais recente para o mais antigo."""
+    return sorted(mes_dos_chamados(carregar_historico()).dropna().unique(), reverse=True)
+
+
+def montar_grade_chamados(df_tecnicos, mes, raio):
+    """Células de chamados (histórico, opcionalmente de um mês) x técnicos em todos os níveis de zoom."""
+    historico = carregar_historico()
+    if mes is not None:
+        historico = historico[(mes_dos_chamados(historico) == mes).fillna(False).to_numpy()]
+    return agregar_grade(historico['latitude'], historico['longitude'], tecnicos_para_cobertura(df_tecnicos),
+                         obter_modelo_desvio(), raio)
+
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=8)
+def obter_grade_chamados(versao, versao_hist, versao_desvio, mes, raio, _df_tecnicos):
+    """Grade agregada calculada uma vez por versão da tabela de técnicos, do histórico, do modelo de desvio, mês e raio."""
+    return montar_grade_chamados(_df_tecnicos, mes, raio)
+
+
+def indice_municipios(df_tecnicos):
+    """
+    Índice do IBGE ou, sem o arquivo de municípios, o das cidades da planilha de técnicos
+    (sem as coordenadas inválidas ou suspeitas, para o centroide não ser puxado por uma coordenada errada).
+    """
+    indice = obter_indice_municipios()
+    if indice['municipios'].empty:
+        sem_suspeitas = coordenadas_confiaveis(df_tecnicos)
+        if 'qualidade_coord' in df_tecnicos.columns:
+            sem_suspeitas &= ~df_tecnicos['qualidade_coord'].astype(str).isin(QUALIDADE_REGEOCODIFICAR).to_numpy()
+        indice = construir_indice(referencia_dos_tecnicos(df_tecnicos[sem_suspeitas]))
+    return indice
+
+# LÓGICA DE BUSCA EM LOTE (MATRIZ DE DISTÂNCIAS + AGENDAMENTO MULTI-DIA)
 @st.cache_data(show_spinner=False)
-def processar_chamados_em_lote(df_chamados, df_tecnicos_base, max_distance_km, capacidade_diaria):
+def processar_chamados_em_lote(df_chamados, df_tecnicos_base, max_distance_km, capacidade_diaria, n_dias=1, data_inicio=None,
+                               por_municipio=False):
     """
-    Processa chamados em lote usando pré-filtro Haversine e a API OSRM para rotas.
-    Aplicação da lógica de capacidade diária de atendimento.
+    Processa chamados em lote: geocodifica os endereços, monta a matriz chamados x técnicos
+    (pré-filtro Haversine + OSRM /table) e distribui os chamados em `n_dias` dias,
+    respeitando a capacidade diária de cada técnico (coluna opcional 'capacidade_diaria',
+    senão o valor global), os técnicos elegíveis (ativos e com as 'habilidades' exigidas)
+    e os prazos/prioridades opcionais.
+    Com `por_municipio=True`, cada chamado fica no centroide do seu município (colunas
+    cidade/uf) e as distâncias vêm da matriz pré-calculada, sem nenhuma chamada de API.
+    Após a alocação, sequencia a rota de cada técnico em cada dia (várias paradas
+    em um único trajeto) para estimar o custo real do deslocamento.
+    Retorna (df_resultados, resumo, df_plano_diario, df_rotas).
     """
     
     if 'endereco' not in df_chamados.columns or df_chamados['endereco'].isnull().all():
-        return None, "A planilha de chamados deve conter uma coluna chamada 'endereco' com os endereços a serem buscados."
+        return None, "A planilha de chamados deve conter uma coluna chamada 'endereco' com os endereços a serem buscados.", None, None
 
-    df_tecnicos_validos = df_tecnicos_base.dropna(subset=['latitude', 'longitude']).copy()
-    df_resultados_finais = []
+    data_inicio = data_inicio or datetime.now().date()
+    df_chamados = df_chamados.reset_index(drop=True)
+    df_tecnicos_validos = df_tecnicos_base[coordenadas_confiaveis(df_tecnicos_base)].reset_index(drop=True)
     
     total_chamados = len(df_chamados)
-    chamados_com_erro = 0
-    chamados_otimizados = 0
 
-    # Inicializa o controle de alocação de capacidade
-    tecnicos_capacidade = {t: 0 for t in df_tecnicos_validos['tecnico'].unique()}
-
-    FATOR_FOLGA = 1.5  
-    RAIO_MAXIMO_AEREO = max_distance_km * FATOR_FOLGA
-
-    # Usa o st.progress para dar feedback visual no processamento
-    progress_bar = st.progress(0, text="Processando 0% dos chamados...")
-    
-    for i, row_chamado in df_chamados.iterrows():
-        endereco_cliente = row_chamado['endereco']
-        
-        progress_bar.progress((i + 1) / total_chamados, text=f"Processando chamado {i + 1} de {total_chamados}...")
-
-        if pd.isnull(endereco_cliente) or not endereco_cliente.strip():
-            chamados_com_erro += 1
-            row_chamado['Status'] = 'ERRO: Endereço vazio'
-            df_resultados_finais.append(preencher_resultado_vazio(row_chamado.to_dict()))
-            continue
-
-        # 1. GEOCODIFICAR ENDEREÇO DO CHAMADO (USA NOMINATIM)
-        lat_cliente, lng_cliente = geocodificar_endereco(endereco_cliente)
-
-        if lat_cliente is None:
-            chamados_com_erro += 1
-            resultado = row_chamado.to_dict()
-            resultado['Status'] = 'ERRO: Falha na Geocodificação'
-            df_resultados_finais.append(preencher_resultado_vazio(resultado))
-            continue
-
-        # 2. PRÉ-FILTRO POR DISTÂNCIA HAVERSINE (OTIMIZAÇÃO)
-        df_temp = df_tecnicos_validos.copy()
-        
-        df_temp['distancia_aerea_km'] = df_temp.apply(
-            lambda x: haversine(lat_cliente, lng_cliente, x['latitude'], x['longitude']), axis=1
+    # Barra e tabela de situação por etapa, atualizadas no máximo FREQUENCIA_HZ vezes por segundo
+    progresso = Progresso([BarraStreamlit(st.progress(0, text="Preparando os chamados...")), TabelaSituacao(st.empty())])
+
+    # 1. GEOCODIFICAR ENDEREÇOS DOS CHAMADOS (USA NOMINATIM)
+    # Endereços canonicalizados: variações de escrita do mesmo endereço geram uma única consulta
+    # (a UF que falta é completada pela cidade, quando o nome só existe numa UF do cadastro do IBGE)
+    canonicos = canonicalizar_enderecos(df_chamados['endereco'], obter_indice_municipios()['uf_unica'])
+    lat_municipio = np.full(total_chamados, np.nan)
+    lng_municipio = np.full(total_chamados, np.nan)
+
+    # Colunas opcionais de cidade/UF: grafias diferentes ('PORTO VELHO', 'Porto velho')
+    # viram o mesmo município antes da geocodificação
+    col_cidade, col_uf = colunas_cidade_uf(df_chamados)
+    codigos_ibge = pd.array([pd.NA] * total_chamados, dtype='Int64')
+    ufs_informadas = None
+    if col_cidade is not None:
+        mun = reconciliar_cidades(indice_municipios(df_tecnicos_base), df_chamados[col_cidade], df_chamados[col_uf] if col_uf else None)
+        tem_mun = mun['municipio'].notna().to_numpy()
+        cidade_uf = (mun['municipio'].map(normalizar_nome) + ' ' + mun['uf_municipio'].str.lower()).fillna('')
+        falta_cidade = tem_mun & ~np.array([c.rsplit(' ', 1)[0] in q for c, q in zip(cidade_uf, canonicos['consulta'])])
+        canonicos.loc[falta_cidade, 'consulta'] = (canonicos['consulta'] + ' ' + cidade_uf).str.strip()[falta_cidade]
+        canonicos.loc[tem_mun, 'chave'] = (canonicos['chave'] + '|' + cidade_uf)[tem_mun]
+        lat_municipio = mun['latitude_municipio'].to_numpy(dtype=float)
+        lng_municipio = mun['longitude_municipio'].to_numpy(dtype=float)
+        codigos_ibge = mun['codigo_ibge'].array
+        ufs_informadas = mun['uf_municipio'].fillna('')
+    # Sem rua, mas com município conhecido: usa o centroide do município sem consultar a API
+    so_municipio = (canonicos['chave'].str.split('|').str[0].str.strip() == '').to_numpy() & ~np.isnan(lat_municipio)
+    endereco_vazio = (canonicos['consulta'] == '').to_numpy()
+    a_geocodificar = ~endereco_vazio & ~so_municipio
+    if por_municipio:
+        # Precisão de município: nenhum endereço é geocodificado
+        so_municipio = ~np.isnan(lat_municipio)
+        a_geocodificar[:] = False
+    unicos = canonicos[a_geocodificar].drop_duplicates('chave')
+    total_unicos = len(unicos)
+
+    coordenadas = {}
+    progresso.iniciar(ETAPA_GEOCODIFICACAO, total_unicos)
+    for k, row in enumerate(unicos.itertuples(index=False)):
+        coordenadas[row.chave] = geocodificar_canonico(row.chave, consulta_geocodificador(row.consulta, row.cep))
+        progresso.atualizar(ETAPA_GEOCODIFICACAO, k + 1)
+    progresso.concluir(ETAPA_GEOCODIFICACAO)
+
+    coords_chamados = canonicos['chave'].map(coordenadas)
+    lat_chamados = np.array([c[0] if isinstance(c, tuple) and c[0] is not None else np.nan for c in coords_chamados], dtype=float)
+    lng_chamados = np.array([c[1] if isinstance(c, tuple) and c[1] is not None else np.nan for c in coords_chamados], dtype=float)
+    lat_chamados[so_municipio] = lat_municipio[so_municipio]
+    lng_chamados[so_municipio] = lng_municipio[so_municipio]
+
+    falha_geocod = np.isnan(lat_chamados) & ~endereco_vazio
+    if por_municipio:
+        endereco_vazio = np.zeros(total_chamados, dtype=bool)
+        falha_geocod = np.isnan(lat_chamados) | pd.isna(codigos_ibge)
+
+    # 2. ELEGIBILIDADE (ATIVOS E HABILIDADES) EM MÁSCARAS PRÉ-CALCULADAS
+    elegiveis = matriz_elegibilidade(df_chamados, df_tecnicos_validos)
+    sem_elegiveis = ~elegiveis.any(axis=1)
+
+    # 3. MATRIZ DE DISTÂNCIAS REAIS (PRÉ-FILTRO HAVERSINE + OSRM /table, OU MATRIZ POR MUNICÍPIO)
+    # O modelo de desvio dá o raio aéreo de cada par (UF do chamado e do técnico) e a estimativa quando não há rota
+    modelo = obter_modelo_desvio()
+    parametros = parametros_por_uf(modelo, df_tecnicos_validos['uf'])
+    ufs_chamados = ufs_dos_chamados(lat_chamados, lng_chamados, df_tecnicos_validos['latitude'],
+                                    df_tecnicos_validos['longitude'], df_tecnicos_validos['uf'], ufs_informadas)
+    folga = folga_por_par(modelo, ufs_chamados, df_tecnicos_validos['uf'])
+    progresso.iniciar(ETAPA_ROTEAMENTO, 0)
+    if por_municipio:
+        dist_km, tempo_s, n_candidatos_aereos, estimado = montar_matriz_municipios(
+            obter_matriz_municipios(), codigos_ibge, lat_chamados, lng_chamados, df_tecnicos_validos,
+            max_distance_km, fator_folga=folga, elegiveis=elegiveis,
+            estimar=estimador(parametros)
         )
-        
-        df_candidatos = df_temp[df_temp['distancia_aerea_km'] <= RAIO_MAXIMO_AEREO].copy()
-
-        if df_candidatos.empty:
-            resultado = row_chamado.to_dict()
-            resultado['Status'] = f'Nenhum técnico no raio AÉREO de {RAIO_MAXIMO_AEREO:.0f} km'
-            df_resultados_finais.append(preencher_resultado_vazio(resultado))
-            continue
-            
-        chamados_otimizados += 1
-        
-        # 3. CALCULAR DISTÂNCIAS REAIS APENAS PARA CANDIDATOS (USA OSRM)
-        distancias_reais = []
-        
-        for idx_candidato, row_candidato in df_candidatos.iterrows():
-            # Chamada OSRM (pode ser lenta)
-            dist_km, tempo_text, tempo_seconds = get_route_distance_osrm(
-                lat_cliente, lng_cliente, row_candidato['latitude'], row_candidato['longitude']
+    else:
+        rotas_obtidas = []
+        dist_km, tempo_s, n_candidatos_aereos, estimado = montar_matriz_chamados(
+            lat_chamados, lng_chamados,
+            df_tecnicos_validos['latitude'], df_tecnicos_validos['longitude'],
+            max_distance_km, fator_folga=folga, elegiveis=elegiveis,
+            ao_rotear=lambda k, total: progresso.atualizar(ETAPA_ROTEAMENTO, k + 1, total),
+            estimar=estimador(parametros),
+            ao_obter_rotas=lambda i, cols, d, t: rotas_obtidas.append((np.full(len(cols), i), cols, d, t))
+        )
+        if rotas_obtidas:
+            linhas, cols, d, t = (np.concatenate(partes) for partes in zip(*rotas_obtidas))
+            registrar_rotas(
+                lat_chamados[linhas], lng_chamados[linhas],
+                df_tecnicos_validos['latitude'].to_numpy(dtype=float)[cols],
+                df_tecnicos_validos['longitude'].to_numpy(dtype=float)[cols],
+                d, t, df_tecnicos_validos['uf'].to_numpy()[cols]
             )
-            distancias_reais.append({
-                'index': idx_candidato,
-                'distancia_km': dist_km,
-                'tempo_text': tempo_text,
-                'tempo_seconds': tempo_seconds
-            })
-
-        df_rotas = pd.DataFrame(distancias_reais).set_index('index')
-        df_candidatos = df_candidatos.join(df_rotas)
-        
-        # Cálculo de Custo R$ 2/km (ida e volta)
-        df_candidatos["custo_rs"] = df_candidatos["distancia_km"] * CUSTO_POR_KM
-        
-        # Filtra pelo raio real (distância de carro OSRM)
-        df_aptos = df_candidatos[df_candidatos["distancia_km"] <= max_distance_km].sort_values("distancia_km")
+    chamados_otimizados = int((n_candidatos_aereos > 0).sum())
+    progresso.concluir(ETAPA_ROTEAMENTO, chamados_otimizados if por_municipio else None)
+    # Chamados com alguma distância de rota real (OSRM) dentro do raio e chamados em que todas
+    # as distâncias dentro do raio vieram da estimativa pela distância aérea (OSRM fora do ar)
+    com_rota_osrm = (np.isfinite(dist_km) & ~estimado).any(axis=1)
+    so_estimados = estimado.any(axis=1) & ~com_rota_osrm
+    # Referência: quantos pares a folga fixa antiga teria roteado
+    aereo = haversine_vetorizado(lat_chamados[:, None], lng_chamados[:, None],
+                                 df_tecnicos_validos['latitude'].to_numpy(dtype=float)[None, :],
+                                 df_tecnicos_validos['longitude'].to_numpy(dtype=float)[None, :])
+    pares_folga_fixa = int(((aereo <= max_distance_km * FOLGA_FIXA) & elegiveis).sum())
+
+    # 4. AGENDAMENTO (CAPACIDADE POR DIA, PRAZOS E PRIORIDADES)
+    progresso.iniciar(ETAPA_ALOCACAO, total_chamados)
+    tecnico_idx, dia_idx, carga = agendar_chamados(
+        dist_km, capacidades_tecnicos(df_tecnicos_validos, capacidade_diaria), n_dias=n_dias,
+        prazo_dia=prazos_em_dias(df_chamados, data_inicio, n_dias),
+        prioridade=prioridades(df_chamados)
+    )
 
-        # 4. APLICA LÓGICA DE CAPACIDADE E ALOCAÇÃO
-        melhor_tecnico = None
-        
-        for _, row_aptos in df_aptos.iterrows():
-            tecnico_nome = row_aptos['tecnico']
-            if capacidade_diaria == 0 or tecnicos_capacidade[tecnico_nome] < capacidade_diaria:
-                melhor_tecnico = row_aptos
-                tecnicos_capacidade[tecnico_nome] += 1
-                break  
-        
-        # 5. CONSOLIDA O RESULTADO DO CHAMADO
-        if melhor_tecnico is not None:
-            
-            resultado = row_chamado.to_dict()
-            resultado['Status'] = f'Atendimento Alocado (Raio: {max_distance_km} km)'
-            resultado['Técnico_Mais_Próximo'] = melhor_tecnico['tecnico']
-            resultado['Coordenador_Técnico'] = melhor_tecnico['coordenador']
-            resultado['UF_Técnico'] = melhor_tecnico['uf']
-            resultado['Distância_km'] = f"{melhor_tecnico['distancia_km']:.2f}"
-            resultado['Tempo_Estimado'] = melhor_tecnico['tempo_text']
-            resultado['Custo_Estimado_RS'] = f"R$ {melhor_tecnico['custo_rs']:.2f}"
-            
-        else:
-            resultado = row_chamado.to_dict()
-            
-            if not df_aptos.empty:
-                resultado['Status'] = f'Nenhum técnico disponível no raio (Todos no limite de {capacidade_diaria} chamados)'
-            else:
-                resultado['Status'] = f'Nenhum técnico no raio de {max_distance_km} km (Real)'
+    progresso.concluir(ETAPA_ALOCACAO, int((tecnico_idx >= 0).sum()))
 
-            resultado = preencher_resultado_vazio(resultado)
-            
-        df_resultados_finais.append(resultado)
-    
-    progress_bar.empty() # Remove a barra de progresso no final
-    
-    df_final = pd.DataFrame(df_resultados_finais)
-    
-    # Adicionar coluna de resumo de alocação
-    df_alocacao = pd.DataFrame(list(tecnicos_capacidade.items()), columns=['Técnico_Mais_Próximo', 'Chamados_Alocados_Tecnico'])
-    
-    # Preenche 'Técnico_Mais_Próximo' com os nomes para o merge
-    df_final['Técnico_Mais_Próximo'] = df_final['Técnico_Mais_Próximo'].replace('N/A', np.nan) 
-    
-    df_final = pd.merge(df_final, df_alocacao, on='Técnico_Mais_Próximo', how='left').fillna({'Chamados_Alocados_Tecnico': 0})
-    
-    # Ajusta o tipo da coluna
-    df_final['Chamados_Alocados_Tecnico'] = df_final['Chamados_Alocados_Tecnico'].astype(int)
+    # 5. CONSOLIDA O RESULTADO (COLUNAS TIPADAS, MONTADAS DE FORMA VETORIZADA)
+    status = classificar_status(tecnico_idx, endereco_vazio, falha_geocod, sem_elegiveis, n_candidatos_aereos, dist_km)
+    df_final = montar_resultado_lote(
+        df_chamados, df_tecnicos_validos, lat_chamados, lng_chamados,
+        tecnico_idx, dia_idx, carga, dist_km, tempo_s, status, CUSTO_POR_KM, data_inicio, estimado=estimado
+    )
+
+    # 6. SEQUENCIAMENTO DAS ROTAS (VÁRIAS PARADAS POR TÉCNICO/DIA)
+    progresso.iniciar(ETAPA_SEQUENCIAMENTO, 0)
+    # CUSTO_POR_KM já considera ida e volta; numa rota cada km é rodado uma única vez
+    df_rotas = sequenciar_rotas(df_final, df_tecnicos_validos, CUSTO_POR_KM / 2, usar_osrm=not por_municipio,
+                                ao_avancar=lambda k, total: progresso.atualizar(ETAPA_SEQUENCIAMENTO, k + 1, total))
+    progresso.concluir(ETAPA_SEQUENCIAMENTO)
+
+    progresso.fechar() # Remove a barra de progresso no final; a tabela de situação fica com os totais
     
-    total_encontrado = len(df_final[df_final['Status'].str.contains('Alocado')])
+    contagem_status = resumir_status(status)
+    chamados_com_erro = int(contagem_status[STATUS_ERRO].sum())
+    total_encontrado = int(contagem_status[STATUS_ALOCADO])
     
     resumo = {
         "Total de Chamados na Planilha": total_chamados,
         f"Chamados Alocados (Considerando Capacidade e Raio)": total_encontrado,
         "Chamados Não Alocados (Fora do Raio ou Sem Capacidade)": total_chamados - total_encontrado - chamados_com_erro,
         "Chamados com Erro (Endereço Inválido/Vazio/Geocod.)": chamados_com_erro,
-        "Chamados Processados na Rota OSRM (Otimizados)": chamados_otimizados
+        "Chamados com Rota OSRM (Otimizados)": int(com_rota_osrm.sum()),
+        "Chamados Só com Distância Estimada (sem OSRM)": int(so_estimados.sum()),
+        "Chamados Alocados com Distância Estimada": int(df_final['Rota_Estimada'].sum()),
+        "Pares Roteados (Pré-filtro Adaptativo)": int(n_candidatos_aereos.sum()),
+        f"Pares no Pré-filtro Fixo ({FOLGA_FIXA:g}x o raio)": pares_folga_fixa,
+        "Endereços Únicos Geocodificados": total_unicos,
+        "Custo Total Estimado (R$)": f"{df_final['Custo_Estimado_RS'].sum():.2f}",
+        "Custo Real em Rota (R$)": f"{df_rotas['Custo da Rota (R$)'].sum():.2f}"
     }
     
-    return df_final, resumo
+    return df_final, resumo, montar_plano_diario(df_final, data_inicio), df_rotas
 
 # --- LÓGICA DE LOGIN PRINCIPAL ---
 
@@ -445,17 +698,19 @@ def check_password_general(password_key, error_msg, key_input):
         return False
     return False
 
-def reset_df_editavel():
-    """Recarrega o dataframe de técnicos da planilha original."""
-    st.session_state.df_editavel = load_data(ARQUIVO_TECNICOS).copy()
+def recarregar_tecnicos():
+    """Recarrega a planilha original, publica a nova versão para todas as sessões e descarta o rascunho do editor."""
     st.cache_data.clear() # Limpa o cache para garantir que os dados de rotas sejam recarregados (se necessário)
+    obter_base_tecnicos().publicar(load_data(ARQUIVO_TECNICOS))
+    st.session_state.rascunho_tecnicos = None
 
 # --- INÍCIO DA EXECUÇÃO ---
 
 if "authenticated" not in st.session_state: st.session_state.authenticated = False
 if "editor_authenticated" not in st.session_state: st.session_state.editor_authenticated = False
 if "raio_selecionado" not in st.session_state: st.session_state.raio_selecionado = 30 
-if "df_editavel" not in st.session_state: st.session_state.df_editavel = pd.DataFrame() # Inicialização
+# Só a sessão do editor guarda uma cópia própria (rascunho) da tabela de técnicos
+if "rascunho_tecnicos" not in st.session_state: st.session_state.rascunho_tecnicos = None
 
 # BLOCO DE LOGIN GERAL
 if not st.session_state.authenticated:
@@ -464,18 +719,18 @@ if not st.session_state.authenticated:
     if check_password_general("senha", "Senha de acesso principal incorreta.", "global_auth_input"):
         st.session_state.authenticated = True
         st.rerun()
+    aquecer_recursos()
     st.stop()
 
 
 # 1. CARREGAR DADOS E REMOVER CHAVE DE API DO GOOGLE
-if st.session_state.df_editavel.empty:
-    df_tecnicos_temp = load_data(ARQUIVO_TECNICOS)
-    if df_tecnicos_temp.empty:
-        st.warning("O arquivo de técnicos está vazio ou não pode ser carregado. Por favor, faça o upload de uma planilha na aba 'Editor de Dados'.")
-        # Cria um DataFrame mínimo para não quebrar a aplicação.
-        st.session_state.df_editavel = pd.DataFrame(columns=['tecnico', 'endereco', 'cidade', 'uf', 'coordenador', 'email_coordenador', 'latitude', 'longitude'])
-    else:
-        st.session_state.df_editavel = df_tecnicos_temp.copy()
+# Visão somente leitura da tabela compartilhada (sem cópia por sessão ou por rerun);
+# a sessão do editor com alterações não salvas enxerga o próprio rascunho
+versao_tecnicos, df_tecnicos = obter_base_tecnicos().atual()
+if st.session_state.rascunho_tecnicos is not None:
+    df_tecnicos = st.session_state.rascunho_tecnicos
+if df_tecnicos.empty:
+    st.warning("O arquivo de técnicos está vazio ou não pode ser carregado. Por favor, faça o upload de uma planilha na aba 'Editor de Dados'.")
 
 API_KEY = None # Confirma a remoção do Google API Key
 
@@ -495,21 +750,16 @@ st.session_state.raio_selecionado = st.radio(
 )
 st.sidebar.markdown("---")
 
-# Inicialização e extração das opções de filtro
-if 'df_editavel' in st.session_state and not st.session_state.df_editavel.empty:
-    df_temp = st.session_state.df_editavel.copy()
-    ufs = ["Todos"] + sorted(df_temp['uf'].astype(str).unique().tolist())
-    cidades_todas = ["Todas"] + sorted(df_temp['cidade'].astype(str).unique().tolist())
-    coordenadores = ["Todos"] + sorted(df_temp['coordenador'].astype(str).unique().tolist())
-    
-    # Remove 'nan' se houver
-    ufs = [u for u in ufs if u != 'nan']
-    cidades_todas = [c for c in cidades_todas if c != 'nan']
-    coordenadores = [c for c in coordenadores if c != 'nan']
-else:
-    ufs = ["Todos"]
-    cidades_todas = ["Todas"]
-    coordenadores = ["Todos"]
+# Opções de filtro a partir dos índices da versão atual (montados uma vez e compartilhados);
+# o rascunho do editor tem os próprios índices
+facetas = None
+if st.session_state.rascunho_tecnicos is None:
+    facetas = obter_base_tecnicos().facetas(versao_tecnicos)
+if facetas is None:
+    facetas = construir_facetas(df_tecnicos)
+ufs = ["Todos"] + facetas['opcoes']['uf']
+cidades_todas = ["Todas"] + facetas['opcoes']['cidade']
+coordenadores = ["Todos"] + facetas['opcoes']['coordenador']
 
 # Inicialização dos estados para filtros
 if "uf_selecionada" not in st.session_state: st.session_state.uf_selecionada = "Todos"
@@ -524,9 +774,7 @@ with st.sidebar:
     st.session_state.uf_selecionada = st.selectbox("Filtrar por UF:", ufs, index=ufs.index(st.session_state.uf_selecionada) if st.session_state.uf_selecionada in ufs else 0)
     
     if st.session_state.uf_selecionada and st.session_state.uf_selecionada != "Todos":
-        df_uf_filtrado = df_temp[df_temp['uf'].astype(str) == st.session_state.uf_selecionada]
-        cidades_filtradas = ["Todas"] + sorted(df_uf_filtrado['cidade'].astype(str).unique().tolist())
-        cidades_filtradas = [c for c in cidades_filtradas if c != 'nan']
+        cidades_filtradas = ["Todas"] + facetas['cidades_por_uf'].get(st.session_state.uf_selecionada, [])
         
         try:
             current_index = cidades_filtradas.index(st.session_state.cidade_selecionada)
@@ -553,23 +801,25 @@ with st.sidebar:
 # --------------------------------------------------------------------------
 
 
-# --- Aplicar os filtros aos dados editáveis ---
-df_filtrado = st.session_state.df_editavel.copy()
-if st.session_state.uf_selecionada and st.session_state.uf_selecionada != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['uf'].astype(str) == st.session_state.uf_selecionada]
-if st.session_state.cidade_selecionada and st.session_state.cidade_selecionada != "Todas":
-    df_filtrado = df_filtrado[df_filtrado['cidade'].astype(str) == st.session_state.cidade_selecionada]
-if st.session_state.coordenador_selecionado and st.session_state.coordenador_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['coordenador'].astype(str) == st.session_state.coordenador_selecionado]
+# --- Aplicar os filtros aos dados editáveis (consulta aos índices, sem varrer a tabela) ---
+df_filtrado = filtrar_por_facetas(
+    df_tecnicos, facetas,
+    uf=st.session_state.uf_selecionada if st.session_state.uf_selecionada not in (None, "Todos") else None,
+    cidade=st.session_state.cidade_selecionada if st.session_state.cidade_selecionada not in (None, "Todas") else None,
+    coordenador=st.session_state.coordenador_selecionado if st.session_state.coordenador_selecionado not in (None, "Todos") else None,
+)
 
 
 # --- Sistema de abas ---
-tab1, tab2, tab3, tab4 = st.tabs(["Busca Individual", "Análise de Dados", "Editor de Dados", "Análise de Chamados (Lote)"])
+# Navegação por rádio em vez de st.tabs: o Streamlit executa o corpo de todas as abas
+# a cada rerun, enquanto aqui só a aba ativa é montada
+ABAS = ["Busca Individual", "Análise de Dados", "Editor de Dados", "Análise de Chamados (Lote)", "Conciliação de Faturamento"]
+aba_ativa = st.radio("Aba:", ABAS, horizontal=True, key='aba_ativa', label_visibility="collapsed")
 
 # =========================================================================
 # TAB 1: BUSCA INDIVIDUAL
 # =========================================================================
-with tab1:
+if aba_ativa == ABAS[0]:
     st.title("Localizador de Técnicos")
     
     # --- LISTA DE TÉCNICOS FILTRADOS ---
@@ -580,14 +830,13 @@ with tab1:
         if modo_exibicao == "Tabela":
             st.dataframe(df_filtrado[cols_display], use_container_width=True)
         else:
-            # Garante que o DataFrame filtrado não esteja vazio antes de iterar
+            # Garante que o DataFrame filtrado não esteja vazio antes de exibir
             if not df_filtrado.empty:
-                cols = st.columns(2)
-                for i, row in df_filtrado.iterrows():
-                    with cols[i % 2]:
-                        st.markdown(f"**{row['tecnico']}** - {row['cidade']}/{row['uf']}")
-                        st.write(f"Coordenador: **{row.get('coordenador', 'Não informado')}**")
-                        st.markdown("---")
+                teams, email = links_coordenador(df_filtrado)
+                st.dataframe(
+                    df_filtrado[cols_display].assign(teams=teams, email=email), use_container_width=True, hide_index=True,
+                    column_config={**CONFIG_TECNICOS, **CONFIG_LINKS_COORDENADOR}
+                )
             else:
                  st.info("Nenhum técnico encontrado com os filtros selecionados.")
     else:
@@ -596,9 +845,20 @@ with tab1:
     st.markdown("---")
     st.header("Busca por Distância (Logística)")
 
+    # Com as isócronas pré-calculadas, a busca pode ser por tempo de carro, sem rotas por chamado
+    isocronas = obter_isocronas()
+    limite_isocrona = None
+    if isocronas is not None:
+        criterio = st.radio("Critério da busca:", ["Distância de carro (raio)", "Tempo de carro (isócronas)"],
+                            horizontal=True, key='criterio_busca')
+        if criterio == "Tempo de carro (isócronas)":
+            limite_isocrona = st.radio("Tempo máximo:", isocronas['limites'], format_func=lambda x: f"{x} min",
+                                       horizontal=True, key='limite_isocrona')
+    limite_busca = f"{limite_isocrona} min" if limite_isocrona else f"{st.session_state.raio_selecionado} km"
+
     # AVISO DE FILTRO E RESTRIÇÃO DE KM
     if not df_filtrado.empty:
-        st.info(f"A busca será restrita aos **{len(df_filtrado)}** técnicos selecionados e **apenas técnicos a até {st.session_state.raio_selecionado} km** (de carro) serão listados.")
+        st.info(f"A busca será restrita aos **{len(df_filtrado)}** técnicos selecionados e **apenas técnicos a até {limite_busca}** (de carro) serão listados.")
     else:
         st.warning("Não há técnicos nos filtros selecionados para realizar a busca por distância.")
 
@@ -607,119 +867,195 @@ with tab1:
     
     if st.button("Buscar Técnico Mais Próximo", key='btn_busca_individual'):
         if endereco_cliente:
-            with st.spinner(f"Buscando técnicos a até {st.session_state.raio_selecionado} km..."):
+            with st.spinner(f"Buscando técnicos a até {limite_busca}..."):
                 
                 # CHAMADA DA FUNÇÃO SEM API_KEY
-                tecnicos_proximos, localizacao_cliente = encontrar_tecnico_proximo(
-                    endereco_cliente, 
-                    df_filtrado, 
-                    st.session_state.raio_selecionado # Raio dinâmico
-                )
-                
-                if tecnicos_proximos is not None and not tecnicos_proximos.empty:
-                    st.success(f"Busca concluída! Encontrados {len(tecnicos_proximos)} técnicos a até {st.session_state.raio_selecionado} km de distância.")
-                    
-                    st.subheader(f"🛠️ Técnicos Encontrados (Até {st.session_state.raio_selecionado} km)")
-                    
-                    st.markdown(f"**Custo Estimado:** R$ {CUSTO_POR_KM:.2f} por KM (Considerando ida e volta)")
-                    
-                    # Preparação para exportação
-                    df_to_export = tecnicos_proximos[[
-                        'tecnico', 'coordenador', 'cidade', 'uf', 
-                        'distancia_km', 'tempo_text', 'custo_rs', 
-                        'email_coordenador'
-                    ]].copy()
-                    df_to_export['distancia_km'] = df_to_export['distancia_km'].round(2)
-                    df_to_export['custo_rs'] = df_to_export['custo_rs'].round(2)
-                    
-                    df_to_export.rename(columns={
-                        'tecnico': 'Técnico',
-                        'coordenador': 'Coordenador',
-                        'distancia_km': 'Distância (km)',
-                        'tempo_text': 'Tempo Estimado',
-                        'custo_rs': f'Custo Estimado (R$ {CUSTO_POR_KM:.2f}/km - Ida e Volta)',
-                    }, inplace=True)
-                    
-                    # Botão de download
-                    towrite = io.BytesIO()
-                    df_to_export.to_excel(towrite, index=False, header=True)
-                    towrite.seek(0)
-                    st.download_button(
-                        label="Exportar Resultados para Excel",
-                        data=towrite,
-                        file_name=f'tecnicos_proximos_custo_{st.session_state.raio_selecionado}km.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                if limite_isocrona:
+                    tecnicos_proximos, localizacao_cliente = encontrar_tecnicos_por_isocrona(endereco_cliente, df_filtrado, limite_isocrona)
+                else:
+                    tecnicos_proximos, localizacao_cliente = encontrar_tecnico_proximo(
+                        endereco_cliente, 
+                        df_filtrado, 
+                        st.session_state.raio_selecionado # Raio dinâmico
                     )
+            # O resultado fica na sessão para sobreviver aos reruns (ex.: gerar o arquivo de exportação)
+            st.session_state.busca_individual = {
+                'id': datetime.now().isoformat(),
+                'tecnicos': tecnicos_proximos,
+                'localizacao': localizacao_cliente,
+                'limite_busca': limite_busca,
+                'limite_isocrona': limite_isocrona,
+            }
+        else:
+            st.session_state.busca_individual = None
+            st.warning("Por favor, digite um endereço para iniciar a busca.")
 
-                    st.markdown("---")
-                    
-                    # Lista formatada em colunas
-                    cols_tecnicos = st.columns(2)
-                    
-                    for i, row in tecnicos_proximos.reset_index(drop=True).iterrows():
-                        with cols_tecnicos[i % 2]:
-                            st.markdown(f"**{row['tecnico']}** - {row['cidade']}/{row['uf']}")
-                            st.markdown(f"**Distância: {row['distancia_km']:.2f} km**") 
-                            st.markdown(f"Coordenador: **{row['coordenador']}**") 
-                            st.write(f"Tempo Estimado: {row['tempo_text']}")
-                            st.write(f"Custo Estimado: R$ {row['custo_rs']:.2f}")
-                            
-                            email_coordenador = row.get('email_coordenador')
-                            if email_coordenador:
-                                st.markdown(
-                                    f"""
-                                    <div class="button-group">
-                                        <a href="https://teams.microsoft.com/l/chat/0/0?users={email_coordenador}" target="_blank" style="background-color: #28a745;">📞 Falar com Coordenador</a>
-                                        <a href="mailto:{email_coordenador}" target="_blank" style="background-color: #007bff;">✉️ Enviar E-mail</a>
-                                    </div>
-                                    """, 
-                                    unsafe_allow_html=True
-                                )
-                            st.markdown("---")
+    busca = st.session_state.get('busca_individual')
+    if busca is not None:
+        tecnicos_proximos, localizacao_cliente = busca['tecnicos'], busca['localizacao']
+        limite_busca, limite_isocrona = busca['limite_busca'], busca['limite_isocrona']
+        if tecnicos_proximos is not None and not tecnicos_proximos.empty:
+            st.success(f"Busca concluída! Encontrados {len(tecnicos_proximos)} técnicos a até {limite_busca} de distância.")
+            
+            st.subheader(f"🛠️ Técnicos Encontrados (Até {limite_busca})")
+
+            if limite_isocrona:
+                st.caption("Distância e tempo estimados pelo modelo de desvio (sem rota por chamado).")
+            st.pydeck_chart(mapa_busca(
+                localizacao_cliente, tecnicos_proximos, df_filtrado,
+                geojson_isocronas(isocronas, tecnicos_proximos, limite_isocrona) if limite_isocrona else None,
+            ))
+            
+            st.markdown(f"**Custo Estimado:** R$ {CUSTO_POR_KM:.2f} por KM (Considerando ida e volta)")
+            
+            # Exportação gerada somente quando solicitada
+            download_sob_demanda(
+                busca['id'], lambda: exportar_excel(tabela_exportacao_busca(tecnicos_proximos)),
+                "Exportar Resultados para Excel", f"tecnicos_proximos_custo_{limite_busca.replace(' ', '')}.xlsx",
+                FORMATOS_EXPORTACAO["Excel (.xlsx)"][1], key='arquivo_busca'
+            )
 
+            st.markdown("---")
+            
+            # Lista em uma única tabela (virtualizada: só as linhas visíveis são desenhadas),
+            # com os contatos do coordenador como links
+            teams, email = links_coordenador(tecnicos_proximos)
+            st.dataframe(
+                tecnicos_proximos[['tecnico', 'cidade', 'uf', 'coordenador', 'distancia_km', 'tempo_text', 'custo_rs']].assign(teams=teams, email=email),
+                use_container_width=True, hide_index=True,
+                column_config={
+                    **CONFIG_TECNICOS,
+                    'distancia_km': st.column_config.NumberColumn("Distância (km)", format="%.2f"),
+                    'tempo_text': "Tempo Estimado",
+                    'custo_rs': st.column_config.NumberColumn("Custo Estimado", format="R$ %.2f"),
+                    **CONFIG_LINKS_COORDENADOR,
+                }
+            )
 
-                else:
-                    st.info(f"Nenhum técnico encontrado no universo filtrado que esteja a até {st.session_state.raio_selecionado} km de distância do endereço.")
         else:
-            st.warning("Por favor, digite um endereço para iniciar a busca.")
+            st.info(f"Nenhum técnico encontrado no universo filtrado que esteja a até {limite_busca} de distância do endereço.")
 
 
 # =========================================================================
 # TAB 2: ANÁLISE DE DADOS (COMPLETA)
 # =========================================================================
-with tab2:
+if aba_ativa == ABAS[1]:
     st.header("📊 Análise de Dados dos Técnicos")
     
-    df_analise = st.session_state.df_editavel.copy()
-    
     col1, col2, col3 = st.columns(3)
     
-    if not df_analise.empty:
-        with col1:
-            st.metric("Total de Técnicos", len(df_analise))
-        with col2:
-            st.metric("Total de Coordenadores", df_analise['coordenador'].nunique())
-        with col3:
-            st.metric("Total de UFs Cobertas", df_analise['uf'].nunique())
+    if not df_tecnicos.empty:
+        # Agregados e gráficos em cache por versão da tabela (o rascunho do editor é calculado na hora)
+        versao_hist = versao_historico()
+        versao_desvio = versao_modelo(obter_modelo_desvio())
+        if st.session_state.rascunho_tecnicos is None:
+            analise = obter_analise_tecnicos(versao_tecnicos, versao_hist, versao_desvio, versao_matriz(), df_tecnicos)
+        else:
+            analise = montar_analise_tecnicos(df_tecnicos, carregar_municipios(), obter_modelo_desvio(), RAIOS,
+                                              obter_matriz_municipios(), carregar_historico(), carregar_geojson_ufs())
+
+        for coluna, (rotulo, valor) in zip((col1, col2, col3), analise['metricas'].items()):
+            with coluna:
+                st.metric(rotulo, valor)
         
         st.markdown("---")
         
         # Gráfico 1: Distribuição de Técnicos por UF
         st.subheader("Distribuição de Técnicos por UF")
-        df_uf = df_analise.groupby('uf')['tecnico'].count().reset_index(name='Total de Técnicos')
-        fig_uf = px.bar(df_uf.sort_values('Total de Técnicos', ascending=False).head(10), 
-                        x='uf', y='Total de Técnicos', title='Top 10 UFs por Número de Técnicos',
-                        color='uf', template='plotly_white')
-        st.plotly_chart(fig_uf, use_container_width=True)
+        st.plotly_chart(analise['fig_uf'], use_container_width=True)
         
         # Gráfico 2: Distribuição por Coordenador
         st.subheader("Distribuição por Coordenador")
-        df_coord = df_analise.groupby('coordenador')['tecnico'].count().reset_index(name='Total de Técnicos')
-        df_coord = df_coord[df_coord['Total de Técnicos'] > 0] # Remove coordenadores sem técnicos
-        fig_coord = px.pie(df_coord, values='Total de Técnicos', names='coordenador', 
-                           title='Distribuição de Técnicos por Coordenador', hole=0.3)
-        st.plotly_chart(fig_coord, use_container_width=True)
-        
+        st.plotly_chart(analise['fig_coord'], use_container_width=True)
+
+        # Cobertura: densidade por área e municípios sem técnico próximo
+        st.markdown("---")
+        st.subheader("Cobertura")
+        col_c = st.columns(1 + len(RAIOS))
+        col_c[0].metric("Técnicos por 100 mil km²", f"{analise['tecnicos_por_100mil_km2']:.2f}")
+        if analise['descobertos'] is not None:
+            for coluna, (raio, descobertos) in zip(col_c[1:], analise['descobertos'].items()):
+                coluna.metric(f"Municípios sem Técnico a {raio} km", descobertos,
+                              help=f"De {analise['total_municipios']} municípios; distância de carro estimada a partir da distância aérea")
+        else:
+            st.caption("Municípios descobertos: cadastro de municípios ausente (rode `python municipios.py`).")
+        st.dataframe(analise['densidade_uf'], use_container_width=True, hide_index=True, column_config={
+            'uf': 'UF',
+            'area_km2': st.column_config.NumberColumn('Área (km²)', format="%d"),
+            'tecnicos': 'Técnicos',
+            'tecnicos_por_100mil_km2': st.column_config.NumberColumn('Técnicos por 100 mil km²', format="%.2f"),
+        })
+
+        # Onde contratar: municípios sem técnico no raio, pelo volume de chamados já atendidos
+        if analise['cobertura'] is not None:
+            st.subheader("Lacunas de Cobertura")
+            raio_cobertura = st.radio("Raio da cobertura:", RAIOS, index=RAIOS.index(st.session_state.raio_selecionado),
+                                      format_func=lambda x: f"{x} km", horizontal=True, key='raio_cobertura')
+            st.plotly_chart(analise['fig_cobertura'][raio_cobertura], use_container_width=True)
+            st.dataframe(
+                municipios_descobertos(analise['cobertura'], raio_cobertura)[['nome', 'uf', 'chamados', 'distancia_km', 'fonte', 'tecnico']],
+                use_container_width=True, hide_index=True,
+                column_config={
+                    'nome': 'Município', 'uf': 'UF', 'chamados': 'Chamados (Histórico)',
+                    'distancia_km': st.column_config.NumberColumn('Técnico Mais Próximo (km)', format="%.1f"),
+                    'fonte': 'Distância', 'tecnico': 'Técnico Mais Próximo',
+                }
+            )
+
+            # Simulação: onde colocar os próximos técnicos, pelo histórico de chamados
+            st.subheader("Simulação de Contratação")
+            if not analise['cobertura']['chamados'].any():
+                st.info("Sem histórico de chamados: processe um lote ou uma planilha de faturamento para simular contratações.")
+            else:
+                with st.form("form_contratacao"):
+                    col_k, col_obj = st.columns(2)
+                    k_contratacoes = col_k.number_input("Técnicos a contratar:", min_value=1, max_value=50, value=5, step=1)
+                    objetivo = col_obj.radio("Objetivo:", list(ROTULOS_OBJETIVO), format_func=ROTULOS_OBJETIVO.get, horizontal=True,
+                                              key='objetivo_contratacao')
+                    simular = st.form_submit_button(f"Simular (raio de {raio_cobertura} km)")
+                if simular:
+                    st.session_state.simulacao_contratacao = simular_contratacoes(
+                        analise['cobertura'], int(k_contratacoes), raio_cobertura, objetivo, CUSTO_POR_KM, obter_modelo_desvio()
+                    )
+                simulacao = st.session_state.get('simulacao_contratacao')
+                if simulacao is not None:
+                    if simulacao.empty:
+                        st.info("Nenhuma contratação melhora a cobertura dos chamados do histórico.")
+                    else:
+                        st.caption(f"Cobertura atual dos chamados do histórico: {simulacao.attrs['cobertura_inicial_pct']:.1f}%. "
+                                   "Distâncias dos candidatos estimadas (aérea × fator de desvio da UF).")
+                        st.dataframe(simulacao, use_container_width=True, hide_index=True, column_config={
+                            'Km Economizados (Marginal)': st.column_config.NumberColumn(format="%.0f"),
+                            'Custo Economizado (R$)': st.column_config.NumberColumn(format="R$ %.2f"),
+                            'Cobertura Acumulada (%)': st.column_config.NumberColumn(format="%.1f%%"),
+                        })
+
+        # Mapa agregado no servidor: só as células (contagens) vão para o navegador
+        st.markdown("---")
+        st.subheader("Mapa de Chamados x Cobertura")
+        meses = obter_meses_historico(versao_hist)
+        if not meses:
+            st.info("Sem histórico de chamados: processe um lote ou uma planilha de faturamento para ver o mapa.")
+        else:
+            col_mes, col_nivel, col_modo = st.columns(3)
+            mes = col_mes.selectbox("Período:", ["Todos"] + meses, key='mes_grade')
+            nivel = col_nivel.selectbox("Nível de detalhe:", NIVEIS_ZOOM, index=1, format_func=descrever_nivel, key='nivel_grade')
+            modo_grade = col_modo.radio("Camada:", list(ROTULOS_MODO_GRADE), format_func=ROTULOS_MODO_GRADE.get,
+                                        horizontal=True, key='modo_grade')
+            mes = None if mes == "Todos" else mes
+            if st.session_state.rascunho_tecnicos is None:
+                grades = obter_grade_chamados(versao_tecnicos, versao_hist, versao_desvio, mes, st.session_state.raio_selecionado, df_tecnicos)
+            else:
+                grades = montar_grade_chamados(df_tecnicos, mes, st.session_state.raio_selecionado)
+            grade = grades[nivel]
+            st.pydeck_chart(mapa_grade(grade, nivel, tamanho_celula(nivel), modo_grade))
+            st.caption(
+                f"{int(grade['chamados'].sum())} chamados em {int((grade['chamados'] > 0).sum())} células. "
+                f"Cobertura: técnico a até {st.session_state.raio_selecionado} km (raio da barra lateral, distância estimada). "
+                "Azul: células só com técnicos."
+                + (f" Exibindo as {MAX_CELULAS_MAPA} células com mais chamados de {len(grade)}." if len(grade) > MAX_CELULAS_MAPA else "")
+            )
+
     else:
         st.warning("Nenhum dado de técnico para análise. Por favor, carregue ou insira dados na aba 'Editor de Dados'.")
 
@@ -727,7 +1063,7 @@ with tab2:
 # =========================================================================
 # TAB 3: EDITOR DE DADOS (COMPLETA)
 # =========================================================================
-with tab3:
+if aba_ativa == ABAS[2]:
     st.header("📝 Editor de Dados (Técnicos)")
     
     # --- AUTENTICAÇÃO DO EDITOR ---
@@ -748,7 +1084,7 @@ with tab3:
     if uploaded_file is not None:
         try:
             df_uploaded = pd.read_excel(uploaded_file)
-            st.session_state.df_editavel = df_uploaded.copy()
+            st.session_state.rascunho_tecnicos = df_uploaded
             st.success("Nova planilha carregada com sucesso! Clique em 'Salvar Alterações' para persistir.")
             st.experimental_rerun()
         except Exception as e:
@@ -759,10 +1095,12 @@ with tab3:
     # 2. Editor Interativo
     st.subheader("Tabela Interativa de Técnicos")
     
-    # Display columns: As 6 colunas essenciais
-    df_display = st.session_state.df_editavel[[
-        'tecnico', 'endereco', 'cidade', 'uf', 'coordenador', 'email_coordenador', 'latitude', 'longitude'
-    ]].copy()
+    # Display columns: As colunas essenciais primeiro e depois as demais da planilha
+    # (cep, numero, elegibilidade...), para que nenhuma coluna se perca ao salvar
+    cols_editor = ['tecnico', 'endereco', 'numero', 'cep', 'cidade', 'uf', 'coordenador', 'email_coordenador', 'latitude', 'longitude']
+    cols_editor = [c for c in cols_editor if c in df_tecnicos.columns]
+    cols_editor += [c for c in df_tecnicos.columns if c not in cols_editor]
+    df_display = df_tecnicos[cols_editor]
     
     edited_df = st.data_editor(
         df_display, 
@@ -773,12 +1111,19 @@ with tab3:
         column_config={
             "tecnico": st.column_config.TextColumn("Técnico", required=True),
             "endereco": st.column_config.TextColumn("Endereço Base", required=True),
+            "numero": st.column_config.TextColumn("Número", width="small"),
+            "cep": st.column_config.TextColumn("CEP", width="small"),
             "cidade": st.column_config.TextColumn("Cidade", required=True),
             "uf": st.column_config.TextColumn("UF", required=True, width="small"),
             "coordenador": st.column_config.TextColumn("Coordenador"),
             "email_coordenador": st.column_config.TextColumn("E-mail Coordenador"),
             "latitude": st.column_config.NumberColumn("Latitude", format="%.6f"),
             "longitude": st.column_config.NumberColumn("Longitude", format="%.6f"),
+            "capacidade_diaria": st.column_config.NumberColumn("Capacidade Diária", min_value=0, step=1, help="Vazio = capacidade global da análise em lote"),
+            "habilidades": st.column_config.TextColumn("Habilidades", help="Tags separadas por vírgula (ex.: fibra, cftv)"),
+            "ativo": st.column_config.CheckboxColumn("Ativo", help="Desmarque para técnicos em férias ou afastados"),
+            "precisao_geocod": st.column_config.TextColumn("Precisão Geocod.", disabled=True),
+            "qualidade_coord": st.column_config.TextColumn("Qualidade Coord.", disabled=True, help="Recalculada ao carregar a planilha"),
         }
     )
     
@@ -787,21 +1132,20 @@ with tab3:
     
     with col_save:
         if st.button("💾 Salvar Alterações", type="primary"):
-            st.session_state.df_editavel = edited_df
-            if save_data(st.session_state.df_editavel, ARQUIVO_TECNICOS):
+            if save_data(edited_df, ARQUIVO_TECNICOS):
                 # Limpa o cache para recarregar filtros na sidebar e dados
-                reset_df_editavel()
+                recarregar_tecnicos()
                 st.rerun()
 
     with col_reload:
         if st.button("🔄 Descartar/Recarregar Planilha Original"):
-            reset_df_editavel()
+            recarregar_tecnicos()
             st.success("Dados recarregados da planilha original.")
             st.rerun()
             
     with col_geocode:
         if st.button("📍 Tentar Geocodificar Endereços Faltantes"):
-            df_geocod = st.session_state.df_editavel.copy()
+            df_geocod = df_tecnicos.copy()
             
             # Filtra linhas sem lat/lng ou com endereço preenchido
             mask_to_geocode = (df_geocod['endereco'].astype(str).str.strip() != '') & (df_geocod['latitude'].isnull() | df_geocod['longitude'].isnull())
@@ -810,35 +1154,61 @@ with tab3:
                 count_to_geocode = mask_to_geocode.sum()
                 st.info(f"Geocodificando {count_to_geocode} endereços faltantes...")
                 
-                progress_bar = st.progress(0, text="Geocodificando 0% dos endereços...")
+                progresso = Progresso([BarraStreamlit(st.progress(0, text="Geocodificando 0% dos endereços..."))],
+                                      etapas=[ETAPA_GEOCODIFICACAO])
                 
-                newly_geocoded = 0
-                for i, index in enumerate(df_geocod[mask_to_geocode].index):
-                    endereco = df_geocod.loc[index, 'endereco']
-                    lat, lng = geocodificar_endereco(endereco)
-                    
-                    if lat is not None:
-                        df_geocod.loc[index, 'latitude'] = lat
-                        df_geocod.loc[index, 'longitude'] = lng
-                        newly_geocoded += 1
-                        
-                    progress_bar.progress((i + 1) / count_to_geocode, text=f"Geocodificando... Encontrados {newly_geocoded} de {count_to_geocode} com sucesso.")
+                # Busca estruturada (endereco/numero/cidade/uf/cep), com uma consulta por CEP + número
+                df_coords = geocodificar_tecnicos(
+                    df_geocod[mask_to_geocode],
+                    ao_avancar=lambda i, total, encontrados: progresso.atualizar(ETAPA_GEOCODIFICACAO, i + 1, total)
+                )
+                df_coords = df_coords.dropna(subset=['latitude', 'longitude'])
+                df_geocod.loc[df_coords.index, ['latitude', 'longitude']] = df_coords[['latitude', 'longitude']]
+                df_geocod.loc[df_coords.index, 'precisao_geocod'] = df_coords['precisao_geocod']
+                newly_geocoded = len(df_coords)
                 
-                progress_bar.empty()
-                st.session_state.df_editavel = df_geocod
+                progresso.fechar()
                 
-                if save_data(st.session_state.df_editavel, ARQUIVO_TECNICOS):
-                    reset_df_editavel()
+                if save_data(df_geocod, ARQUIVO_TECNICOS):
+                    recarregar_tecnicos()
                     st.success(f"Geocodificação concluída! {newly_geocoded} novos endereços geocodificados e salvos.")
                     st.rerun()
             else:
                 st.info("Todos os técnicos com endereço preenchido já possuem Latitude/Longitude, ou não há endereços válidos para processar.")
 
+    # 4. Qualidade das Coordenadas
+    if 'qualidade_coord' in df_tecnicos.columns:
+        st.markdown("---")
+        st.subheader("Qualidade das Coordenadas")
+        df_qualidade = df_tecnicos
+        suspeitas = df_qualidade['qualidade_coord'].astype(str) != QUALIDADE_OK
+        pendentes, prontas, sem_resultado = obter_fila_regeocodificacao().situacao()
+
+        col_q1, col_q2, col_q3, col_q4 = st.columns(4)
+        col_q1.metric("Coordenadas Suspeitas", int(suspeitas.sum()))
+        col_q2.metric("Na Fila de Geocodificação", pendentes)
+        col_q3.metric("Correções Prontas", prontas)
+        col_q4.metric("Sem Resultado", sem_resultado)
+
+        if suspeitas.any():
+            colunas_qualidade = [c for c in ['tecnico', 'cidade', 'uf', 'latitude', 'longitude', 'qualidade_coord'] if c in df_qualidade.columns]
+            st.dataframe(df_qualidade.loc[suspeitas, colunas_qualidade], use_container_width=True)
+
+        if prontas and st.button(f"✅ Aplicar {prontas} Coordenadas Corrigidas"):
+            # Casadas pela chave do técnico (não pelo índice da linha, que muda a cada salvamento)
+            df_corrigidas = casar_correcoes(df_qualidade, obter_fila_regeocodificacao().coletar())
+            df_qualidade = df_qualidade.copy()
+            df_qualidade.loc[df_corrigidas.index, ['latitude', 'longitude']] = df_corrigidas[['latitude', 'longitude']]
+            df_qualidade.loc[df_corrigidas.index, 'precisao_geocod'] = df_corrigidas['precisao_geocod']
+            if save_data(df_qualidade, ARQUIVO_TECNICOS):
+                recarregar_tecnicos()
+                st.rerun()
+
 
 # =========================================================================
 # TAB 4: ANÁLISE DE CHAMADOS (LOTE) (COMPLETA)
 # =========================================================================
-with tab4:
+if aba_ativa == ABAS[3]:
     st.header("📋 Análise de Chamados (Lote)")
     
     st.markdown("Esta funcionalidade permite que você faça o upload de uma planilha com múltiplos endereços de chamados e descubra, para cada um, qual o **técnico mais próximo** (de carro) que está **dentro do raio** e **abaixo do limite de capacidade diária**.")
@@ -846,7 +1216,7 @@ with tab4:
     st.markdown("---")
     
     # 1. Parâmetros do Lote
-    col_cap, col_file = st.columns(2)
+    col_cap, col_dias, col_file = st.columns(3)
     
     with col_cap:
         capacidade_diaria = st.number_input(
@@ -854,11 +1224,33 @@ with tab4:
             min_value=0, 
             value=1, 
             step=1,
-            help="Se for 1, um técnico só poderá ser alocado para o primeiro chamado mais próximo que ele atender."
+            help="Se for 1, um técnico só poderá ser alocado para o primeiro chamado mais próximo que ele atender. Técnicos com a coluna 'capacidade_diaria' preenchida usam o próprio valor."
         )
     
+    with col_dias:
+        n_dias = st.number_input(
+            "Número de Dias do Planejamento",
+            min_value=1,
+            value=1,
+            step=1,
+            help="Os chamados que excederem a capacidade de um dia são distribuídos nos dias seguintes. Colunas opcionais na planilha: 'prazo' (data limite) ou 'prazo_dias', e 'prioridade' (maior = mais urgente)."
+        )
+        data_inicio = st.date_input("Data de Início", value=datetime.now().date(), format="DD/MM/YYYY")
+
     with col_file:
         uploaded_lote_file = st.file_uploader("Upload da Planilha de Chamados (.xlsx)", type=["xlsx"])
+        
+        matriz_municipios = obter_matriz_municipios()
+        por_municipio = st.checkbox(
+            "Precisão de município (matriz pré-calculada, sem chamadas de API)",
+            value=False, disabled=matriz_municipios is None,
+            help="Usa o centroide do município de cada chamado (colunas 'cidade' e 'uf') e as distâncias da matriz técnico x município gerada por `python matriz_municipios.py`."
+        )
+        if por_municipio:
+            fora_da_matriz = tecnicos_fora_da_matriz(matriz_municipios, df_tecnicos[coordenadas_confiaveis(df_tecnicos)])
+            st.caption(f"Matriz atualizada em {matriz_municipios['atualizado_em']}.")
+            if fora_da_matriz:
+                st.warning(f"{fora_da_matriz} técnico(s) novos ou com endereço alterado ainda não estão na matriz. Rode `python matriz_municipios.py` para atualizá-la.")
 
     # 2. Processamento
     if uploaded_lote_file is not None:
@@ -872,44 +1264,275 @@ with tab4:
                 st.markdown("---")
                 if st.button(f"✨ Iniciar Processamento de {len(df_chamados)} Chamados", type="primary"):
                     
-                    if st.session_state.df_editavel.empty:
+                    if df_tecnicos.empty:
                         st.error("Não há dados de técnicos carregados para realizar o processamento.")
                         st.stop()
                         
                     # Lógica de processamento em lote
-                    df_resultados_final, resumo = processar_chamados_em_lote(
+                    df_resultados_final, resumo, df_plano, df_rotas = processar_chamados_em_lote(
                         df_chamados, 
-                        st.session_state.df_editavel, 
+                        df_tecnicos, 
                         st.session_state.raio_selecionado, 
-                        capacidade_diaria
+                        capacidade_diaria,
+                        n_dias,
+                        data_inicio,
+                        por_municipio
                     )
+
+                    # Localização dos chamados vai para o histórico (volume por município na análise de cobertura)
+                    if df_resultados_final is not None:
+                        registrar_chamados(
+                            ORIGEM_LOTE, ids_do_lote(df_chamados, uploaded_lote_file.getvalue()), data_inicio,
+                            df_resultados_final['Latitude_Chamado'], df_resultados_final['Longitude_Chamado']
+                        )
                     
+                    # Guarda o resultado na sessão para sobreviver aos reruns (ex.: geração do arquivo)
+                    st.session_state.lote = {
+                        'id': datetime.now().strftime("%Y%m%d_%H%M%S"),
+                        'arquivo': uploaded_lote_file.name,
+                        'df': df_resultados_final,
+                        'resumo': resumo,
+                        'plano': df_plano,
+                        'rotas': df_rotas,
+                        # Tabela em que 'Indice_Tecnico' foi calculado (para o mapa)
+                        'tecnicos': df_tecnicos[coordenadas_confiaveis(df_tecnicos)].reset_index(drop=True),
+                        'rotulos': rotulos_status(st.session_state.raio_selecionado, raio_aereo_maximo(st.session_state.raio_selecionado), n_dias),
+                    }
                     st.success("✅ Processamento de Lote Concluído!")
+                
+                lote = st.session_state.get('lote')
+                if lote is not None and lote['arquivo'] == uploaded_lote_file.name:
                     
                     # --- RESUMO DOS RESULTADOS ---
                     st.subheader("Resumo da Alocação")
                     
-                    col_resumo = st.columns(5)
-                    for idx, (key, value) in enumerate(resumo.items()):
-                        with col_resumo[idx % 5]:
+                    col_resumo = st.columns(3)
+                    for idx, (key, value) in enumerate(lote['resumo'].items()):
+                        with col_resumo[idx % 3]:
                             st.metric(key, value)
                             
                     st.markdown("---")
+
+                    # --- MAPA (WebGL: milhares de chamados e técnicos com as alocações) ---
+                    if lote['df'] is not None:
+                        st.subheader("Mapa da Alocação")
+                        st.pydeck_chart(mapa_lote(lote['df'], lote['tecnicos']))
+                        st.caption("Azul: chamados alocados (com arco até o técnico). Vermelho: não alocados. Cinza: técnicos.")
+                        st.markdown("---")
+                    
+                    # --- PLANO DIA A DIA ---
+                    st.subheader("Plano Diário por Técnico")
+                    if not lote['plano'].empty:
+                        st.dataframe(lote['plano'], use_container_width=True, hide_index=True)
+                    else:
+                        st.info("Nenhum chamado foi alocado no período.")
+                    
+                    st.markdown("---")
+                    
+                    # --- ROTAS SEQUENCIADAS ---
+                    st.subheader("Rotas Sequenciadas (Custo Real por Técnico e por Dia)")
+                    if not lote['rotas'].empty:
+                        st.dataframe(resumir_rotas_por_dia(lote['rotas']), use_container_width=True, hide_index=True)
+                        st.dataframe(lote['rotas'].drop(columns='Dia_Atendimento'), use_container_width=True, hide_index=True)
+                    else:
+                        st.info("Nenhuma rota para sequenciar.")
+                    
+                    st.markdown("---")
                     
                     # --- RESULTADOS DETALHADOS ---
                     st.subheader("Resultados Detalhados (Por Chamado)")
-                    st.dataframe(df_resultados_final, use_container_width=True)
-                    
-                    # --- DOWNLOAD ---
-                    csv_data = df_resultados_final.to_excel(index=False)
-                    st.download_button(
-                        label="⬇️ Baixar Resultados da Alocação (Excel)",
-                        data=io.BytesIO(csv_data.encode('utf-8')),
-                        file_name=f'alocacao_chamados_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    df_exibicao = formatar_resultado(lote['df'], lote['rotulos'])
+                    st.dataframe(
+                        df_exibicao,
+                        use_container_width=True,
+                        column_config={
+                            "Distância_km": st.column_config.NumberColumn("Distância (km)", format="%.2f"),
+                            "Tempo_Estimado_min": st.column_config.NumberColumn("Tempo Estimado (min)", format="%d min"),
+                            "Custo_Estimado_RS": st.column_config.NumberColumn("Custo Estimado", format="R$ %.2f"),
+                            "Data_Atendimento": st.column_config.DateColumn("Data de Atendimento", format="DD/MM/YYYY"),
+                        }
                     )
+                    
+                    # --- DOWNLOAD (ARQUIVO GERADO SOMENTE QUANDO SOLICITADO) ---
+                    st.subheader("Exportar Resultados")
+                    formatos = list(FORMATOS_EXPORTACAO)
+                    col_formato, col_gerar = st.columns(2)
+                    
+                    with col_formato:
+                        formato = st.radio(
+                            "Formato do arquivo:", formatos,
+                            index=1 if len(df_exibicao) > LINHAS_SUGERIR_CSV else 0,
+                            horizontal=True, key='formato_exportacao_lote',
+                            help="Para lotes muito grandes, CSV ou Parquet são gerados e abertos mais rápido que o Excel."
+                        )
+                    
+                    with col_gerar:
+                        extensao, mime = FORMATOS_EXPORTACAO[formato]
+                        download_sob_demanda(
+                            (lote['id'], formato), lambda: exportar(df_exibicao, formato),
+                            f"⬇️ Baixar Resultados da Alocação ({extensao.upper()})",
+                            f'alocacao_chamados_{lote["id"]}.{extensao}', mime, key='arquivo_lote'
+                        )
 
         except Exception as e:
             st.error(f"Erro ao processar a planilha de chamados: {e}")
     else:
-        st.info("Por favor, faça o upload de uma planilha Excel de chamados para iniciar a análise em lote.")
\ No newline at end of file
+        st.info("Por favor, faça o upload de uma planilha Excel de chamados para iniciar a análise em lote.")
+
+
+# =========================================================================
+# TAB 5: CONCILIAÇÃO DE FATURAMENTO
+# =========================================================================
+if aba_ativa == ABAS[4]:
+    st.header("💰 Conciliação de Faturamento")
+
+    st.markdown("Faça o upload da planilha mensal de faturamento (colunas **DATA ATIVIDADE**, **CHAMADO Nº**, **À FATURAR**, **GESTOR EASY**, **CIDADE** e **ESTADO**). Cada chamado é associado ao **técnico mais próximo** da cidade e o valor faturado é comparado com o valor esperado: **taxa de serviço + custo estimado de deslocamento**.")
+    st.markdown(f"Custo de deslocamento: distância aérea × fator de estrada da UF (modelo de desvio) × **R$ {CUSTO_POR_KM:.2f}/km** (ida e volta).")
+    st.markdown("Para o fechamento, envie **todas as revisões do mês na ordem** (ex.: Prévia, Prev2, Final): cada revisão só recalcula os chamados novos ou alterados em relação à anterior.")
+    st.markdown("---")
+
+    col_fat_arquivo, col_fat_tolerancia, col_fat_taxa = st.columns(3)
+    with col_fat_arquivo:
+        arquivos_faturamento = st.file_uploader(
+            "Upload das Planilhas de Faturamento (.xlsx)", type=["xlsx"], key='upload_faturamento', accept_multiple_files=True
+        )
+    with col_fat_tolerancia:
+        tolerancia_rs = st.number_input(
+            "Tolerância (R$)", min_value=0.0, value=TOLERANCIA_RS, step=10.0,
+            help="Chamados cujo valor faturado fica abaixo ou acima do valor esperado por mais que essa margem são sinalizados."
+        )
+    with col_fat_taxa:
+        taxa_servico_rs = st.number_input(
+            "Taxa de Serviço Esperada (R$)", min_value=0.0, value=None, step=10.0, placeholder="Usual do técnico mais próximo",
+            help="Preço do atendimento sem o deslocamento. Em branco, usa a mediana dos chamados do mesmo técnico mais próximo "
+                 "e sinaliza só os valores atípicos e os que não cobrem o deslocamento."
+        )
+
+    if arquivos_faturamento:
+        try:
+            revisoes = {}
+            for arquivo in arquivos_faturamento:
+                abas = pd.ExcelFile(arquivo).sheet_names
+                revisoes[arquivo.name] = carregar_faturamento(arquivo, ABA_FATURAMENTO if ABA_FATURAMENTO in abas else abas[0])
+            nomes_revisoes = list(revisoes)
+            st.success(f"{len(revisoes)} revisão(ões) carregada(s): " + ", ".join(f"{nome} ({len(df)} chamados)" for nome, df in revisoes.items()))
+
+            if st.button("🔎 Conciliar Revisões", type="primary"):
+                indice = indice_municipios(df_tecnicos)
+                resultados_revisoes = {}
+                anterior = None
+                with st.spinner("Localizando cidades e técnicos mais próximos..."):
+                    for nome in nomes_revisoes:
+                        anterior, recalculados = conciliar_revisao(
+                            revisoes[nome], df_tecnicos, CUSTO_POR_KM, indice, tolerancia_rs,
+                            conciliado_anterior=anterior, modelo=obter_modelo_desvio(), taxa_servico_rs=taxa_servico_rs
+                        )
+                        resultados_revisoes[nome] = (anterior, recalculados)
+                # A última revisão prevalece no histórico de chamados (mesma chave = mesmo chamado)
+                registrar_chamados(ORIGEM_FATURAMENTO, anterior['chave'], anterior['data_atividade'],
+                                   anterior['Latitude_Cidade'], anterior['Longitude_Cidade'])
+                st.session_state.conciliacao = {'id': datetime.now().isoformat(), 'revisoes': nomes_revisoes, 'resultados': resultados_revisoes}
+
+            conciliacao = st.session_state.get('conciliacao')
+            if conciliacao is not None and conciliacao['revisoes'] == nomes_revisoes:
+                resultados_revisoes = conciliacao['resultados']
+
+                # --- REVISÕES ---
+                st.subheader("Revisões do Fechamento")
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            'Revisão': nome,
+                            'Chamados': len(df),
+                            'Valor Faturado (R$)': df['valor_faturado'].sum(),
+                            'Recalculados': recalculados,
+                            'Sinalizados': int((df['Conciliação'] != 'OK').sum()),
+                        }
+                        for nome, (df, recalculados) in resultados_revisoes.items()
+                    ]),
+                    use_container_width=True, hide_index=True,
+                    column_config={"Valor Faturado (R$)": st.column_config.NumberColumn(format="R$ %.2f")}
+                )
+
+                revisao = st.selectbox("Revisão exibida:", nomes_revisoes, index=len(nomes_revisoes) - 1)
+                df_conciliado = resultados_revisoes[revisao][0]
+                colunas_valor = {
+                    "Valor_Faturado_RS": st.column_config.NumberColumn("Valor Faturado", format="R$ %.2f"),
+                    "Custo_Deslocamento_RS": st.column_config.NumberColumn("Custo de Deslocamento", format="R$ %.2f"),
+                }
+
+                st.subheader("Resumo da Conciliação")
+                st.dataframe(resumir_conciliacao(df_conciliado), use_container_width=True, hide_index=True, column_config=colunas_valor)
+
+                # --- TOTAIS DO FECHAMENTO ---
+                st.subheader("Totais do Fechamento")
+                agrupamento = st.radio("Agrupar por:", list(AGRUPAMENTOS_TOTAIS), horizontal=True, key='agrupamento_faturamento')
+                df_totais = totais_faturamento(df_conciliado, agrupamento)
+                st.dataframe(df_totais, use_container_width=True, hide_index=True, column_config=colunas_valor)
+
+                # --- DIFERENÇAS ENTRE REVISÕES ---
+                df_diferencas = None
+                revisao_base = None
+                posicao = nomes_revisoes.index(revisao)
+                if posicao > 0:
+                    st.subheader("Diferenças em Relação à Revisão Anterior")
+                    revisao_base = st.selectbox("Comparar com:", nomes_revisoes[:posicao], index=posicao - 1)
+                    df_diferencas = comparar_revisoes(resultados_revisoes[revisao_base][0], df_conciliado)
+                    if df_diferencas.empty:
+                        st.info("Nenhum chamado foi incluído, removido ou alterado entre as revisões.")
+                    else:
+                        st.dataframe(
+                            df_diferencas, use_container_width=True, hide_index=True,
+                            column_config={
+                                "Valor_Anterior_RS": st.column_config.NumberColumn("Valor Anterior", format="R$ %.2f"),
+                                "Valor_Atual_RS": st.column_config.NumberColumn("Valor Atual", format="R$ %.2f"),
+                                "Diferença_Valor_RS": st.column_config.NumberColumn("Diferença", format="R$ %.2f"),
+                            }
+                        )
+
+                # --- CHAMADOS ---
+                st.subheader("Chamados")
+                apenas_sinalizados = st.checkbox("Mostrar apenas chamados sinalizados", value=True)
+                df_exibicao_fat = df_conciliado.drop(columns=['Latitude_Cidade', 'Longitude_Cidade', 'chave', 'impressao'])
+                if apenas_sinalizados:
+                    df_exibicao_fat = df_exibicao_fat[df_exibicao_fat['Conciliação'] != 'OK']
+                df_exibicao_fat = df_exibicao_fat.assign(**{
+                    'Conciliação': df_exibicao_fat['Conciliação'].cat.rename_categories(ROTULOS_CONCILIACAO)
+                })
+                st.dataframe(
+                    df_exibicao_fat, use_container_width=True, hide_index=True,
+                    column_config={
+                        "data_atividade": st.column_config.DatetimeColumn("Data Atividade", format="DD/MM/YYYY HH:mm"),
+                        "valor_faturado": st.column_config.NumberColumn("À Faturar", format="R$ %.2f"),
+                        "Distância_Aérea_km": st.column_config.NumberColumn("Distância Aérea (km)", format="%.1f"),
+                        "Distância_Estimada_km": st.column_config.NumberColumn("Distância Estimada (km)", format="%.1f"),
+                        "Custo_Deslocamento_RS": st.column_config.NumberColumn("Custo de Deslocamento", format="R$ %.2f"),
+                        "Valor_Esperado_RS": st.column_config.NumberColumn("Valor Esperado", format="R$ %.2f"),
+                        "Diferença_RS": st.column_config.NumberColumn("Diferença", format="R$ %.2f"),
+                    }
+                )
+
+                # Planilhas geradas somente quando solicitadas (não a cada interação com os filtros)
+                col_baixar_conc, col_baixar_dif = st.columns(2)
+                with col_baixar_conc:
+                    st.markdown("**Conciliação**")
+                    download_sob_demanda(
+                        (conciliacao['id'], revisao, apenas_sinalizados),
+                        lambda: exportar_excel(df_exibicao_fat, nome_aba="Conciliação"),
+                        "⬇️ Baixar Conciliação (XLSX)", f'conciliacao_{os.path.splitext(revisao)[0]}.xlsx',
+                        FORMATOS_EXPORTACAO["Excel (.xlsx)"][1], key='arquivo_conciliacao'
+                    )
+                with col_baixar_dif:
+                    if df_diferencas is not None and not df_diferencas.empty:
+                        st.markdown("**Diferenças**")
+                        download_sob_demanda(
+                            (conciliacao['id'], revisao_base, revisao),
+                            lambda: exportar_excel(df_diferencas, nome_aba="Diferenças"),
+                            "⬇️ Baixar Diferenças (XLSX)", f'diferencas_{os.path.splitext(revisao)[0]}.xlsx',
+                            FORMATOS_EXPORTACAO["Excel (.xlsx)"][1], key='arquivo_diferencas'
+                        )
+
+        except Exception as e:
+            st.error(f"Erro ao processar a planilha de faturamento: {e}")
+    else:
+        st.info("Por favor, faça o upload da planilha de faturamento do mês para iniciar a conciliação.")
@@ -0,0 +1,37 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# --- VARIÁVEIS GLOBAIS ---
+# Sessões do Streamlit são threads do mesmo processo; a trava de arquivo cobre outros processos
+_TRAVAS = {}
+_TRAVA_TRAVAS = threading.Lock()
+
+# --- FUNÇÕES ---
+
+def _trava_do_processo(arquivo):
+    """Trava (threading.Lock) de um arquivo, criada no primeiro uso."""
+    with _TRAVA_TRAVAS:
+        return _TRAVAS.setdefault(os.path.abspath(arquivo), threading.Lock())
+
+
+@contextmanager
+def arquivo_travado(arquivo):
+    """Acesso exclusivo a um arquivo de dados compartilhado (entre threads e entre processos)."""
+    os.makedirs(os.path.dirname(arquivo) or '.', exist_ok=True)
+    with _trava_do_processo(arquivo), open(arquivo + '.lock', 'a+') as trava:
+        try:
+            import fcntl
+            fcntl.flock(trava, fcntl.LOCK_EX)  # liberada ao fechar o arquivo
+        except ImportError:  # Windows
+            import msvcrt
+            trava.seek(0)
+            msvcrt.locking(trava.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def substituir_csv(df, arquivo):
+    """Reescreve o CSV por troca atômica: quem lê nunca vê o arquivo pela metade."""
+    temporario = arquivo + '.tmp'
+    df.to_csv(temporario, index=False)
+    os.replace(temporario, arquivo)
@@ -0,0 +1,117 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# --- VARIÁVEIS GLOBAIS ---
+COLUNAS_MINIMAS = ['tecnico', 'endereco', 'cidade', 'uf', 'coordenador', 'email_coordenador', 'latitude', 'longitude']
+# Colunas com filtro na barra lateral
+COLUNAS_FACETAS = ['uf', 'cidade', 'coordenador']
+
+# --- FUNÇÕES ---
+
+def _copy_on_write_ativo():
+    """Copy-on-Write ligado (sempre no pandas 3; no 2.x, se quem usa o módulo ligou a opção)."""
+    return int(pd.__version__.split('.')[0]) >= 3 or bool(pd.get_option('mode.copy_on_write'))
+
+
+def _indice_invertido(valores):
+    """
+    Códigos categóricos de cada linha e índice invertido valor -> (código, array das
+    posições das linhas com esse valor).
+    """
+    codigos, categorias = pd.factorize(valores)
+    ordem = np.argsort(codigos, kind='stable')
+    limites = np.searchsorted(codigos[ordem], np.arange(len(categorias) + 1))
+    return codigos, {valor: (k, ordem[limites[k]:limites[k + 1]]) for k, valor in enumerate(categorias)}
+
+
+def construir_facetas(df):
+    """
+    Índices dos filtros da barra lateral, montados uma vez por versão da tabela:
+    - 'codigos': coluna -> código categórico de cada linha;
+    - 'linhas': coluna -> {valor: (código, posições das linhas)} (índice invertido);
+    - 'opcoes': coluna -> valores ordenados para o selectbox (sem 'nan');
+    - 'cidades_por_uf': UF -> cidades ordenadas (cascata UF -> cidade).
+    """
+    codigos, linhas, opcoes = {}, {}, {}
+    for coluna in COLUNAS_FACETAS:
+        valores = df[coluna].astype(str) if coluna in df.columns else pd.Series('nan', index=df.index)
+        codigos[coluna], linhas[coluna] = _indice_invertido(valores.to_numpy())
+        opcoes[coluna] = sorted(v for v in linhas[coluna] if v != 'nan')
+
+    cidades = np.array(list(linhas['cidade']), dtype=object)
+    cidades_por_uf = {
+        uf: sorted(c for c in cidades[np.unique(codigos['cidade'][pos])] if c != 'nan')
+        for uf, (_, pos) in linhas['uf'].items()
+    }
+    return {'codigos': codigos, 'linhas': linhas, 'opcoes': opcoes, 'cidades_por_uf': cidades_por_uf}
+
+
+def filtrar_por_facetas(df, facetas, **selecao):
+    """
+    Linhas de `df` com os valores selecionados (ex.: uf='SP', cidade='Campinas'; None = todos),
+    sem percorrer a tabela: parte da menor lista de posições do índice e confere os
+    demais filtros pelos códigos categóricos dessas linhas.
+    """
+    selecao = {coluna: valor for coluna, valor in selecao.items() if valor is not None}
+    if not selecao:
+        return df
+    if any(valor not in facetas['linhas'][coluna] for coluna, valor in selecao.items()):
+        return df.iloc[:0]
+    menor = min(selecao, key=lambda coluna: len(facetas['linhas'][coluna][selecao[coluna]][1]))
+    posicoes = facetas['linhas'][menor][selecao[menor]][1]
+    for coluna, valor in selecao.items():
+        if coluna != menor:
+            codigo = facetas['linhas'][coluna][valor][0]
+            posicoes = posicoes[facetas['codigos'][coluna][posicoes] == codigo]
+    return df.iloc[posicoes]
+
+
+class BaseTecnicos:
+    """
+    Tabela de técnicos compartilhada por todas as sessões do processo (criada uma vez
+    via st.cache_resource). Cada versão publicada é imutável: `atual()` devolve uma
+    visão sem cópia dos dados e as edições são feitas num rascunho da sessão do editor,
+    que só é publicado para todos ao salvar.
+    """
+
+    def __init__(self, df):
+        self._trava = threading.Lock()
+        self._versao = 0
+        self._df = None
+        self.publicar(df)
+
+    def publicar(self, df):
+        """Substitui a tabela por uma nova versão (vista por todas as sessões no próximo rerun)."""
+        if df.empty and not len(df.columns):
+            df = pd.DataFrame(columns=COLUNAS_MINIMAS)
+        df = df.copy()  # desvincula do DataFrame de quem publicou
+        with self._trava:
+            self._versao += 1
+            self._df = df
+            self._facetas = None
+            return self._versao
+
+    @property
+    def versao(self):
+        return self._versao
+
+    def atual(self):
+        """
+        (versão, tabela para leitura): alterações nela não afetam a base. Com Copy-on-Write
+        é uma visão sem cópia dos dados; sem ele, uma cópia completa.
+        """
+        with self._trava:
+            return self._versao, self._df.copy(deep=not _copy_on_write_ativo())
+
+    def facetas(self, versao):
+        """
+        Índices dos filtros (`construir_facetas`) da `versao` obtida em `atual()`, montados
+        na primeira consulta de cada versão e reaproveitados por todas as sessões.
+        """
+        with self._trava:
+            if versao != self._versao:  # versão publicada entre atual() e esta chamada
+                return None
+            if self._facetas is None:
+                self._facetas = construir_facetas(self._df)
+            return self._facetas
@@ -0,0 +1,87 @@
+"""
+Benchmark da inicialização do app (uso: python benchmark_inicializacao.py).
+
+Roda o app.py com o AppTest do Streamlit num processo novo e mede a importação do
+Streamlit, a tela de login (caches vazios, como após um deploy; os recursos são carregados
+enquanto a senha é digitada), a primeira execução após o login e uma nova execução
+(caches quentes, como a cada interação). Falha (código de saída 1) se alguma etapa
+passar do orçamento ou se um módulo pesado, que só deve ser importado sob demanda,
+tiver sido carregado na tela inicial.
+"""
+import os
+import sys
+import time
+import argparse
+
+# --- VARIÁVEIS GLOBAIS ---
+ARQUIVO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+# Orçamentos (s) medidos num contêiner pequeno, com folga
+ORCAMENTO_IMPORTACAO_S = 1.0
+ORCAMENTO_TELA_LOGIN_S = 2.0
+ORCAMENTO_PRIMEIRA_EXECUCAO_S = 1.0
+ORCAMENTO_NOVA_EXECUCAO_S = 0.5
+# Só carregados pela aba/ação que os usa (gráficos, mapas, barras do terminal). O requests
+# fica de fora: a fila de nova geocodificação pode usá-lo em segundo plano desde o início
+MODULOS_SOB_DEMANDA = ['plotly.express', 'pydeck', 'tqdm']
+
+# --- FUNÇÕES ---
+
+def medir_inicializacao(arquivo_app=ARQUIVO_APP):
+    """
+    Tempos (s) de importação do Streamlit, da tela de login, da primeira execução após
+    o login e de uma nova execução, e os módulos sob demanda carregados. Deve rodar num
+    processo novo para os caches começarem vazios.
+    """
+    inicio = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    importacao = time.perf_counter() - inicio
+
+    # O app lê os arquivos (planilha, dados/) relativos ao diretório em que roda
+    os.chdir(os.path.dirname(arquivo_app))
+    app = AppTest.from_file(arquivo_app, default_timeout=120)
+    app.secrets['auth'] = {'senha': 'benchmark'}
+
+    inicio = time.perf_counter()
+    app.run()
+    login = time.perf_counter() - inicio
+
+    app.session_state['authenticated'] = True
+    inicio = time.perf_counter()
+    app.run()
+    primeira = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    app.run()
+    nova = time.perf_counter() - inicio
+
+    if app.exception:
+        raise RuntimeError(f"Erro ao executar o app: {app.exception[0].value}")
+    return {
+        'importacao_s': importacao,
+        'tela_login_s': login,
+        'primeira_execucao_s': primeira,
+        'nova_execucao_s': nova,
+        'modulos_carregados': [m for m in MODULOS_SOB_DEMANDA if m in sys.modules],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o tempo de inicialização do app e compara com o orçamento.")
+    parser.add_argument('--importacao', type=float, default=ORCAMENTO_IMPORTACAO_S, help="Orçamento da importação do Streamlit (s)")
+    parser.add_argument('--login', type=float, default=ORCAMENTO_TELA_LOGIN_S, help="Orçamento da tela de login (s)")
+    parser.add_argument('--primeira', type=float, default=ORCAMENTO_PRIMEIRA_EXECUCAO_S, help="Orçamento da primeira execução após o login (s)")
+    parser.add_argument('--nova', type=float, default=ORCAMENTO_NOVA_EXECUCAO_S, help="Orçamento de uma nova execução (s)")
+    args = parser.parse_args()
+
+    tempos = medir_inicializacao()
+    orcamentos = {'importacao_s': args.importacao, 'tela_login_s': args.login, 'primeira_execucao_s': args.primeira,
+                  'nova_execucao_s': args.nova}
+    estourou = False
+    for etapa, orcamento in orcamentos.items():
+        ok = tempos[etapa] <= orcamento
+        estourou |= not ok
+        print(f"{etapa:<22} {tempos[etapa]:6.2f} s (orçamento {orcamento:.2f} s) {'OK' if ok else 'ACIMA DO ORÇAMENTO'}")
+    if tempos['modulos_carregados']:
+        estourou = True
+        print(f"Módulos pesados carregados na inicialização: {', '.join(tempos['modulos_carregados'])}")
+    sys.exit(1 if estourou else 0)
@@ -0,0 +1,188 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from municipios import normalizar_uf
+from coordenadas import ARQUIVO_POLIGONOS_UF, coordenadas_confiaveis
+from elegibilidade import tecnicos_ativos
+from roteamento import haversine_vetorizado, tecnico_mais_proximo
+from desvio import estimar_rotas, parametros_por_uf
+
+# --- VARIÁVEIS GLOBAIS ---
+# Área territorial das UFs em km² (IBGE, valores arredondados)
+AREA_UF_KM2 = {
+    'AC': 164_124, 'AL': 27_843, 'AP': 142_471, 'AM': 1_559_168, 'BA': 564_760, 'CE': 148_894,
+    'DF': 5_761, 'ES': 46_074, 'GO': 340_243, 'MA': 329_642, 'MT': 903_207, 'MS': 357_147,
+    'MG': 586_514, 'PA': 1_245_870, 'PB': 56_467, 'PR': 199_299, 'PE': 98_068, 'PI': 251_756,
+    'RJ': 43_750, 'RN': 52_810, 'RS': 281_707, 'RO': 237_765, 'RR': 223_644, 'SC': 95_731,
+    'SP': 248_220, 'SE': 21_939, 'TO': 277_424,
+}
+AREA_BRASIL_KM2 = sum(AREA_UF_KM2.values())
+# Chamado do histórico a mais que isso do centroide mais próximo não é atribuído a nenhum município
+DISTANCIA_MAXIMA_MUNICIPIO_KM = 50
+BLOCO_MUNICIPIO = 1024
+FONTE_ROTA = 'rota'
+FONTE_ESTIMADA = 'estimada'
+
+# --- FUNÇÕES ---
+
+def tecnicos_para_cobertura(df_tecnicos):
+    """Técnicos que contam para a cobertura: ativos e com coordenadas confiáveis."""
+    return df_tecnicos[coordenadas_confiaveis(df_tecnicos) & tecnicos_ativos(df_tecnicos)].reset_index(drop=True)
+
+
+def densidade_por_uf(df_tecnicos):
+    """Técnicos por 100 mil km² em cada UF (todas as UFs, inclusive as sem técnicos)."""
+    contagem = df_tecnicos['uf'].map(normalizar_uf).value_counts()
+    df = pd.DataFrame({'uf': list(AREA_UF_KM2), 'area_km2': list(AREA_UF_KM2.values())})
+    df['tecnicos'] = df['uf'].map(contagem).fillna(0).astype(int)
+    df['tecnicos_por_100mil_km2'] = df['tecnicos'] / df['area_km2'] * 100_000
+    return df.sort_values('tecnicos_por_100mil_km2', ascending=False).reset_index(drop=True)
+
+
+def distancias_de_cobertura(df_municipios, df_tecnicos, modelo):
+    """
+    Para cada município do cadastro, o técnico mais próximo em linha reta e a distância
+    de carro estimada pelo modelo de desvio (fator mediano da UF do município).
+    Retorna o cadastro com 'indice_tecnico', 'aereo_km' e 'estimada_km' (NaN sem técnicos).
+    """
+    df = df_municipios.reset_index(drop=True).copy()
+    idx, aereo = tecnico_mais_proximo(
+        df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float),
+        df_tecnicos['latitude'].to_numpy(dtype=float), df_tecnicos['longitude'].to_numpy(dtype=float),
+    )
+    df['indice_tecnico'] = idx
+    df['aereo_km'] = aereo
+    df['estimada_km'] = estimar_rotas(aereo, parametros_por_uf(modelo, df['uf']))[0]
+    return df
+
+
+def _municipio_mais_proximo(lat, lng, lat_ref, lng_ref):
+    """
+    Centroide mais próximo de cada ponto pela aproximação plana (equiretangular), bem mais
+    barata que Haversine em todos os pares e exata o bastante para distâncias de poucas
+    dezenas de km; só o par escolhido tem a distância Haversine calculada.
+    Retorna (índice, distância em km).
+    """
+    # float32: metade da memória e do tempo, precisão de ~1 m nas coordenadas
+    lat32, lng32 = lat.astype(np.float32), lng.astype(np.float32)
+    lat_ref32, lng_ref32 = lat_ref.astype(np.float32), lng_ref.astype(np.float32)
+    escala = np.cos(np.radians(lat_ref32))
+    indice = np.empty(len(lat), dtype=np.int64)
+    for inicio in range(0, len(lat), BLOCO_MUNICIPIO):
+        bloco = slice(inicio, inicio + BLOCO_MUNICIPIO)
+        dx = (lng32[bloco, None] - lng_ref32[None, :]) * escala[None, :]
+        dy = lat32[bloco, None] - lat_ref32[None, :]
+        indice[bloco] = (dx * dx + dy * dy).argmin(axis=1)
+    return indice, haversine_vetorizado(lat, lng, lat_ref[indice], lng_ref[indice])
+
+
+def chamados_por_municipio(df_municipios, historico):
+    """
+    Quantidade de chamados do histórico em cada município (centroide mais próximo), alinhada
+    ao cadastro. Chamados no mesmo ponto (arredondado a ~1 km) são localizados uma vez só.
+    """
+    contagem = np.zeros(len(df_municipios), dtype=np.int64)
+    if historico is None or historico.empty or df_municipios.empty:
+        return contagem
+    pontos = np.round(historico[['latitude', 'longitude']].to_numpy(dtype=float), 2)
+    pontos = pontos[np.isfinite(pontos).all(axis=1)]
+    if not len(pontos):
+        return contagem
+    unicos, repeticoes = np.unique(pontos, axis=0, return_counts=True)
+    idx, dist = _municipio_mais_proximo(
+        unicos[:, 0], unicos[:, 1],
+        df_municipios['latitude'].to_numpy(dtype=float), df_municipios['longitude'].to_numpy(dtype=float),
+    )
+    validos = dist <= DISTANCIA_MAXIMA_MUNICIPIO_KM
+    return np.bincount(idx[validos], weights=repeticoes[validos], minlength=len(df_municipios)).astype(np.int64)
+
+
+def analisar_cobertura(df_municipios, df_tecnicos, modelo, raios, matriz=None, historico=None):
+    """
+    Cobertura de cada município do cadastro pelos técnicos informados:
+    - 'distancia_km': menor distância de carro até um técnico, da matriz técnico x
+      município (rota real, 'fonte' = 'rota') ou, para técnicos fora dela, estimada
+      pelo modelo de desvio a partir da distância aérea ('fonte' = 'estimada');
+    - 'tecnico': o técnico dessa menor distância;
+    - 'chamados': volume de chamados do histórico no município;
+    - 'coberto_<raio>': se há técnico a até cada raio de `raios`.
+    """
+    from matriz_municipios import chaves_tecnicos
+
+    df = df_municipios.reset_index(drop=True)
+    tecnicos = df_tecnicos.reset_index(drop=True)
+    linhas = np.full(len(tecnicos), -1)
+    colunas = np.full(len(df), -1)
+    if matriz is not None and len(tecnicos):
+        linhas = np.array([matriz['linha_tecnico'].get(k, -1) for k in chaves_tecnicos(tecnicos)])
+        colunas = np.array([matriz['coluna_municipio'].get(int(c), -1) if pd.notna(c) else -1 for c in df['codigo_ibge']])
+
+    # Técnicos fora da matriz: técnico mais próximo em linha reta + fator de desvio
+    fora = np.flatnonzero(linhas < 0)
+    estimada = distancias_de_cobertura(df, tecnicos.iloc[fora], modelo)
+    distancia = np.array(estimada['estimada_km'], dtype=float)
+    mais_proximo = estimada['indice_tecnico'].to_numpy()
+    indice = np.where(mais_proximo >= 0, fora[np.maximum(mais_proximo, 0)], -1) if len(fora) else np.full(len(df), -1)
+    fonte = np.full(len(df), FONTE_ESTIMADA, dtype=object)
+
+    # Técnicos na matriz: menor rota real até o centroide
+    dentro = np.flatnonzero(linhas >= 0)
+    com_coluna = np.flatnonzero(colunas >= 0)
+    if len(dentro) and len(com_coluna):
+        rotas = np.asarray(matriz['distancias'][np.ix_(linhas[dentro], colunas[com_coluna])], dtype=float)
+        melhor = rotas.argmin(axis=0)
+        rota = rotas[melhor, np.arange(len(com_coluna))]
+        melhora = ~(distancia[com_coluna] <= rota) & np.isfinite(rota)
+        alvo = com_coluna[melhora]
+        distancia[alvo] = rota[melhora]
+        indice[alvo] = dentro[melhor[melhora]]
+        fonte[alvo] = FONTE_ROTA
+
+    nomes = pd.Series(tecnicos['tecnico'].astype('string').to_numpy(), dtype='string')
+    resultado = df[['codigo_ibge', 'nome', 'uf', 'latitude', 'longitude']].assign(
+        distancia_km=distancia,
+        fonte=np.where(np.isfinite(distancia), fonte, None),
+        tecnico=nomes.reindex(indice).to_numpy(),  # -1 -> <NA>
+        chamados=chamados_por_municipio(df, historico),
+    )
+    for raio in raios:
+        resultado[f'coberto_{raio}'] = distancia <= raio
+    return resultado
+
+
+def contar_descobertos(cobertura, raios):
+    """Municípios sem técnico a até cada raio. Retorna {raio: quantidade}."""
+    return {raio: int((~cobertura[f'coberto_{raio}']).sum()) for raio in raios}
+
+
+def municipios_descobertos(cobertura, raio):
+    """Municípios sem técnico a até `raio`, dos com mais chamados (e mais distantes) para os demais."""
+    descobertos = cobertura[~cobertura[f'coberto_{raio}']]
+    return descobertos.sort_values(['chamados', 'distancia_km'], ascending=False).reset_index(drop=True)
+
+
+def cobertura_por_uf(cobertura, raio):
+    """Por UF: municípios, municípios descobertos, % descobertos e chamados em municípios descobertos."""
+    df = cobertura.assign(descoberto=~cobertura[f'coberto_{raio}'])
+    df['chamados_descobertos'] = df['chamados'].where(df['descoberto'], 0)
+    por_uf = df.groupby('uf').agg(
+        municipios=('codigo_ibge', 'size'),
+        descobertos=('descoberto', 'sum'),
+        chamados_descobertos=('chamados_descobertos', 'sum'),
+    ).reset_index()
+    por_uf['pct_descobertos'] = por_uf['descobertos'] / por_uf['municipios'] * 100
+    return por_uf
+
+
+def carregar_geojson_ufs(arquivo=ARQUIVO_POLIGONOS_UF):
+    """GeoJSON das UFs (o mesmo de coordenadas.py) com 'id' = sigla, para o mapa coroplético; None sem o arquivo."""
+    if not os.path.exists(arquivo):
+        return None
+    with open(arquivo, encoding='utf-8') as f:
+        dados = json.load(f)
+    for feicao in dados.get('features', []):
+        propriedades = feicao.get('properties') or {}
+        feicao['id'] = normalizar_uf(propriedades.get('sigla') or propriedades.get('uf') or '')
+    return dados
@@ -0,0 +1,104 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+from roteamento import haversine_vetorizado
+from desvio import parametros_por_uf
+
+# --- VARIÁVEIS GLOBAIS ---
+OBJETIVO_COBERTURA = 'cobertura'  # máxima cobertura: chamados que passam a ter técnico no raio
+OBJETIVO_DISTANCIA = 'distancia'  # p-mediana: km economizados no deslocamento até os chamados
+ROTULOS_OBJETIVO = {
+    OBJETIVO_COBERTURA: 'Chamados cobertos no raio',
+    OBJETIVO_DISTANCIA: 'Km economizados',
+}
+# Limita a matriz candidatos x demanda (float32): 3000 x 3000 = 36 MB
+MAX_CANDIDATOS = 3000
+MAX_PONTOS_DEMANDA = 3000
+
+# --- FUNÇÕES ---
+
+def _ganhos(distancias, atual, peso, raio, objetivo):
+    """Ganho de cada linha de `distancias` (candidato x demanda) sobre a distância atual de cada ponto."""
+    if objetivo == OBJETIVO_COBERTURA:
+        return ((distancias <= raio) & (atual > raio)[None, :]) @ peso
+    return np.maximum(atual[None, :] - distancias, 0) @ peso
+
+
+def simular_contratacoes(cobertura, k, raio, objetivo=OBJETIVO_COBERTURA, custo_por_km=2.0, modelo=None,
+                         candidatos=None):
+    """
+    Onde colocar os próximos `k` técnicos (um por município), a partir da análise de
+    cobertura (`cobertura.analisar_cobertura`, com o volume de chamados do histórico).
+
+    Demanda: municípios com chamados, pesados pelo volume, com a distância atual até o
+    técnico mais próximo. Candidatos: `candidatos` (códigos IBGE) ou os municípios com
+    chamados. A distância candidato -> demanda é a aérea x fator de desvio da UF da
+    demanda, numa matriz vetorizada única. A escolha é gulosa com avaliação preguiçosa
+    (lazy greedy): os dois objetivos são submodulares, então o ganho de um candidato só
+    diminui e basta reavaliar o topo da fila de prioridade.
+
+    Retorna um DataFrame com um técnico por linha: município, ganho marginal em chamados
+    cobertos, km e R$ economizados, e a cobertura acumulada.
+    """
+    demanda = cobertura[cobertura['chamados'] > 0].nlargest(MAX_PONTOS_DEMANDA, 'chamados').reset_index(drop=True)
+    if candidatos is None:
+        opcoes = demanda
+    else:
+        opcoes = cobertura[cobertura['codigo_ibge'].isin(candidatos)]
+    opcoes = opcoes.nlargest(MAX_CANDIDATOS, 'chamados').reset_index(drop=True)
+    if demanda.empty or opcoes.empty or k <= 0:
+        return pd.DataFrame()
+
+    peso = demanda['chamados'].to_numpy(dtype=float)
+    atual = np.array(demanda['distancia_km'], dtype=float)
+    aereo = haversine_vetorizado(
+        opcoes['latitude'].to_numpy(dtype=float)[:, None], opcoes['longitude'].to_numpy(dtype=float)[:, None],
+        demanda['latitude'].to_numpy(dtype=float)[None, :], demanda['longitude'].to_numpy(dtype=float)[None, :],
+    )
+    fator = parametros_por_uf(modelo if modelo is not None else pd.DataFrame(), demanda['uf'])['fator_mediano'].to_numpy(dtype=float)
+    distancias = (aereo * fator[None, :]).astype(np.float32)
+    # Sem técnico algum: a "distância atual" é a maior distância da matriz
+    atual[~np.isfinite(atual)] = distancias.max() if distancias.size else 0
+
+    total_chamados = peso.sum()
+    cobertos = peso[atual <= raio].sum()
+    cobertura_inicial = cobertos / total_chamados * 100
+
+    # Fila de prioridade com o limite superior do ganho de cada candidato
+    ganhos = _ganhos(distancias, atual, peso, raio, objetivo)
+    fila = [(-g, j) for j, g in enumerate(ganhos)]
+    heapq.heapify(fila)
+
+    escolhidos = []
+    avaliacoes = len(opcoes)
+    while fila and len(escolhidos) < k:
+        _, j = heapq.heappop(fila)
+        ganho = _ganhos(distancias[j:j + 1], atual, peso, raio, objetivo)[0]
+        avaliacoes += 1
+        if fila and ganho < -fila[0][0]:
+            heapq.heappush(fila, (-ganho, j))  # ganho desatualizado: volta para a fila
+            continue
+        if ganho <= 0:
+            break
+
+        nova = np.minimum(atual, distancias[j])
+        novos_cobertos = peso[(nova <= raio) & (atual > raio)].sum()
+        km = ((atual - nova) * peso).sum()
+        cobertos += novos_cobertos
+        atual = nova
+        escolhidos.append({
+            'Ordem': len(escolhidos) + 1,
+            'Município': opcoes.at[j, 'nome'],
+            'UF': opcoes.at[j, 'uf'],
+            'Chamados no Município': int(opcoes.at[j, 'chamados']),
+            'Chamados Cobertos (Marginal)': int(novos_cobertos),
+            'Km Economizados (Marginal)': float(km),
+            'Custo Economizado (R$)': float(km * custo_por_km),
+            'Cobertura Acumulada (%)': float(cobertos / total_chamados * 100),
+        })
+
+    resultado = pd.DataFrame(escolhidos)
+    resultado.attrs['avaliacoes'] = avaliacoes
+    resultado.attrs['cobertura_inicial_pct'] = float(cobertura_inicial)
+    return resultado
@@ -0,0 +1,276 @@
+import os
+import json
+import threading
+import pandas as pd
+import numpy as np
+
+from roteamento import haversine_vetorizado
+from municipios import reconciliar_cidades, normalizar_nome, normalizar_uf
+from enderecos import canonicalizar_enderecos
+
+# --- VARIÁVEIS GLOBAIS ---
+# Retângulo envolvente do Brasil (inclui Fernando de Noronha e Trindade)
+LAT_BRASIL = (-34.0, 5.5)
+LNG_BRASIL = (-74.1, -28.8)
+# Retângulo envolvente de cada UF (lat_min, lat_max, lng_min, lng_max), usado quando
+# o arquivo de polígonos das UFs não está disponível
+LIMITES_UF = {
+    'AC': (-11.15, -7.11, -73.99, -66.62), 'AL': (-10.50, -8.81, -38.24, -35.15),
+    'AP': (-1.24, 4.44, -54.88, -49.87), 'AM': (-9.82, 2.25, -73.80, -56.10),
+    'BA': (-18.35, -8.53, -46.62, -37.34), 'CE': (-7.86, -2.78, -41.42, -37.25),
+    'DF': (-16.05, -15.50, -48.29, -47.31), 'ES': (-21.30, -17.89, -41.88, -39.66),
+    'GO': (-19.50, -12.39, -53.25, -45.91), 'MA': (-10.26, -1.04, -48.76, -41.80),
+    'MT': (-18.04, -7.35, -61.63, -50.22), 'MS': (-24.07, -17.17, -58.17, -50.92),
+    'MG': (-22.92, -14.23, -51.05, -39.86), 'PA': (-9.84, 2.59, -58.90, -46.06),
+    'PB': (-8.30, -6.02, -38.77, -34.79), 'PR': (-26.72, -22.52, -54.62, -48.02),
+    'PE': (-9.48, -3.80, -41.36, -32.38), 'PI': (-10.93, -2.74, -45.99, -40.37),
+    'RJ': (-23.37, -20.76, -44.89, -40.96), 'RN': (-6.98, -4.83, -38.58, -34.97),
+    'RS': (-33.75, -27.08, -57.65, -49.69), 'RO': (-13.69, -7.97, -66.81, -59.77),
+    'RR': (-1.58, 5.27, -64.82, -58.89), 'SC': (-29.35, -25.96, -53.84, -48.36),
+    'SP': (-25.31, -19.78, -53.11, -44.16), 'SE': (-11.57, -9.51, -38.25, -36.39),
+    'TO': (-13.47, -5.17, -50.74, -45.70),
+}
+MARGEM_UF_GRAUS = 0.1
+# Polígonos das UFs (GeoJSON com a sigla em properties.sigla), opcional
+ARQUIVO_POLIGONOS_UF = os.path.join('dados', 'ufs.geojson')
+# Acima disso o técnico está longe demais do centroide da cidade declarada
+DISTANCIA_MAXIMA_CIDADE_KM = 60.0
+
+# Resultado da validação (coluna 'qualidade_coord'), do pior para o melhor
+QUALIDADE_SEM_COORDENADAS = 'SEM_COORDENADAS'
+QUALIDADE_INVERTIDAS = 'LAT_LNG_INVERTIDAS'
+QUALIDADE_SINAL = 'SINAL_INVERTIDO'
+QUALIDADE_FORA_BRASIL = 'FORA_DO_BRASIL'
+QUALIDADE_FORA_UF = 'FORA_DA_UF'
+QUALIDADE_LONGE_CIDADE = 'LONGE_DA_CIDADE'
+QUALIDADE_OK = 'OK'
+CODIGOS_QUALIDADE = [QUALIDADE_SEM_COORDENADAS, QUALIDADE_INVERTIDAS, QUALIDADE_SINAL, QUALIDADE_FORA_BRASIL,
+                     QUALIDADE_FORA_UF, QUALIDADE_LONGE_CIDADE, QUALIDADE_OK]
+# Coordenadas que não devem entrar em nenhum cálculo de distância
+QUALIDADE_INVALIDA = [QUALIDADE_SEM_COORDENADAS, QUALIDADE_INVERTIDAS, QUALIDADE_SINAL, QUALIDADE_FORA_BRASIL]
+# Coordenadas que vão para a fila de nova geocodificação
+QUALIDADE_REGEOCODIFICAR = QUALIDADE_INVALIDA[1:] + [QUALIDADE_FORA_UF, QUALIDADE_LONGE_CIDADE]
+
+# --- FUNÇÕES ---
+
+def _numerica(df, coluna):
+    """Coluna convertida para número (NaN se ausente ou inválida)."""
+    if coluna not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[coluna], errors='coerce')
+
+
+def no_brasil(lat, lng):
+    """Máscara vetorizada: coordenadas dentro do retângulo do Brasil."""
+    return (lat >= LAT_BRASIL[0]) & (lat <= LAT_BRASIL[1]) & (lng >= LNG_BRASIL[0]) & (lng <= LNG_BRASIL[1])
+
+
+def carregar_poligonos_uf(arquivo=ARQUIVO_POLIGONOS_UF):
+    """
+    Lê os polígonos das UFs de um GeoJSON: {sigla: [anel, ...]}, cada anel um array (n, 2)
+    de (lng, lat). Retorna {} se o arquivo não existir.
+    """
+    if not os.path.exists(arquivo):
+        return {}
+    with open(arquivo, encoding='utf-8') as f:
+        dados = json.load(f)
+
+    poligonos = {}
+    for feicao in dados.get('features', []):
+        propriedades = feicao.get('properties') or {}
+        uf = normalizar_uf(propriedades.get('sigla') or propriedades.get('uf') or '')
+        geometria = feicao.get('geometry') or {}
+        partes = geometria.get('coordinates', [])
+        if geometria.get('type') == 'Polygon':
+            partes = [partes]
+        if uf:
+            poligonos.setdefault(uf, []).extend(np.asarray(anel, dtype=float) for poligono in partes for anel in poligono)
+    return poligonos
+
+
+def dentro_dos_aneis(lat, lng, aneis):
+    """
+    Ray casting vetorizado sobre todos os pontos: cada aresta de cada anel alterna o
+    estado dos pontos cujo raio horizontal a cruza (regra par-ímpar, trata buracos e ilhas).
+    """
+    dentro = np.zeros(len(lat), dtype=bool)
+    for anel in aneis:
+        x1, y1 = anel[:, 0], anel[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for xa, ya, xb, yb in zip(x1, y1, x2, y2):
+            cruza = (ya > lat) != (yb > lat)
+            if cruza.any():
+                x_corte = xa + (lat[cruza] - ya) * (xb - xa) / (yb - ya)
+                dentro[cruza] ^= lng[cruza] < x_corte
+    return dentro
+
+
+def dentro_da_uf(lat, lng, ufs, poligonos=None):
+    """
+    Máscara vetorizada: coordenada dentro da UF declarada. Usa os polígonos, se houver,
+    ou o retângulo da UF com MARGEM_UF_GRAUS. UF desconhecida não é sinalizada.
+    """
+    ufs = np.asarray(ufs, dtype=object)
+    resultado = np.ones(len(lat), dtype=bool)
+    for uf in pd.unique(ufs):
+        linhas = ufs == uf
+        if poligonos and uf in poligonos:
+            resultado[linhas] = dentro_dos_aneis(lat[linhas], lng[linhas], poligonos[uf])
+        elif uf in LIMITES_UF:
+            lat_min, lat_max, lng_min, lng_max = LIMITES_UF[uf]
+            resultado[linhas] = (
+                (lat[linhas] >= lat_min - MARGEM_UF_GRAUS) & (lat[linhas] <= lat_max + MARGEM_UF_GRAUS)
+                & (lng[linhas] >= lng_min - MARGEM_UF_GRAUS) & (lng[linhas] <= lng_max + MARGEM_UF_GRAUS)
+            )
+    return resultado
+
+
+def avaliar_coordenadas(df, indice=None, poligonos=None):
+    """
+    Valida, de forma vetorizada, as colunas 'latitude'/'longitude' contra o Brasil, a UF
+    declarada e (com o cadastro do IBGE em `indice`) o centroide da cidade declarada.
+    Coordenadas fora do Brasil que caem dentro dele com lat/lng trocadas ou com o sinal
+    corrigido são sinalizadas como tal, com a correção sugerida.
+    Retorna um DataFrame alinhado a `df` com 'qualidade_coord' (categórica),
+    'distancia_cidade_km', 'latitude_sugerida' e 'longitude_sugerida'.
+    """
+    lat, lng = (np.array(_numerica(df, c), dtype=float) for c in ('latitude', 'longitude'))
+    ufs = df['uf'].map(normalizar_uf).to_numpy() if 'uf' in df.columns else np.full(len(df), '', dtype=object)
+
+    sem_coordenadas = np.isnan(lat) | np.isnan(lng)
+    brasil = no_brasil(lat, lng)
+    invertidas = ~brasil & no_brasil(lng, lat) & dentro_da_uf(lng, lat, ufs, poligonos)
+    sinal = ~brasil & ~invertidas & no_brasil(-np.abs(lat), -np.abs(lng)) & dentro_da_uf(-np.abs(lat), -np.abs(lng), ufs, poligonos)
+    fora_uf = brasil & ~dentro_da_uf(lat, lng, ufs, poligonos)
+
+    distancia_cidade = np.full(len(df), np.nan)
+    if indice is not None and not indice['municipios'].empty and 'cidade' in df.columns:
+        mun = reconciliar_cidades(indice, df['cidade'], df['uf'] if 'uf' in df.columns else None)
+        distancia_cidade = haversine_vetorizado(
+            lat, lng, mun['latitude_municipio'].to_numpy(dtype=float), mun['longitude_municipio'].to_numpy(dtype=float)
+        )
+    longe_cidade = brasil & (distancia_cidade > DISTANCIA_MAXIMA_CIDADE_KM)
+
+    codigos = np.select(
+        [sem_coordenadas, invertidas, sinal, ~brasil, fora_uf, longe_cidade],
+        CODIGOS_QUALIDADE[:-1], default=QUALIDADE_OK
+    )
+    return pd.DataFrame({
+        'qualidade_coord': pd.Categorical(codigos, categories=CODIGOS_QUALIDADE),
+        'distancia_cidade_km': distancia_cidade,
+        'latitude_sugerida': np.select([invertidas, sinal], [lng, -np.abs(lat)], default=np.nan),
+        'longitude_sugerida': np.select([invertidas, sinal], [lat, -np.abs(lng)], default=np.nan),
+    }, index=df.index)
+
+
+def coordenadas_confiaveis(df):
+    """Máscara dos técnicos cujas coordenadas podem entrar nos cálculos de distância."""
+    confiavel = np.array(_numerica(df, 'latitude').notna() & _numerica(df, 'longitude').notna(), dtype=bool)
+    if 'qualidade_coord' in df.columns:
+        confiavel &= ~df['qualidade_coord'].astype(str).isin(QUALIDADE_INVALIDA).to_numpy()
+    return confiavel
+
+
+def identificar_tecnicos(df):
+    """
+    Chave estável de cada técnico ('chave': nome + cidade + UF normalizados, que não muda
+    quando a planilha é salva, reordenada ou tem linhas removidas) e a 'assinatura' do
+    endereço (endereço, número, cidade, UF e CEP canonicalizados). Retorna um DataFrame
+    alinhado ao índice de `df`.
+    """
+    def texto(coluna):
+        if coluna not in df.columns:
+            return pd.Series('', index=df.index, dtype='string')
+        return df[coluna].astype('string').fillna('').str.strip()
+
+    chave = texto('tecnico').map(normalizar_nome) + '|' + texto('cidade').map(normalizar_nome) + '|' + texto('uf').str.upper()
+    endereco = texto('endereco') + ' ' + texto('numero') + ' ' + texto('cidade') + ' ' + texto('uf') + ' ' + texto('cep')
+    return pd.DataFrame({'chave': chave.astype(object), 'assinatura': canonicalizar_enderecos(endereco)['chave']}, index=df.index)
+
+
+class FilaRegeocodificacao:
+    """
+    Fila de técnicos com coordenadas suspeitas, geocodificados novamente em uma thread
+    de fundo (uma por processo, respeitando o limite de 1 requisição/s do Nominatim).
+    A interface consulta `situacao()` e aplica os resultados prontos com `coletar()`.
+    Cada técnico é identificado pela chave de `identificar_tecnicos` (não pelo índice da
+    linha, que muda a cada salvamento); o resultado leva a assinatura do endereço geocodificado.
+    """
+
+    def __init__(self, geocodificar):
+        # geocodificar(df_linhas) -> DataFrame(latitude, longitude, precisao_geocod) alinhado
+        self._geocodificar = geocodificar
+        self._trava = threading.Lock()
+        self._pendentes = {}
+        self._resultados = {}
+        self._falhas = 0
+        self._thread = None
+
+    def enfileirar(self, df_linhas):
+        """
+        Adiciona técnicos que ainda não estão na fila. Se o endereço de um técnico mudou,
+        o pedido (ou o resultado) do endereço antigo é substituído.
+        """
+        ids = identificar_tecnicos(df_linhas)
+        with self._trava:
+            for (_, linha), chave, assinatura in zip(df_linhas.iterrows(), ids['chave'], ids['assinatura']):
+                atual = self._pendentes.get(chave) or self._resultados.get(chave)
+                if atual is not None and atual[0] == assinatura:
+                    continue
+                self._resultados.pop(chave, None)
+                self._pendentes[chave] = (assinatura, linha)
+            if self._pendentes and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._processar, daemon=True)
+                self._thread.start()
+
+    def _processar(self):
+        while True:
+            with self._trava:
+                if not self._pendentes:
+                    return
+                chave, (assinatura, linha) = next(iter(self._pendentes.items()))
+            try:
+                coords = self._geocodificar(linha.to_frame().T).iloc[0]
+                encontrado = pd.notna(coords['latitude']) and bool(no_brasil(coords['latitude'], coords['longitude']))
+            except Exception:
+                encontrado = False
+            with self._trava:
+                # O técnico pode ter sido enfileirado de novo, com outro endereço, durante a consulta
+                if self._pendentes.get(chave, (None,))[0] != assinatura:
+                    continue
+                self._pendentes.pop(chave)
+                if encontrado:
+                    self._resultados[chave] = (assinatura, coords)
+                else:
+                    self._falhas += 1
+
+    def situacao(self):
+        """(pendentes, prontos para aplicar, sem resultado)."""
+        with self._trava:
+            return len(self._pendentes), len(self._resultados), self._falhas
+
+    def coletar(self):
+        """
+        Retira os resultados prontos: DataFrame(latitude, longitude, precisao_geocod, assinatura)
+        indexado pela chave do técnico.
+        """
+        with self._trava:
+            resultados, self._resultados = self._resultados, {}
+        colunas = ['latitude', 'longitude', 'precisao_geocod']
+        df = pd.DataFrame([coords[colunas] for _, coords in resultados.values()], columns=colunas)
+        df['assinatura'] = [assinatura for assinatura, _ in resultados.values()]
+        df.index = pd.Index(list(resultados.keys()), dtype=object)
+        return df
+
+
+def casar_correcoes(df_tecnicos, df_corrigidas):
+    """
+    Correções da fila (`FilaRegeocodificacao.coletar`) casadas com as linhas atuais da
+    planilha pela chave do técnico. Correções de técnicos que saíram da planilha ou cujo
+    endereço mudou desde a geocodificação são descartadas. Retorna um DataFrame
+    (latitude, longitude, precisao_geocod) indexado pelas linhas de `df_tecnicos`.
+    """
+    ids = identificar_tecnicos(df_tecnicos)
+    casadas = ids.join(df_corrigidas.rename(columns={'assinatura': 'assinatura_geocodificada'}), on='chave', how='inner')
+    casadas = casadas[casadas['assinatura'] == casadas['assinatura_geocodificada']]
+    return casadas[['latitude', 'longitude', 'precisao_geocod']]
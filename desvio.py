@@ -0,0 +1,273 @@
+import os
+import sys
+import pandas as pd
+import numpy as np
+
+from roteamento import haversine_vetorizado, tecnico_mais_proximo
+from municipios import normalizar_uf
+from arquivos import arquivo_travado, substituir_csv
+
+# --- VARIÁVEIS GLOBAIS ---
+# Rotas reais já calculadas (OSRM), acumuladas a cada busca para ajustar o modelo de desvio
+ARQUIVO_OBSERVACOES = os.path.join('dados', 'rotas_observadas.csv')
+COLUNAS_OBSERVACOES = ['uf', 'aereo_km', 'rota_km', 'tempo_s']
+MAX_OBSERVACOES = 200_000
+# Acima disso (~3x MAX_OBSERVACOES linhas) o arquivo é reescrito só com as últimas MAX_OBSERVACOES
+MAX_BYTES_OBSERVACOES = 16 * 1024 * 1024
+# Trechos muito curtos têm fator de desvio instável (quarteirões, rotatórias)
+AEREO_MINIMO_KM = 2.0
+# Grupos com menos observações usam o nível acima (UF -> região -> Brasil -> padrão)
+MIN_OBSERVACOES = 30
+QUANTIS = {'fator_min': 0.01, 'fator_mediano': 0.5, 'fator_max': 0.95}
+
+REGIOES = {
+    'Norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
+    'Nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'Centro-Oeste': ['DF', 'GO', 'MT', 'MS'],
+    'Sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'Sul': ['PR', 'RS', 'SC'],
+}
+REGIAO_DA_UF = {uf: regiao for regiao, ufs in REGIOES.items() for uf in ufs}
+BRASIL = 'BR'
+# Folga fixa usada antes do modelo (referência para medir o ganho do pré-filtro adaptativo)
+FOLGA_FIXA = 1.5
+RAIOS_AVALIACAO = [30, 100, 200]
+# Sem nenhuma observação: mesmas premissas de sequenciamento.py; fator_min = 1 / 1.5
+# reproduz a folga fixa de 50% do pré-filtro aéreo
+PARAMETROS_PADRAO = {'n': 0, 'fator_min': 1 / 1.5, 'fator_mediano': 1.3, 'fator_max': 1.8, 'velocidade_kmh': 60.0}
+
+# --- FUNÇÕES ---
+
+def _compactar_observacoes(arquivo):
+    """Reescreve o arquivo só com as últimas MAX_OBSERVACOES rotas distintas (troca atômica)."""
+    df = pd.read_csv(arquivo, dtype={'uf': 'string'}).drop_duplicates().tail(MAX_OBSERVACOES)
+    substituir_csv(df, arquivo)
+
+
+def registrar_rotas(lat_origem, lng_origem, lat_destino, lng_destino, rota_km, tempo_s, ufs, arquivo=ARQUIVO_OBSERVACOES):
+    """
+    Acrescenta ao histórico as rotas reais calculadas (apenas as finitas), com a
+    distância aérea correspondente e a UF do técnico. As escritas são serializadas e,
+    quando o arquivo passa de MAX_BYTES_OBSERVACOES, ele é compactado.
+    """
+    aereo = haversine_vetorizado(lat_origem, lng_origem, lat_destino, lng_destino)
+    df = pd.DataFrame({
+        'uf': pd.Series(ufs).map(normalizar_uf).to_numpy(),
+        'aereo_km': np.round(aereo, 3),
+        'rota_km': np.round(np.asarray(rota_km, dtype=float), 3),
+        'tempo_s': np.round(np.asarray(tempo_s, dtype=float), 1),
+    })
+    df = df[np.isfinite(df['rota_km']) & np.isfinite(df['tempo_s']) & (df['aereo_km'] >= AEREO_MINIMO_KM)]
+    if df.empty:
+        return 0
+    with arquivo_travado(arquivo):
+        df.to_csv(arquivo, mode='a', index=False, header=not os.path.exists(arquivo))
+        if os.path.getsize(arquivo) > MAX_BYTES_OBSERVACOES:
+            _compactar_observacoes(arquivo)
+    return len(df)
+
+
+def carregar_observacoes(arquivo=ARQUIVO_OBSERVACOES):
+    """Últimas MAX_OBSERVACOES rotas registradas (DataFrame vazio se ainda não há histórico)."""
+    if not os.path.exists(arquivo):
+        return pd.DataFrame(columns=COLUNAS_OBSERVACOES)
+    with arquivo_travado(arquivo):
+        df = pd.read_csv(arquivo, dtype={'uf': 'string'})
+    # Rotas repetidas (mesmo par buscado várias vezes) contam uma vez só
+    return df.drop_duplicates().tail(MAX_OBSERVACOES).reset_index(drop=True)
+
+
+def ajustar_modelo(observacoes):
+    """
+    Ajusta o fator de desvio (rota / distância aérea) e a velocidade média por UF, por
+    região e para o Brasil. Retorna um DataFrame indexado pelo grupo com 'n',
+    'fator_min' (quantil 1%), 'fator_mediano', 'fator_max' (quantil 95%) e 'velocidade_kmh'.
+    """
+    df = observacoes[(observacoes['aereo_km'] >= AEREO_MINIMO_KM) & (observacoes['tempo_s'] > 0)].copy()
+    df['fator'] = df['rota_km'] / df['aereo_km']
+    df['velocidade_kmh'] = df['rota_km'] / (df['tempo_s'] / 3600)
+    df['uf'] = df['uf'].fillna('').astype(str)
+    df['regiao'] = df['uf'].map(REGIAO_DA_UF).fillna('')
+
+    def resumir(grupos):
+        agregado = grupos.agg(
+            n=('fator', 'size'),
+            **{nome: ('fator', lambda s, q=q: s.quantile(q)) for nome, q in QUANTIS.items()},
+            velocidade_kmh=('velocidade_kmh', 'median'),
+        )
+        return agregado[agregado['n'] >= MIN_OBSERVACOES]
+
+    partes = [resumir(df[df['uf'] != ''].groupby('uf')), resumir(df[df['regiao'] != ''].groupby('regiao'))]
+    if len(df) >= MIN_OBSERVACOES:
+        partes.append(resumir(df.assign(grupo=BRASIL).groupby('grupo')))
+    modelo = pd.concat(partes)
+    return modelo[~modelo.index.duplicated()]
+
+
+def parametros_por_uf(modelo, ufs):
+    """
+    Parâmetros do modelo para cada UF informada, usando o nível mais específico com
+    observações suficientes (UF, depois região, depois Brasil, depois PARAMETROS_PADRAO).
+    Retorna um DataFrame alinhado a `ufs`.
+    """
+    codigos, unicas = pd.factorize(pd.Series(ufs, dtype=object).fillna(''))
+    padrao = pd.Series(PARAMETROS_PADRAO)
+    tabela = []
+    for uf in map(normalizar_uf, unicas):
+        for grupo in (uf, REGIAO_DA_UF.get(uf), BRASIL):
+            if grupo and grupo in modelo.index:
+                tabela.append(modelo.loc[grupo])
+                break
+        else:
+            tabela.append(padrao)
+    if not tabela:
+        return pd.DataFrame(columns=list(PARAMETROS_PADRAO))
+    return pd.DataFrame(tabela).iloc[codigos].reset_index(drop=True)
+
+
+def versao_modelo(modelo):
+    """Impressão digital do modelo ajustado, para invalidar os agregados em cache quando ele é reajustado."""
+    if modelo.empty:
+        return 0
+    return int(pd.util.hash_pandas_object(modelo, index=True).sum())
+
+
+def estimar_rotas(aereo_km, parametros):
+    """
+    Distância e tempo de carro estimados a partir da distância aérea (modo degradado,
+    quando o OSRM não responde). `parametros` vem de `parametros_por_uf` e é aplicado
+    por coluna (um técnico por coluna) quando `aereo_km` é uma matriz.
+    Retorna (dist_km, tempo_s, dist_min_km, dist_max_km).
+    """
+    aereo_km = np.asarray(aereo_km, dtype=float)
+    fator = parametros['fator_mediano'].to_numpy(dtype=float)
+    dist_km = aereo_km * fator
+    tempo_s = dist_km / parametros['velocidade_kmh'].to_numpy(dtype=float) * 3600
+    return (dist_km, tempo_s,
+            aereo_km * parametros['fator_min'].to_numpy(dtype=float),
+            aereo_km * parametros['fator_max'].to_numpy(dtype=float))
+
+
+def folga_do_prefiltro(parametros):
+    """
+    Multiplicador do raio aéreo do pré-filtro por técnico: uma rota de carro raramente
+    é menor que fator_min x a distância aérea, então raio_aereo = raio / fator_min.
+    """
+    return 1 / parametros['fator_min'].to_numpy(dtype=float)
+
+
+def ufs_dos_chamados(lat_chamados, lng_chamados, lat_tecnicos, lng_tecnicos, ufs_tecnicos, ufs_conhecidas=None):
+    """
+    UF de cada chamado para o pré-filtro: a informada/reconciliada (`ufs_conhecidas`,
+    '' quando ausente) ou, sem ela, a do técnico mais próximo em linha reta.
+    """
+    idx, _ = tecnico_mais_proximo(np.asarray(lat_chamados, dtype=float), np.asarray(lng_chamados, dtype=float),
+                                  np.asarray(lat_tecnicos, dtype=float), np.asarray(lng_tecnicos, dtype=float))
+    ufs_tecnicos = pd.Series(ufs_tecnicos).map(normalizar_uf).to_numpy(dtype=object)
+    ufs = np.where(idx >= 0, ufs_tecnicos[np.maximum(idx, 0)] if len(ufs_tecnicos) else '', '')
+    if ufs_conhecidas is not None:
+        conhecidas = pd.Series(ufs_conhecidas).map(normalizar_uf).to_numpy(dtype=object)
+        ufs = np.where(conhecidas != '', conhecidas, ufs)
+    return ufs
+
+
+def folga_por_par(modelo, ufs_chamados, ufs_tecnicos):
+    """
+    Folga do pré-filtro para cada par chamado x técnico (matriz n x m): usa o menor
+    fator_min entre a UF do chamado e a do técnico, o raio mais apertado que ainda
+    cobre rotas que cruzam a divisa.
+    """
+    fator_chamado = parametros_por_uf(modelo, ufs_chamados)['fator_min'].to_numpy(dtype=float)
+    fator_tecnico = parametros_por_uf(modelo, ufs_tecnicos)['fator_min'].to_numpy(dtype=float)
+    return 1 / np.minimum(fator_chamado[:, None], fator_tecnico[None, :])
+
+
+def avaliar_prefiltro(observacoes, raios=RAIOS_AVALIACAO, fracao_teste=0.3, semente=0):
+    """
+    Compara o pré-filtro adaptativo com a folga fixa (FOLGA_FIXA) em observações não
+    usadas no ajuste. A referência exaustiva é o conjunto de pares com rota real <= raio;
+    'recall' é a fração desses pares que passa no pré-filtro e 'candidatos' quantos pares
+    seriam roteados. As observações da matriz por município são exaustivas; as das buscas
+    já passaram pelo pré-filtro da época e tendem a superestimar o recall.
+    Retorna um DataFrame com uma linha por raio.
+    """
+    df = observacoes[observacoes['aereo_km'] >= AEREO_MINIMO_KM].reset_index(drop=True)
+    teste = np.random.default_rng(semente).random(len(df)) < fracao_teste
+    modelo = ajustar_modelo(df[~teste])
+    df = df[teste].reset_index(drop=True)
+    folga = folga_do_prefiltro(parametros_por_uf(modelo, df['uf']))
+    aereo = df['aereo_km'].to_numpy(dtype=float)
+    rota = df['rota_km'].to_numpy(dtype=float)
+
+    linhas = []
+    for raio in raios:
+        referencia = rota <= raio
+        fixo = aereo <= raio * FOLGA_FIXA
+        adaptativo = aereo <= raio * folga
+        n_ref = max(int(referencia.sum()), 1)
+        linhas.append({
+            'raio_km': raio,
+            'pares_no_raio': int(referencia.sum()),
+            'candidatos_fixo': int(fixo.sum()),
+            'candidatos_adaptativo': int(adaptativo.sum()),
+            'reducao_candidatos': 1 - adaptativo.sum() / max(int(fixo.sum()), 1),
+            'recall_fixo': (fixo & referencia).sum() / n_ref,
+            'recall_adaptativo': (adaptativo & referencia).sum() / n_ref,
+        })
+    return pd.DataFrame(linhas)
+
+
+def estimador(parametros):
+    """Função aereo_km -> (dist_km, tempo_s) pelo fator mediano, para `montar_matriz_chamados(estimar=...)`."""
+    return lambda aereo_km: estimar_rotas(aereo_km, parametros)[:2]
+
+
+def observacoes_da_matriz(matriz, df_municipios, df_tecnicos, limite=MAX_OBSERVACOES, semente=0):
+    """
+    Amostra de rotas da matriz técnico x município (matriz_municipios.py) no formato
+    do histórico (UF do técnico), para ajustar o modelo antes de haver buscas registradas.
+    """
+    from matriz_municipios import chaves_tecnicos
+
+    if matriz is None or df_municipios.empty:
+        return pd.DataFrame(columns=COLUNAS_OBSERVACOES)
+    linhas = [(k, chave) for chave, k in matriz['linha_tecnico'].items()]
+    municipios = df_municipios.set_index('codigo_ibge')
+    colunas = np.array([matriz['coluna_municipio'].get(int(c), -1) for c in municipios.index])
+    validas = np.flatnonzero(colunas >= 0)
+    if not linhas or not len(validas):
+        return pd.DataFrame(columns=COLUNAS_OBSERVACOES)
+
+    rng = np.random.default_rng(semente)
+    n = min(limite, len(linhas) * len(validas))
+    k_linha = rng.integers(0, len(linhas), n)
+    k_mun = validas[rng.integers(0, len(validas), n)]
+
+    # A chave do técnico guarda as coordenadas: "nome|lat|lng"
+    coords = np.array([[float(v) for v in chave.rsplit('|', 2)[1:]] for _, chave in linhas])
+    linha_matriz = np.array([k for k, _ in linhas])[k_linha]
+    rota = np.asarray(matriz['distancias'][linha_matriz, colunas[k_mun]], dtype=float)
+    minutos = np.asarray(matriz['tempos'][linha_matriz, colunas[k_mun]], dtype=float)
+    aereo = haversine_vetorizado(coords[k_linha, 0], coords[k_linha, 1],
+                                 municipios['latitude'].to_numpy(dtype=float)[k_mun],
+                                 municipios['longitude'].to_numpy(dtype=float)[k_mun])
+    uf_da_chave = dict(zip(chaves_tecnicos(df_tecnicos), df_tecnicos['uf'].map(normalizar_uf)))
+    ufs = np.array([uf_da_chave.get(chave, '') for _, chave in linhas], dtype=object)
+    df = pd.DataFrame({
+        'uf': ufs[k_linha],
+        'aereo_km': aereo, 'rota_km': rota, 'tempo_s': minutos * 60,
+    })
+    return df[np.isfinite(df['rota_km']) & (minutos < np.iinfo(np.uint16).max)].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # Uso: python desvio.py [rotas_observadas.csv]
+    arquivo = sys.argv[1] if len(sys.argv) > 1 else ARQUIVO_OBSERVACOES
+    observacoes = carregar_observacoes(arquivo)
+    print(f"Observações: {len(observacoes)}")
+    if len(observacoes) < MIN_OBSERVACOES:
+        print("Observações insuficientes para ajustar o modelo.")
+        sys.exit(0)
+    print(ajustar_modelo(observacoes).round(3).to_string())
+    print()
+    print(avaliar_prefiltro(observacoes).round(3).to_string(index=False))
@@ -0,0 +1,92 @@
+import pandas as pd
+import numpy as np
+
+# --- VARIÁVEIS GLOBAIS ---
+# Colunas opcionais da planilha de técnicos:
+#   capacidade_diaria -> chamados por dia daquele técnico (vazio = valor global da tela)
+#   habilidades       -> tags separadas por vírgula (ex.: "fibra, cftv, escada")
+#   ativo             -> Sim/Não (Não = férias, afastado ou desligado)
+# Na planilha de chamados, a coluna opcional 'habilidades' lista as tags exigidas.
+COLUNAS_ELEGIBILIDADE = ['capacidade_diaria', 'habilidades', 'ativo']
+VALORES_INATIVO = {'nao', 'não', 'n', 'false', 'falso', '0', 'inativo', 'ferias', 'férias'}
+
+# --- FUNÇÕES ---
+
+def preparar_colunas_elegibilidade(df):
+    """Padroniza as colunas opcionais de elegibilidade, se existirem na planilha de técnicos."""
+    if 'capacidade_diaria' in df.columns:
+        df['capacidade_diaria'] = pd.to_numeric(df['capacidade_diaria'], errors='coerce').astype('Int64')
+    if 'habilidades' in df.columns:
+        df['habilidades'] = df['habilidades'].fillna('').astype(str)
+    if 'ativo' in df.columns:
+        df['ativo'] = ~df['ativo'].astype(str).str.strip().str.lower().isin(VALORES_INATIVO)
+    return df
+
+
+def capacidades_tecnicos(df_tecnicos, capacidade_padrao):
+    """Capacidade diária de cada técnico; sem valor na planilha, usa a capacidade global (0 = ilimitado)."""
+    if 'capacidade_diaria' not in df_tecnicos.columns:
+        return np.full(len(df_tecnicos), capacidade_padrao, dtype=np.int64)
+    cap = pd.to_numeric(df_tecnicos['capacidade_diaria'], errors='coerce')
+    return cap.fillna(capacidade_padrao).clip(lower=0).to_numpy(dtype=np.int64)
+
+
+def tecnicos_ativos(df_tecnicos):
+    """Máscara booleana dos técnicos disponíveis (sem a coluna 'ativo', todos estão)."""
+    if 'ativo' not in df_tecnicos.columns:
+        return np.ones(len(df_tecnicos), dtype=bool)
+    ativo = df_tecnicos['ativo']
+    if ativo.dtype != bool:
+        ativo = ~ativo.astype(str).str.strip().str.lower().isin(VALORES_INATIVO)
+    return ativo.to_numpy(dtype=bool)
+
+
+def _separar_tags(serie):
+    """Converte 'a, B ,c' em ['a', 'b', 'c'] para cada linha."""
+    return serie.fillna('').astype(str).str.lower().str.split(',').map(
+        lambda tags: [t.strip() for t in tags if t.strip()]
+    )
+
+
+def mascaras_de_bits(serie, vocabulario):
+    """
+    Codifica as tags de cada linha em palavras de 64 bits (uint64), uma coluna por
+    grupo de 64 tags do vocabulário. Retorna um array (n_linhas, n_palavras).
+    """
+    posicao = {tag: k for k, tag in enumerate(vocabulario)}
+    n_palavras = max(1, (len(vocabulario) + 63) // 64)
+    bits = np.zeros((len(serie), n_palavras), dtype=np.uint64)
+    for i, tags in enumerate(_separar_tags(serie)):
+        for tag in tags:
+            k = posicao.get(tag)
+            if k is not None:
+                bits[i, k // 64] |= np.uint64(1) << np.uint64(k % 64)
+    return bits
+
+
+def matriz_elegibilidade(df_chamados, df_tecnicos):
+    """
+    Matriz booleana chamados x técnicos: o técnico está ativo e possui TODAS as
+    habilidades exigidas pelo chamado. As máscaras de bits são montadas uma vez e a
+    comparação é feita para todos os pares de uma só vez:
+    (exigidas & ~possuídas) == 0.
+    """
+    n, m = len(df_chamados), len(df_tecnicos)
+    elegiveis = np.broadcast_to(tecnicos_ativos(df_tecnicos), (n, m)).copy()
+
+    if 'habilidades' not in df_chamados.columns:
+        return elegiveis
+
+    exigidas = _separar_tags(df_chamados['habilidades'])
+    vocabulario = sorted({tag for tags in exigidas for tag in tags})
+    if not vocabulario:
+        return elegiveis
+
+    bits_chamados = mascaras_de_bits(df_chamados['habilidades'], vocabulario)
+    if 'habilidades' in df_tecnicos.columns:
+        bits_tecnicos = mascaras_de_bits(df_tecnicos['habilidades'], vocabulario)
+    else:
+        bits_tecnicos = np.zeros((m, bits_chamados.shape[1]), dtype=np.uint64)
+
+    faltando = bits_chamados[:, None, :] & ~bits_tecnicos[None, :, :]
+    return elegiveis & (faltando == 0).all(axis=2)
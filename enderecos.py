@@ -0,0 +1,103 @@
+import re
+import string
+import unicodedata
+import pandas as pd
+
+# --- VARIÁVEIS GLOBAIS ---
+# Abreviações comuns em endereços brasileiros (já sem acento e sem pontuação)
+ABREVIACOES = {
+    'av': 'avenida', 'avn': 'avenida', 'r': 'rua', 'al': 'alameda', 'tv': 'travessa', 'trav': 'travessa',
+    'pc': 'praca', 'pca': 'praca', 'rod': 'rodovia', 'est': 'estrada', 'estr': 'estrada', 'lg': 'largo',
+    'jd': 'jardim', 'jard': 'jardim', 'vl': 'vila', 'pq': 'parque', 'cj': 'conjunto', 'conj': 'conjunto',
+    'res': 'residencial', 'dr': 'doutor', 'prof': 'professor', 'eng': 'engenheiro', 'gov': 'governador',
+    'pres': 'presidente', 'mal': 'marechal', 'sen': 'senador', 'dep': 'deputado', 'cel': 'coronel',
+    'gen': 'general', 'sta': 'santa', 'sto': 'santo',
+}
+UFS = ['ac', 'al', 'ap', 'am', 'ba', 'ce', 'df', 'es', 'go', 'ma', 'mt', 'ms', 'mg', 'pa', 'pb', 'pr',
+       'pe', 'pi', 'rj', 'rn', 'rs', 'ro', 'rr', 'sc', 'sp', 'se', 'to']
+
+_RE_CEP = re.compile(r'(?<!\d)(\d{2})\.?(\d{3})[\s-]?(\d{3})(?!\d)')
+# Tabela (bytes) que troca pontuação por espaço, inclusive o '.' de "Av." e o '/' de "Belém/PA".
+# Acentos são removidos antes, por decomposição Unicode (NFKD) + descarte do que não é ASCII.
+_PONTUACAO = bytes(ord(' ') if chr(i) in string.punctuation else i for i in range(256))
+_MARCADORES_NUMERO = {'n', 'no', 'num', 'numero'}
+_DESCARTAVEIS = _MARCADORES_NUMERO | {'cep'}
+_UFS = set(UFS)
+# Nomes de município têm até 7 palavras ('sao jose do vale do rio preto')
+MAX_PALAVRAS_CIDADE = 7
+
+# --- FUNÇÕES ---
+
+def _uf_pela_cidade(saida, uf_por_cidade):
+    """UF do município no fim do endereço, se o nome só existir numa UF ('' se não achar)."""
+    for n in range(min(MAX_PALAVRAS_CIDADE, len(saida) - 1), 0, -1):
+        uf = uf_por_cidade.get(' '.join(saida[-n:]))
+        if uf:
+            return uf.lower()
+    return ''
+
+
+def _canonicalizar(texto, uf_por_cidade=None):
+    """Canonicaliza um endereço. Retorna (consulta, cep, chave)."""
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').lower().decode()
+
+    cep = ''
+    m = _RE_CEP.search(texto)
+    if m:
+        cep = f"{m.group(1)}{m.group(2)}-{m.group(3)}"
+        texto = texto[:m.start()] + ' ' + texto[m.end():]
+
+    tokens = texto.encode().translate(_PONTUACAO).decode().split()
+    if not _DESCARTAVEIS.isdisjoint(tokens):
+        # "CEP" solto e "nº 1000" / "n. 1000" -> "1000"
+        tokens = [t for k, t in enumerate(tokens)
+                  if t != 'cep' and not (t in _MARCADORES_NUMERO and tokens[k + 1:k + 2] and tokens[k + 1][:1].isdigit())]
+    # A UF final é reconhecida antes da expansão das abreviações ("AL" é Alagoas, não "alameda")
+    tem_uf = len(tokens) > 1 and tokens[-1] in _UFS
+    saida = [ABREVIACOES.get(t, t) for t in (tokens[:-1] if tem_uf else tokens)]
+    if tem_uf:
+        saida.append(tokens[-1])
+    elif uf_por_cidade:
+        # Sem UF, mas a cidade só existe numa UF: "..., São Paulo" e "... SAO PAULO SP" viram
+        # o mesmo endereço. Cidades homônimas ("Bom Jesus") ficam sem UF e não se misturam
+        uf = _uf_pela_cidade(saida, uf_por_cidade)
+        if uf:
+            saida.append(uf)
+
+    # A UF fica na chave: "Bom Jesus, PI" e "Bom Jesus, RS" são endereços diferentes
+    consulta = ' '.join(saida)
+    chave = f"{consulta} {cep}" if cep else consulta
+    return consulta, cep, chave
+
+
+def canonicalizar_enderecos(enderecos, uf_por_cidade=None):
+    """
+    Forma canônica de uma coluna de endereços: minúsculas, sem acento, CEP extraído,
+    sem pontuação, abreviações expandidas (Av. -> avenida, R. -> rua...) e espaços normalizados.
+    Sem UF no fim do endereço, `uf_por_cidade` ({nome normalizado: UF} dos municípios de nome
+    único, ver municipios.construir_indice) completa a UF pela cidade.
+    Cada texto distinto é processado uma única vez (uploads costumam repetir endereços).
+
+    Retorna um DataFrame alinhado à entrada com:
+    - 'consulta': texto canônico (com a UF final, se houver), usado na busca do geocodificador;
+    - 'cep': CEP no formato 00000-000 ('' se não houver);
+    - 'chave': chave de cache/deduplicação (o texto canônico, com a UF, mais o CEP).
+    """
+    serie = pd.Series(enderecos)
+    codigos, unicos = pd.factorize(serie.astype(object).where(serie.notna(), ''), sort=False)
+    tabela = pd.DataFrame([_canonicalizar(str(t), uf_por_cidade) for t in unicos], columns=['consulta', 'cep', 'chave'])
+    if tabela.empty:
+        return pd.DataFrame(columns=['consulta', 'cep', 'chave'], index=serie.index)
+    resultado = tabela.iloc[codigos].reset_index(drop=True)
+    resultado.index = serie.index
+    return resultado
+
+
+def canonicalizar_endereco(endereco, uf_por_cidade=None):
+    """Versão para um único endereço (busca individual). Retorna (consulta, cep, chave)."""
+    return _canonicalizar(str(endereco or ''), uf_por_cidade)
+
+
+def consulta_geocodificador(consulta, cep):
+    """Texto enviado ao Nominatim: o endereço canônico e, se houver, o CEP."""
+    return f"{consulta}, {cep}" if cep else consulta
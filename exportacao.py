@@ -0,0 +1,64 @@
+import io
+
+# --- VARIÁVEIS GLOBAIS ---
+# Formatos oferecidos para download: extensão e MIME type
+FORMATOS_EXPORTACAO = {
+    "Excel (.xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (.csv)": ("csv", "text/csv"),
+    "Parquet (.parquet)": ("parquet", "application/octet-stream"),
+}
+# Acima disso o Excel fica lento para abrir; a tela sugere CSV/Parquet
+LINHAS_SUGERIR_CSV = 50_000
+TAMANHO_BLOCO = 10_000
+
+# --- FUNÇÕES ---
+
+def _blocos_de_linhas(df, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera as linhas do DataFrame em blocos, já convertidas para tipos Python (NA -> None)."""
+    for inicio in range(0, len(df), tamanho_bloco):
+        bloco = df.iloc[inicio:inicio + tamanho_bloco].astype(object)
+        bloco = bloco.where(bloco.notna(), None)
+        yield from bloco.itertuples(index=False, name=None)
+
+
+def exportar_excel(df, nome_aba="Resultados"):
+    """
+    Gera o .xlsx em modo write-only do openpyxl: as linhas são gravadas em sequência,
+    sem montar a planilha inteira na memória (uso constante, mesmo com muitos chamados).
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=nome_aba)
+    ws.append([str(c) for c in df.columns])
+    for linha in _blocos_de_linhas(df):
+        ws.append(linha)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def exportar_csv(df):
+    """CSV no padrão do Excel brasileiro (';' como separador e ',' decimal), com BOM UTF-8."""
+    return df.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig')
+
+
+def exportar_parquet(df):
+    """Parquet (pyarrow) para execuções grandes; colunas de texto misto viram string."""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype('string')
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, engine='pyarrow')
+    return buffer.getvalue()
+
+
+def exportar(df, formato):
+    """Gera os bytes do arquivo no formato escolhido (chave de FORMATOS_EXPORTACAO)."""
+    extensao, _ = FORMATOS_EXPORTACAO[formato]
+    if extensao == "xlsx":
+        return exportar_excel(df)
+    if extensao == "csv":
+        return exportar_csv(df)
+    return exportar_parquet(df)
@@ -0,0 +1,317 @@
+import pandas as pd
+import numpy as np
+
+from roteamento import tecnico_mais_proximo
+from sequenciamento import FATOR_DESVIO_PADRAO
+from municipios import normalizar_nome, reconciliar_cidades
+from geocodificacao import geocodificar_cidade
+from coordenadas import coordenadas_confiaveis
+from desvio import estimar_rotas, parametros_por_uf
+
+# --- VARIÁVEIS GLOBAIS ---
+# Planilha mensal de faturamento (ex.: outubro/Faturamento Outubro 2025_ Previa.xlsx)
+ABA_FATURAMENTO = 'SAQUE E PAGUE - Chamados'
+# Cabeçalho original -> nome interno. O cabeçalho fica abaixo de algumas linhas em branco.
+COLUNAS_FATURAMENTO = {
+    'DATA ATIVIDADE': 'data_atividade',
+    'CHAMADO Nº': 'chamado',
+    'Coluna1': 'tipo',
+    'À FATURAR': 'valor_faturado',
+    'GESTOR EASY': 'gestor',
+    'CIDADE': 'cidade',
+    'ESTADO': 'uf',
+    'OBS': 'obs',
+    'OBS2': 'obs2',
+}
+LINHAS_BUSCA_CABECALHO = 20
+# Diferença (R$) tolerada entre o faturado e o valor esperado (para menos ou para mais) antes de sinalizar
+TOLERANCIA_RS = 20.0
+# O À FATURAR é o preço do atendimento, não só o deslocamento: sem uma taxa de serviço informada,
+# a taxa usual é a mediana de (faturado - deslocamento) dos chamados do mesmo técnico mais próximo,
+# calculada só com pelo menos MIN_CHAMADOS_TAXA chamados. Em torno dela, só os valores atípicos
+# (mais que FATOR_ATIPICO desvios absolutos medianos, ou a tolerância) são sinalizados.
+MIN_CHAMADOS_TAXA = 3
+FATOR_ATIPICO = 3.0
+# Campos da planilha que compõem a impressão digital de cada linha (detecção de alterações entre revisões)
+CAMPOS_IMPRESSAO = list(COLUNAS_FATURAMENTO.values())
+# Colunas calculadas pela conciliação (reaproveitadas nas linhas que não mudaram)
+COLUNAS_LOCALIZACAO = ['Latitude_Cidade', 'Longitude_Cidade', 'Técnico_Mais_Próximo', 'Cidade_Técnico', 'UF_Técnico',
+                       'Distância_Aérea_km', 'Distância_Estimada_km', 'Custo_Deslocamento_RS']
+COLUNAS_CONCILIACAO = COLUNAS_LOCALIZACAO + ['Valor_Esperado_RS', 'Diferença_RS', 'Conciliação']
+# Agrupamentos dos totais do fechamento: rótulo -> coluna
+AGRUPAMENTOS_TOTAIS = {'Gestor': 'gestor', 'UF': 'uf', 'Técnico': 'Técnico_Mais_Próximo'}
+
+# Tipos de alteração entre revisões
+ALTERACAO_NOVO = 'NOVO'
+ALTERACAO_REMOVIDO = 'REMOVIDO'
+ALTERACAO_ALTERADO = 'ALTERADO'
+
+# Status da conciliação (categóricos, como em resultados.py)
+CONCILIACAO_OK = 'OK'
+CONCILIACAO_SEM_LOCALIZACAO = 'SEM_LOCALIZACAO'
+CONCILIACAO_SEM_TECNICO = 'SEM_TECNICO'
+CONCILIACAO_ABAIXO_ESPERADO = 'ABAIXO_ESPERADO'
+CONCILIACAO_ACIMA_ESPERADO = 'ACIMA_ESPERADO'
+CODIGOS_CONCILIACAO = [CONCILIACAO_OK, CONCILIACAO_SEM_LOCALIZACAO, CONCILIACAO_SEM_TECNICO,
+                       CONCILIACAO_ABAIXO_ESPERADO, CONCILIACAO_ACIMA_ESPERADO]
+ROTULOS_CONCILIACAO = {
+    CONCILIACAO_OK: 'OK',
+    CONCILIACAO_SEM_LOCALIZACAO: 'Cidade não localizada',
+    CONCILIACAO_SEM_TECNICO: 'Nenhum técnico com coordenadas',
+    CONCILIACAO_ABAIXO_ESPERADO: 'Valor faturado abaixo do esperado',
+    CONCILIACAO_ACIMA_ESPERADO: 'Valor faturado acima do esperado',
+}
+
+# --- FUNÇÕES ---
+
+def _linha_cabecalho(arquivo, aba):
+    """Posição da linha de cabeçalho (a que contém 'CHAMADO Nº')."""
+    topo = pd.read_excel(arquivo, sheet_name=aba, header=None, nrows=LINHAS_BUSCA_CABECALHO)
+    for i, linha in enumerate(topo.itertuples(index=False)):
+        if any(str(v).strip() == 'CHAMADO Nº' for v in linha):
+            return i
+    raise ValueError(f"Cabeçalho 'CHAMADO Nº' não encontrado na aba '{aba}'.")
+
+
+def carregar_faturamento(arquivo, aba=ABA_FATURAMENTO):
+    """
+    Lê a aba de chamados da planilha de faturamento, com os nomes internos de
+    COLUNAS_FATURAMENTO. Linhas sem número de chamado (totais, rodapé) são descartadas.
+    """
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    cabecalho = _linha_cabecalho(arquivo, aba)
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    df = pd.read_excel(arquivo, sheet_name=aba, header=cabecalho)
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.rename(columns=COLUNAS_FATURAMENTO)
+
+    for col in COLUNAS_FATURAMENTO.values():
+        if col not in df.columns:
+            df[col] = pd.NA
+
+    df = df[df['chamado'].notna()].reset_index(drop=True)
+    df['chamado'] = df['chamado'].astype('string').str.strip().str.replace(r'\.0$', '', regex=True)
+    df['data_atividade'] = pd.to_datetime(df['data_atividade'], errors='coerce')
+    df['valor_faturado'] = pd.to_numeric(df['valor_faturado'], errors='coerce')
+    for col in ['tipo', 'gestor', 'cidade', 'uf', 'obs', 'obs2']:
+        df[col] = df[col].astype('string').str.strip()
+    df['uf'] = df['uf'].str.upper()
+    df = df[list(COLUNAS_FATURAMENTO.values())]
+    return df.assign(**chaves_e_impressoes(df))
+
+
+def chaves_e_impressoes(df):
+    """
+    Chave estável de cada linha ('chamado' + ocorrência, pois o mesmo número pode
+    aparecer mais de uma vez) e impressão digital (hash de 64 bits dos campos da
+    planilha): mesma chave com impressão diferente = linha alterada.
+    """
+    ocorrencia = df.groupby('chamado', sort=False).cumcount().astype('string')
+    return {
+        'chave': (df['chamado'] + '#' + ocorrencia).astype('string'),
+        'impressao': pd.util.hash_pandas_object(df[CAMPOS_IMPRESSAO], index=False).to_numpy(),
+    }
+
+
+def localizar_cidades(cidades, ufs, indice=None):
+    """
+    Coordenadas de cada cidade. Usa o centroide do cadastro de municípios quando há
+    correspondência no `indice` e, para o restante, o geocodificador com cache
+    (uma consulta por par cidade/UF distinto).
+    Retorna (lat, lng) como arrays alinhados à entrada (NaN quando não localizada).
+    """
+    cidades = pd.Series(cidades).reset_index(drop=True)
+    ufs = pd.Series(ufs).reset_index(drop=True)
+    lat = np.full(len(cidades), np.nan)
+    lng = np.full(len(cidades), np.nan)
+
+    if indice is not None and not indice['municipios'].empty:
+        mun = reconciliar_cidades(indice, cidades, ufs)
+        lat = np.array(mun['latitude_municipio'], dtype=float)
+        lng = np.array(mun['longitude_municipio'], dtype=float)
+
+    pendentes = np.isnan(lat) & (cidades.map(normalizar_nome) != '').to_numpy()
+    if pendentes.any():
+        pares = pd.DataFrame({'cidade': cidades.fillna(''), 'uf': ufs.fillna('')})[pendentes]
+        coordenadas = {
+            par: geocodificar_cidade(*par)
+            for par in pares.drop_duplicates().itertuples(index=False, name=None)
+        }
+        achados = [coordenadas[par] for par in pares.itertuples(index=False, name=None)]
+        lat[pendentes] = [c[0] if c[0] is not None else np.nan for c in achados]
+        lng[pendentes] = [c[1] if c[1] is not None else np.nan for c in achados]
+    return lat, lng
+
+
+def conciliar_faturamento(df_faturamento, df_tecnicos, custo_por_km, indice=None, tolerancia_rs=TOLERANCIA_RS,
+                          modelo=None, taxa_servico_rs=None):
+    """
+    Cruza cada chamado faturado com o técnico mais próximo da cidade do chamado e
+    estima o custo de deslocamento: distância aérea x fator de desvio (estrada) x
+    `custo_por_km` (que já considera ida e volta). O fator vem do `modelo` de desvio,
+    pela UF do chamado (ou do técnico, sem UF), ou é FATOR_DESVIO_PADRAO sem modelo.
+    Os chamados são classificados por `classificar_conciliacao`.
+    """
+    df = df_faturamento.reset_index(drop=True).copy()
+    tecnicos = df_tecnicos.copy()
+    tecnicos['latitude'] = pd.to_numeric(tecnicos['latitude'], errors='coerce')
+    tecnicos['longitude'] = pd.to_numeric(tecnicos['longitude'], errors='coerce')
+    tecnicos = tecnicos[coordenadas_confiaveis(tecnicos)].reset_index(drop=True)
+
+    lat, lng = localizar_cidades(df['cidade'], df['uf'], indice)
+    j, dist_aerea = tecnico_mais_proximo(
+        lat, lng, tecnicos['latitude'].to_numpy(dtype=float), tecnicos['longitude'].to_numpy(dtype=float)
+    )
+    achou = j >= 0
+
+    def do_tecnico(coluna):
+        if coluna not in tecnicos.columns or tecnicos.empty:
+            return pd.Series(pd.NA, index=df.index, dtype='string')
+        return pd.Series(tecnicos[coluna].astype('string').to_numpy()[np.where(achou, j, 0)], dtype='string').where(achou)
+
+    if modelo is not None and not modelo.empty:
+        ufs = df['uf'].astype('string').str.strip().fillna('')
+        ufs = ufs.mask(ufs == '', do_tecnico('uf').fillna(''))
+        dist_estimada = estimar_rotas(dist_aerea, parametros_por_uf(modelo, ufs))[0]
+    else:
+        dist_estimada = dist_aerea * FATOR_DESVIO_PADRAO
+
+    df = df.assign(**{
+        'Latitude_Cidade': lat,
+        'Longitude_Cidade': lng,
+        'Técnico_Mais_Próximo': do_tecnico('tecnico'),
+        'Cidade_Técnico': do_tecnico('cidade'),
+        'UF_Técnico': do_tecnico('uf'),
+        'Distância_Aérea_km': dist_aerea,
+        'Distância_Estimada_km': dist_estimada,
+        'Custo_Deslocamento_RS': dist_estimada * custo_por_km,
+    })
+    return classificar_conciliacao(df, tolerancia_rs, taxa_servico_rs)
+
+
+def classificar_conciliacao(df_conciliado, tolerancia_rs=TOLERANCIA_RS, taxa_servico_rs=None):
+    """
+    Valor esperado de cada chamado (taxa de serviço + custo de deslocamento) e status da
+    conciliação. Com `taxa_servico_rs`, o chamado é sinalizado quando o faturado fica abaixo
+    ou acima do esperado por mais que a tolerância. Sem ela, a taxa é a usual do técnico mais
+    próximo (ver MIN_CHAMADOS_TAXA): é sinalizado o faturado que não cobre o deslocamento ou
+    que fica atipicamente abaixo ou acima do esperado. A taxa usual depende dos outros
+    chamados, então a classificação é sempre refeita sobre a revisão inteira.
+    """
+    df = df_conciliado.copy()
+    valor = df['valor_faturado'].to_numpy(dtype=float)
+    custo = df['Custo_Deslocamento_RS'].to_numpy(dtype=float)
+    localizado = ~np.isnan(df['Latitude_Cidade'].to_numpy(dtype=float))
+    com_tecnico = ~np.isnan(df['Distância_Aérea_km'].to_numpy(dtype=float))
+
+    if taxa_servico_rs is not None:
+        esperado = custo + float(taxa_servico_rs)
+        abaixo = valor < esperado - tolerancia_rs
+        acima = valor > esperado + tolerancia_rs
+    else:
+        # Taxa usual e desvio absoluto mediano do faturado além do deslocamento, por técnico mais próximo
+        tecnico = df['Técnico_Mais_Próximo'].astype('string').fillna('')
+        residuo = pd.Series(valor - custo, index=df.index).where(com_tecnico)
+        grupos = residuo.groupby(tecnico)
+        taxa = grupos.transform('median')
+        desvio = (residuo - taxa).abs().groupby(tecnico).transform('median')
+        suficiente = (grupos.transform('count') >= MIN_CHAMADOS_TAXA).to_numpy()
+        taxa = taxa.to_numpy(dtype=float)
+        esperado = np.where(suficiente, custo + taxa, np.nan)
+        margem = np.maximum(tolerancia_rs, FATOR_ATIPICO * desvio.to_numpy(dtype=float))
+        abaixo = (valor < custo - tolerancia_rs) | (suficiente & (valor < esperado - margem))
+        acima = suficiente & (valor > esperado + margem)
+
+    condicoes = [~localizado, ~com_tecnico, abaixo, acima]
+    codigos = np.select(condicoes, CODIGOS_CONCILIACAO[1:], default=CONCILIACAO_OK)
+    return df.assign(**{
+        'Valor_Esperado_RS': esperado,
+        'Diferença_RS': valor - np.where(np.isnan(esperado), custo, esperado),
+        'Conciliação': pd.Categorical(codigos, categories=CODIGOS_CONCILIACAO),
+    })
+
+
+def resumir_conciliacao(df_conciliado):
+    """Contagem e valor faturado por status da conciliação."""
+    return df_conciliado.groupby('Conciliação', observed=False).agg(
+        Chamados=('chave', 'size'),
+        Valor_Faturado_RS=('valor_faturado', 'sum'),
+        Custo_Deslocamento_RS=('Custo_Deslocamento_RS', 'sum'),
+    ).rename(index=ROTULOS_CONCILIACAO).reset_index()
+
+
+def conciliar_revisao(df_revisao, df_tecnicos, custo_por_km, indice=None, tolerancia_rs=TOLERANCIA_RS,
+                      conciliado_anterior=None, modelo=None, taxa_servico_rs=None):
+    """
+    Concilia uma revisão do fechamento reaproveitando a revisão anterior já conciliada:
+    só as linhas novas ou com impressão digital diferente são localizadas de novo; a
+    classificação é refeita sobre a revisão inteira.
+    Retorna (DataFrame conciliado, quantidade de linhas recalculadas).
+    """
+    df = df_revisao.reset_index(drop=True)
+    if conciliado_anterior is None or conciliado_anterior.empty:
+        return conciliar_faturamento(df, df_tecnicos, custo_por_km, indice, tolerancia_rs, modelo, taxa_servico_rs), len(df)
+
+    anterior = conciliado_anterior.drop_duplicates('chave').set_index('chave')
+    mesma_impressao = df['chave'].map(anterior['impressao']).to_numpy() == df['impressao'].to_numpy()
+    recalcular = ~mesma_impressao
+
+    calculado = conciliar_faturamento(df[recalcular], df_tecnicos, custo_por_km, indice, tolerancia_rs, modelo)
+    reaproveitado = df[mesma_impressao].join(anterior[COLUNAS_LOCALIZACAO], on='chave')
+    resultado = pd.concat([reaproveitado, calculado[df.columns.tolist() + COLUNAS_LOCALIZACAO].set_axis(df.index[recalcular])]).sort_index()
+    return classificar_conciliacao(resultado, tolerancia_rs, taxa_servico_rs), int(recalcular.sum())
+
+
+def comparar_revisoes(df_anterior, df_atual):
+    """
+    Relatório de diferenças entre duas revisões, linha a linha (pela chave):
+    chamados novos, removidos e alterados, com os campos alterados e a variação do valor.
+    """
+    antes = df_anterior.drop_duplicates('chave').set_index('chave')
+    depois = df_atual.drop_duplicates('chave').set_index('chave')
+    chaves = antes.index.union(depois.index, sort=False)
+    antes = antes.reindex(chaves)
+    depois = depois.reindex(chaves)
+
+    existe_antes = antes['impressao'].notna().to_numpy()
+    existe_depois = depois['impressao'].notna().to_numpy()
+    alterado = existe_antes & existe_depois & (antes['impressao'].to_numpy() != depois['impressao'].to_numpy())
+    mudou = alterado | (existe_antes != existe_depois)
+
+    campos = np.array([c for c in CAMPOS_IMPRESSAO if c != 'chamado'])
+    diferente = np.column_stack([
+        ~(antes[c].isna().to_numpy() & depois[c].isna().to_numpy())
+        & (antes[c].astype('string').fillna('') != depois[c].astype('string').fillna('')).to_numpy()
+        for c in campos
+    ])
+    campos_alterados = [', '.join(campos[linha]) if a else '' for linha, a in zip(diferente, alterado)]
+
+    relatorio = pd.DataFrame({
+        'chamado': depois['chamado'].fillna(antes['chamado']),
+        'Alteração': np.select([~existe_antes, ~existe_depois], [ALTERACAO_NOVO, ALTERACAO_REMOVIDO], default=ALTERACAO_ALTERADO),
+        'Campos_Alterados': campos_alterados,
+        'Valor_Anterior_RS': antes['valor_faturado'].to_numpy(dtype=float),
+        'Valor_Atual_RS': depois['valor_faturado'].to_numpy(dtype=float),
+        'gestor': depois['gestor'].fillna(antes['gestor']),
+        'cidade': depois['cidade'].fillna(antes['cidade']),
+        'uf': depois['uf'].fillna(antes['uf']),
+    }, index=chaves)[mudou]
+    relatorio['Diferença_Valor_RS'] = relatorio['Valor_Atual_RS'].fillna(0) - relatorio['Valor_Anterior_RS'].fillna(0)
+    return relatorio.reset_index(drop=True)
+
+
+def totais_faturamento(df_conciliado, agrupamento):
+    """Totais do fechamento por gestor, UF ou técnico (chave de AGRUPAMENTOS_TOTAIS)."""
+    coluna = AGRUPAMENTOS_TOTAIS[agrupamento]
+    df = df_conciliado.assign(
+        _sinalizado=df_conciliado['Conciliação'] != CONCILIACAO_OK,
+        **{coluna: df_conciliado[coluna].fillna('N/A')},
+    )
+    return df.groupby(coluna, sort=False).agg(
+        Chamados=('chave', 'size'),
+        Valor_Faturado_RS=('valor_faturado', 'sum'),
+        Custo_Deslocamento_RS=('Custo_Deslocamento_RS', 'sum'),
+        Sinalizados=('_sinalizado', 'sum'),
+    ).sort_values('Valor_Faturado_RS', ascending=False).reset_index().rename(columns={coluna: agrupamento})
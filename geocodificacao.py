@@ -0,0 +1,185 @@
+import re
+import time
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+from enderecos import canonicalizar_enderecos
+
+# --- VARIÁVEIS GLOBAIS ---
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# Adicionar um User-Agent é uma boa prática
+NOMINATIM_HEADERS = {'User-Agent': 'LocalizadorDeTecnicosApp/1.0 (Streamlit/Python)'}
+# Política de uso do Nominatim público: no máximo 1 requisição por segundo
+NOMINATIM_INTERVALO_S = 1.0
+_ultima_chamada = [0.0]
+
+# Precisão obtida, da melhor para a pior (gravada na coluna 'precisao_geocod')
+PRECISAO_ESTRUTURADA = 'estruturada'
+PRECISAO_TEXTO_LIVRE = 'texto_livre'
+PRECISAO_CEP = 'centroide_cep'
+PRECISAO_CIDADE = 'centroide_cidade'
+# Marcadores de "não informado" usados na planilha de técnicos
+VALORES_NAO_INFORMADOS = {'n/i', 'ni', 's/n', 'sn', '-', 'nan', 'none', 'n/a'}
+
+# --- FUNÇÕES ---
+
+def _consultar_nominatim(params):
+    """Executa uma busca no Nominatim e retorna (lat, lng) ou (None, None)."""
+    import requests
+
+    espera = _ultima_chamada[0] + NOMINATIM_INTERVALO_S - time.monotonic()
+    if espera > 0:
+        time.sleep(espera)
+
+    params = {**params, "format": "json", "limit": 1, "addressdetails": 0} # addressdetails=0 diminui o payload
+    try:
+        response = requests.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS, timeout=10)
+        response.raise_for_status() # Lança exceção para códigos de erro HTTP
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None, None
+    finally:
+        _ultima_chamada[0] = time.monotonic()
+
+    if data:
+        try:
+            return float(data[0]['lat']), float(data[0]['lon'])
+        except (KeyError, TypeError, ValueError):
+            return None, None
+    return None, None
+
+
+@st.cache_data(show_spinner=False)
+def geocodificar_endereco(endereco): # USA NOMINATIM (GRATUITO/OSM)
+    """
+    Converte um endereço em coordenadas (latitude e longitude) usando a API
+    gratuita do Nominatim (OpenStreetMap), em busca de texto livre (q=).
+    """
+    return _consultar_nominatim({"q": endereco})
+
+
+@st.cache_data(show_spinner=False)
+def geocodificar_canonico(chave, _consulta):
+    """
+    Geocodificação de um endereço canonicalizado (enderecos.canonicalizar_endereco): o cache
+    é indexado só pela chave canônica, e `_consulta` (fora do cache) é o texto enviado ao Nominatim.
+    """
+    return _consultar_nominatim({"q": _consulta})
+
+
+def normalizar_cep(cep):
+    """Mantém só os dígitos do CEP e formata como 00000-000. CEP inválido vira ''."""
+    if cep is None or (isinstance(cep, float) and np.isnan(cep)):
+        return ''
+    digitos = re.sub(r'\D', '', str(cep).split('.')[0])  # 1310100.0 (lido como número) -> 1310100
+    if not digitos or len(digitos) > 8:
+        return ''
+    digitos = digitos.zfill(8)  # Excel remove o zero à esquerda de CEPs de SP
+    return f"{digitos[:5]}-{digitos[5:]}"
+
+
+@st.cache_data(show_spinner=False)
+def geocodificar_estruturado(rua, numero, cidade, uf, cep):
+    """Busca estruturada do Nominatim (street/city/state/postalcode), mais precisa que o texto livre."""
+    params = {"country": "Brasil"}
+    street = f"{numero} {rua}".strip() if numero else rua
+    if street:
+        params["street"] = street
+    if cidade:
+        params["city"] = cidade
+    if uf:
+        params["state"] = uf
+    if cep:
+        params["postalcode"] = cep
+    return _consultar_nominatim(params)
+
+
+@st.cache_data(show_spinner=False)
+def geocodificar_cep(cep):
+    """Centroide do CEP. O CEP é a chave do cache: vários técnicos na mesma rua compartilham a chamada."""
+    return _consultar_nominatim({"postalcode": cep, "country": "Brasil"})
+
+
+@st.cache_data(show_spinner=False)
+def geocodificar_cidade(cidade, uf):
+    """Centroide do município (último recurso)."""
+    return _consultar_nominatim({"city": cidade, "state": uf, "country": "Brasil"})
+
+
+def geocodificar_componentes(rua, numero, cidade, uf, cep):
+    """
+    Cascata de tentativas, da mais precisa para a menos precisa:
+    estruturada -> texto livre -> centroide do CEP -> centroide da cidade.
+    Retorna (lat, lng, precisao) ou (None, None, None).
+    """
+    if rua and (cidade or cep):
+        lat, lng = geocodificar_estruturado(rua, numero, cidade, uf, cep)
+        if lat is not None:
+            return lat, lng, PRECISAO_ESTRUTURADA
+
+    texto = ", ".join(p for p in [f"{rua} {numero}".strip(), cidade, uf, cep] if p)
+    if texto:
+        lat, lng = geocodificar_endereco(texto)
+        if lat is not None:
+            return lat, lng, PRECISAO_TEXTO_LIVRE
+
+    if cep:
+        lat, lng = geocodificar_cep(cep)
+        if lat is not None:
+            return lat, lng, PRECISAO_CEP
+
+    if cidade:
+        lat, lng = geocodificar_cidade(cidade, uf)
+        if lat is not None:
+            return lat, lng, PRECISAO_CIDADE
+
+    return None, None, None
+
+
+def _texto(df, coluna):
+    """Coluna como texto limpo ('' para vazio/NaN/'N/I'), tolerando colunas ausentes."""
+    if coluna not in df.columns:
+        return pd.Series('', index=df.index)
+    serie = df[coluna].astype('string').str.strip().fillna('')
+    serie = serie.str.replace(r'\.0$', '', regex=True)  # números lidos como float (ex.: 1000.0)
+    return serie.mask(serie.str.lower().isin(VALORES_NAO_INFORMADOS), '')
+
+
+def geocodificar_tecnicos(df, ao_avancar=None):
+    """
+    Geocodifica as linhas do DataFrame usando as colunas 'endereco', 'numero', 'cidade',
+    'uf' e 'cep' da planilha de técnicos. Linhas com o mesmo CEP + número (ou o mesmo
+    endereço completo canonicalizado, quando não há CEP) são consultadas uma única vez.
+    `ao_avancar(i, total, encontrados)` recebe o progresso por endereço único.
+    Retorna um DataFrame (latitude, longitude, precisao_geocod) alinhado ao índice de `df`.
+    """
+    componentes = pd.DataFrame({
+        'rua': _texto(df, 'endereco'),
+        'numero': _texto(df, 'numero'),
+        'cidade': _texto(df, 'cidade'),
+        'uf': _texto(df, 'uf').str.upper(),
+        'cep': _texto(df, 'cep').map(normalizar_cep),
+    }, index=df.index)
+
+    # Sem CEP, a chave é o endereço completo canonicalizado (acentos, caixa, abreviações)
+    chave = componentes['cep'] + '|' + componentes['numero'].str.lower()
+    sem_cep = componentes['cep'] == ''
+    if sem_cep.any():
+        completo = (componentes['rua'] + ' ' + componentes['numero'] + ' ' + componentes['cidade'] + ' ' + componentes['uf'])[sem_cep]
+        chave[sem_cep] = '|' + canonicalizar_enderecos(completo)['chave']
+
+    unicos = componentes.assign(chave=chave).drop_duplicates('chave')
+    resultados = {}
+    encontrados = 0
+    for i, row in enumerate(unicos.itertuples(index=False)):
+        lat, lng, precisao = geocodificar_componentes(row.rua, row.numero, row.cidade, row.uf, row.cep)
+        resultados[row.chave] = (lat, lng, precisao)
+        encontrados += lat is not None
+        if ao_avancar is not None:
+            ao_avancar(i, len(unicos), encontrados)
+
+    return pd.DataFrame(
+        [resultados[k] for k in chave], index=df.index,
+        columns=['latitude', 'longitude', 'precisao_geocod']
+    )
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from roteamento import tecnico_mais_proximo
+from desvio import estimar_rotas, parametros_por_uf
+
+# --- VARIÁVEIS GLOBAIS ---
+# Níveis de detalhe do mapa agregado (zoom do mapa web): no zoom z o mundo tem 2^z
+# tiles de 360/2^z graus de largura, cada um dividido em CELULAS_POR_TILE células
+NIVEIS_ZOOM = [4, 6, 8, 10]
+CELULAS_POR_TILE = 8
+KM_POR_GRAU = 111.32
+
+# --- FUNÇÕES ---
+
+def tamanho_celula(zoom):
+    """Lado da célula (graus) no nível de zoom."""
+    return 360 / 2 ** zoom / CELULAS_POR_TILE
+
+
+def contar_por_celula(lat, lng, tamanho):
+    """
+    Quantidade de pontos em cada célula da grade de `tamanho` graus, só das células
+    ocupadas. Retorna um DataFrame com 'ix', 'iy' (coluna/linha da célula) e 'n'.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    validos = np.isfinite(lat) & np.isfinite(lng)
+    ix = np.floor(lng[validos] / tamanho).astype(np.int64)
+    iy = np.floor(lat[validos] / tamanho).astype(np.int64)
+    # Chave inteira única por célula (|ix|, |iy| < 2^20 até o zoom 14) para contar com um único np.unique
+    base = 2 ** 21
+    chaves, n = np.unique((ix + base // 2) * base + (iy + base // 2), return_counts=True)
+    return pd.DataFrame({'ix': chaves // base - base // 2, 'iy': chaves % base - base // 2, 'n': n})
+
+
+def agregar_grade(lat_chamados, lng_chamados, df_tecnicos, modelo, raio_km, niveis=NIVEIS_ZOOM):
+    """
+    Agrega chamados e técnicos em células quadradas para cada nível de zoom (calculado uma
+    vez por conjunto de dados; o mapa recebe só as células). Por célula ocupada:
+    - 'chamados' e 'tecnicos': quantidade de pontos na célula;
+    - 'distancia_km': distância de carro estimada (aérea x fator de desvio da UF do técnico)
+      do centro da célula ao técnico mais próximo, e 'coberto' se ela está a até `raio_km`;
+    - 'chamados_por_tecnico': chamados / técnicos na célula (NaN sem técnicos).
+    Retorna {zoom: DataFrame} com 'lat' e 'lng' do canto sudoeste da célula.
+    """
+    lat_tec = pd.to_numeric(df_tecnicos['latitude'], errors='coerce').to_numpy(dtype=float)
+    lng_tec = pd.to_numeric(df_tecnicos['longitude'], errors='coerce').to_numpy(dtype=float)
+    ufs_tec = df_tecnicos['uf'].to_numpy() if 'uf' in df_tecnicos.columns else np.full(len(df_tecnicos), None)
+    validos = np.isfinite(lat_tec) & np.isfinite(lng_tec)
+    lat_tec, lng_tec, ufs_tec = lat_tec[validos], lng_tec[validos], ufs_tec[validos]
+
+    grades = {}
+    for zoom in niveis:
+        tamanho = tamanho_celula(zoom)
+        chamados = contar_por_celula(lat_chamados, lng_chamados, tamanho).rename(columns={'n': 'chamados'})
+        tecnicos = contar_por_celula(lat_tec, lng_tec, tamanho).rename(columns={'n': 'tecnicos'})
+        grade = chamados.merge(tecnicos, on=['ix', 'iy'], how='outer').fillna(0)
+        grade[['chamados', 'tecnicos']] = grade[['chamados', 'tecnicos']].astype(np.int64)
+        grade['lat'] = grade['iy'] * tamanho
+        grade['lng'] = grade['ix'] * tamanho
+
+        idx, aereo = tecnico_mais_proximo(
+            (grade['lat'] + tamanho / 2).to_numpy(dtype=float), (grade['lng'] + tamanho / 2).to_numpy(dtype=float),
+            lat_tec, lng_tec,
+        )
+        distancia = np.full(len(grade), np.nan)
+        com_tecnico = idx >= 0
+        if com_tecnico.any():
+            parametros = parametros_por_uf(modelo, ufs_tec[idx[com_tecnico]])
+            distancia[com_tecnico] = estimar_rotas(aereo[com_tecnico], parametros)[0]
+        grade['distancia_km'] = distancia
+        grade['coberto'] = distancia <= raio_km
+        grade['chamados_por_tecnico'] = grade['chamados'] / grade['tecnicos'].where(grade['tecnicos'] > 0)
+        grades[zoom] = grade.drop(columns=['ix', 'iy'])
+    return grades
+
+
+def descrever_nivel(zoom):
+    """Rótulo do nível de zoom com o lado aproximado da célula (na linha do Equador)."""
+    return f"Zoom {zoom} (células de ~{tamanho_celula(zoom) * KM_POR_GRAU:.0f} km)"
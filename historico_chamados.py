@@ -0,0 +1,94 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from municipios import normalizar_nome
+from arquivos import arquivo_travado, substituir_csv
+
+# --- VARIÁVEIS GLOBAIS ---
+# Localização dos chamados já processados (lotes e planilhas de faturamento), usada
+# para ponderar a análise de cobertura pelo volume de chamados de cada município
+ARQUIVO_HISTORICO = os.path.join('dados', 'historico_chamados.csv')
+COLUNAS_HISTORICO = ['origem', 'id', 'data', 'latitude', 'longitude']
+# Os registros são só acrescentados ao arquivo; acima de MAX_BYTES_HISTORICO ele é reescrito
+# sem as versões antigas dos chamados reprocessados e com no máximo MAX_CHAMADOS_HISTORICO chamados
+MAX_CHAMADOS_HISTORICO = 500_000
+MAX_BYTES_HISTORICO = 64 * 1024 * 1024
+_TIPOS_HISTORICO = {'origem': 'string', 'id': 'string', 'data': 'string'}
+ORIGEM_LOTE = 'lote'
+ORIGEM_FATURAMENTO = 'faturamento'
+# Colunas (já normalizadas) com o número do chamado numa planilha de lote
+COLUNAS_NUMERO_CHAMADO = ['chamado', 'chamado no', 'n chamado', 'numero chamado', 'numero do chamado', 'id chamado', 'ticket']
+
+# --- FUNÇÕES ---
+
+def _ler_historico(arquivo):
+    """Chamados do arquivo, só a última versão de cada (origem, id), no máximo MAX_CHAMADOS_HISTORICO."""
+    df = pd.read_csv(arquivo, dtype=_TIPOS_HISTORICO)
+    return df.drop_duplicates(['origem', 'id'], keep='last').tail(MAX_CHAMADOS_HISTORICO).reset_index(drop=True)
+
+
+def carregar_historico(arquivo=ARQUIVO_HISTORICO):
+    """Chamados registrados (DataFrame vazio se ainda não há histórico)."""
+    if not os.path.exists(arquivo):
+        return pd.DataFrame(columns=COLUNAS_HISTORICO)
+    with arquivo_travado(arquivo):
+        return _ler_historico(arquivo)
+
+
+def registrar_chamados(origem, ids, datas, lat, lng, arquivo=ARQUIVO_HISTORICO):
+    """
+    Grava a localização dos chamados no histórico. `ids` identifica cada chamado dentro
+    da origem (ex.: o número do chamado, ver `ids_do_lote`): processar a mesma planilha
+    de novo substitui as linhas em vez de duplicá-las. As escritas são serializadas e,
+    quando o arquivo passa de MAX_BYTES_HISTORICO, ele é compactado (troca atômica).
+    Retorna a quantidade de chamados gravados.
+    """
+    novos = pd.DataFrame({
+        'origem': origem,
+        'id': pd.Series(ids, dtype='string').to_numpy(),
+        # Uma data para todos (ex.: início do lote) ou uma por chamado
+        'data': str(datas) if np.ndim(datas) == 0 else pd.Series(datas).astype('string').to_numpy(),
+        'latitude': np.asarray(lat, dtype=float),
+        'longitude': np.asarray(lng, dtype=float),
+    })
+    novos = novos[np.isfinite(novos['latitude']) & np.isfinite(novos['longitude'])]
+    if novos.empty:
+        return 0
+    with arquivo_travado(arquivo):
+        novos.to_csv(arquivo, mode='a', index=False, header=not os.path.exists(arquivo))
+        if os.path.getsize(arquivo) > MAX_BYTES_HISTORICO:
+            substituir_csv(_ler_historico(arquivo), arquivo)
+    return len(novos)
+
+
+def ids_do_lote(df_chamados, conteudo):
+    """
+    Identificador de cada chamado de uma planilha de lote no histórico: o número do chamado
+    (coluna de COLUNAS_NUMERO_CHAMADO, mais a ocorrência, pois o número pode se repetir) ou,
+    sem ele, um hash do conteúdo do arquivo mais a posição da linha. Assim, uma planilha
+    diferente com o mesmo nome (ex.: o 'chamados.xlsx' de toda semana) não substitui as
+    linhas do lote anterior, e reprocessar o mesmo arquivo não as duplica.
+    """
+    por_nome = {normalizar_nome(c): c for c in df_chamados.columns}
+    coluna = next((por_nome[c] for c in COLUNAS_NUMERO_CHAMADO if c in por_nome), None)
+    hash_arquivo = hashlib.sha1(conteudo).hexdigest()[:16]
+    por_posicao = pd.Series([f"{hash_arquivo}:{i}" for i in range(len(df_chamados))], dtype='string')
+    if coluna is None:
+        return por_posicao
+
+    numero = df_chamados[coluna].astype('string').str.strip().str.replace(r'\.0$', '', regex=True).reset_index(drop=True)
+    numero = numero.mask(numero == '')
+    ocorrencia = numero.groupby(numero, sort=False).cumcount().astype('Int64').astype('string')
+    return (numero + '#' + ocorrencia).fillna(por_posicao)
+
+
+def versao_historico(arquivo=ARQUIVO_HISTORICO):
+    """Data de modificação do histórico (0 sem arquivo), para invalidar os agregados em cache."""
+    return os.path.getmtime(arquivo) if os.path.exists(arquivo) else 0
+
+
+def mes_dos_chamados(historico):
+    """Mês ('AAAA-MM') de cada chamado do histórico (NA sem data válida)."""
+    return pd.to_datetime(historico['data'], errors='coerce', format='mixed').dt.strftime('%Y-%m')
@@ -0,0 +1,279 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from roteamento import R_TERRA_KM, consultar_tabela_osrm
+from coordenadas import avaliar_coordenadas, coordenadas_confiaveis, dentro_dos_aneis
+from progresso import ETAPA_ROTEAMENTO, BarraTqdm, Progresso
+from matriz_municipios import OSRM_URL_LOCAL, OSRM_MAX_COORDENADAS_LOCAL, chaves_tecnicos
+
+# --- CONFIGURAÇÃO ---
+# Isócronas (área alcançável de carro em 30/60/120 min) de cada técnico, pré-calculadas
+# por um job offline contra um OSRM próprio:
+# - vertices.npy: float32 (técnicos x limites x N_DIRECOES x 2), anel (lng, lat) de cada polígono;
+# - caixas.npy: float32 (técnicos x limites x 4), retângulo envolvente (lng_min, lat_min, lng_max, lat_max);
+# - indice.json: limites em minutos, chave do técnico de cada linha (`chaves_tecnicos`) e
+#   nomes dos dois arquivos acima. Cada atualização grava arrays com nomes novos e troca o
+#   índice por último, então quem lê sempre abre arrays e índice da mesma geração.
+DIRETORIO_ISOCRONAS = os.path.join('dados', 'isocronas')
+ARQUIVO_INDICE = 'indice.json'
+ARQUIVO_VERTICES = 'vertices.npy'
+ARQUIVO_CAIXAS = 'caixas.npy'
+LIMITES_MIN = [30, 60, 120]
+# Amostragem polar: o OSRM não gera isócronas, então cada técnico é roteado até pontos
+# em N_DIRECOES rumos x N_PASSOS distâncias (uma única chamada /table no servidor próprio)
+N_DIRECOES = 48
+N_PASSOS = 16
+# Alcance aéreo máximo amostrado: o maior limite a esta velocidade média
+VELOCIDADE_MAXIMA_KMH = 110
+TENTATIVAS_LEITURA = 3
+
+# --- FUNÇÕES ---
+
+def _destino(lat, lng, rumo_graus, dist_km):
+    """Ponto a `dist_km` de (lat, lng) no rumo informado (esfera), vetorizado."""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    rumo = np.radians(rumo_graus)
+    angulo = np.asarray(dist_km, dtype=float) / R_TERRA_KM
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(angulo) + np.cos(lat1) * np.sin(angulo) * np.cos(rumo))
+    lng2 = lng1 + np.arctan2(np.sin(rumo) * np.sin(angulo) * np.cos(lat1), np.cos(angulo) - np.sin(lat1) * np.sin(lat2))
+    return np.degrees(lat2), np.degrees(lng2)
+
+
+def raios_alcancados(tempos_s, raios_km, limite_min):
+    """
+    Raio alcançado em cada rumo: a amostra mais distante antes da primeira acima do limite
+    (ou sem rota), interpolada linearmente pelo tempo até essa primeira amostra.
+    `tempos_s` é (rumos x passos), `raios_km` as distâncias dos passos.
+    """
+    limite_s = limite_min * 60
+    tempos = np.hstack([np.zeros((len(tempos_s), 1)), tempos_s])
+    raios = np.concatenate([[0.0], raios_km])
+    acima = ~(tempos <= limite_s)  # inf/NaN contam como acima
+    primeira = np.where(acima.any(axis=1), acima.argmax(axis=1), len(raios))
+    ultima = primeira - 1
+    alcance = raios[ultima]
+    com_proxima = (primeira < len(raios))
+    linhas = np.flatnonzero(com_proxima)
+    t_prox = tempos[linhas, primeira[linhas]]
+    interpolar = np.isfinite(t_prox)
+    linhas, t_prox = linhas[interpolar], t_prox[interpolar]
+    t_ant = tempos[linhas, ultima[linhas]]
+    fracao = (limite_s - t_ant) / np.maximum(t_prox - t_ant, 1e-9)
+    alcance[linhas] += fracao * (raios[primeira[linhas]] - raios[ultima[linhas]])
+    return alcance
+
+
+def gerar_isocronas(lat, lng, limites_min=LIMITES_MIN, url_osrm=OSRM_URL_LOCAL,
+                    max_coordenadas=OSRM_MAX_COORDENADAS_LOCAL):
+    """
+    Isócronas de um técnico: anéis (lng, lat) de N_DIRECOES vértices, um por limite.
+    Retorna um array float32 (limites x N_DIRECOES x 2).
+    """
+    rumos = np.arange(N_DIRECOES) * 360 / N_DIRECOES
+    raios_km = np.linspace(0, max(limites_min) / 60 * VELOCIDADE_MAXIMA_KMH, N_PASSOS + 1)[1:]
+    lat_amostras, lng_amostras = _destino(lat, lng, rumos[:, None], raios_km[None, :])
+    destinos = list(zip(lat_amostras.ravel(), lng_amostras.ravel()))
+    _, tempos = consultar_tabela_osrm(lat, lng, destinos, url_osrm=url_osrm, max_coordenadas=max_coordenadas, timeout=120)
+    tempos = tempos.reshape(N_DIRECOES, N_PASSOS)
+
+    aneis = np.empty((len(limites_min), N_DIRECOES, 2), dtype=np.float32)
+    for k, limite in enumerate(limites_min):
+        lat_v, lng_v = _destino(lat, lng, rumos, raios_alcancados(tempos, raios_km, limite))
+        aneis[k, :, 0], aneis[k, :, 1] = lng_v, lat_v
+    return aneis
+
+
+def _caixas(vertices):
+    """Retângulo envolvente (lng_min, lat_min, lng_max, lat_max) de cada anel."""
+    return np.concatenate([vertices.min(axis=-2), vertices.max(axis=-2)], axis=-1)
+
+
+def _ler_indice(diretorio):
+    caminho = os.path.join(diretorio, ARQUIVO_INDICE)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        indice = json.load(f)
+    # Índices anteriores à gravação por geração usam os nomes fixos
+    indice.setdefault('arquivos', {'vertices': ARQUIVO_VERTICES, 'caixas': ARQUIVO_CAIXAS})
+    return indice
+
+
+def _nome_da_geracao(nome, geracao):
+    """'vertices.npy' -> 'vertices.20260101120000123456.npy'."""
+    base, extensao = os.path.splitext(nome)
+    return f"{base}.{geracao}{extensao}"
+
+
+def _remover_geracoes_antigas(diretorio, manter):
+    """
+    Apaga os arrays das gerações que não estão em `manter` (a atual e a anterior, que quem
+    acabou de ler o índice antigo ainda pode abrir). No Windows, os abertos ficam para a próxima vez.
+    """
+    for nome in (ARQUIVO_VERTICES, ARQUIVO_CAIXAS):
+        base, extensao = os.path.splitext(nome)
+        for caminho in [os.path.join(diretorio, nome)] + glob.glob(os.path.join(diretorio, f"{base}.*{extensao}")):
+            if os.path.basename(caminho) not in manter:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+
+def atualizar_isocronas(df_tecnicos, diretorio=DIRETORIO_ISOCRONAS, limites_min=LIMITES_MIN, url_osrm=OSRM_URL_LOCAL,
+                        max_coordenadas=OSRM_MAX_COORDENADAS_LOCAL, ao_avancar=None):
+    """
+    Cria ou atualiza as isócronas em `diretorio`. Só os técnicos novos (ou que mudaram de
+    coordenadas) são roteados; os removidos saem do arquivo. Se os limites mudarem, tudo
+    é refeito. `ao_avancar(i, total)` é chamado após cada técnico roteado.
+    Retorna {'roteados', 'removidos', 'mantidos'}.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    df_tecnicos = df_tecnicos.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    chaves = list(dict.fromkeys(chaves_tecnicos(df_tecnicos)))  # técnicos duplicados viram uma linha
+    posicao = {chave: i for i, chave in reversed(list(enumerate(chaves_tecnicos(df_tecnicos))))}
+
+    indice = _ler_indice(diretorio)
+    existentes = {}
+    if indice is not None and indice['limites'] == list(limites_min):
+        anteriores = np.load(os.path.join(diretorio, indice['arquivos']['vertices']))
+        existentes = {chave: anteriores[k] for k, chave in enumerate(indice['tecnicos'])}
+
+    vertices = np.empty((len(chaves), len(limites_min), N_DIRECOES, 2), dtype=np.float32)
+    novos = [k for k, chave in enumerate(chaves) if chave not in existentes]
+    for k, chave in enumerate(chaves):
+        if chave in existentes:
+            vertices[k] = existentes[chave]
+    for passo, k in enumerate(novos):
+        i = posicao[chaves[k]]
+        vertices[k] = gerar_isocronas(
+            float(df_tecnicos.at[i, 'latitude']), float(df_tecnicos.at[i, 'longitude']), limites_min, url_osrm, max_coordenadas
+        )
+        if ao_avancar is not None:
+            ao_avancar(passo, len(novos))
+
+    # Arrays da nova geração com nomes próprios; o índice, trocado por último (arquivo
+    # temporário + os.replace), é o que passa a apontar para eles. Quem lê nunca vê um
+    # arquivo pela metade nem combina o índice de uma geração com os arrays de outra
+    agora = datetime.now()
+    geracao = agora.strftime('%Y%m%d%H%M%S%f')
+    arquivos = {'vertices': _nome_da_geracao(ARQUIVO_VERTICES, geracao), 'caixas': _nome_da_geracao(ARQUIVO_CAIXAS, geracao)}
+    for nome, dados in ((arquivos['vertices'], vertices), (arquivos['caixas'], _caixas(vertices))):
+        caminho = os.path.join(diretorio, nome)
+        with open(caminho + '.tmp', 'wb') as f:
+            np.save(f, dados)
+        os.replace(caminho + '.tmp', caminho)
+    caminho_indice = os.path.join(diretorio, ARQUIVO_INDICE)
+    with open(caminho_indice + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({
+            'limites': list(limites_min), 'tecnicos': chaves, 'arquivos': arquivos, 'osrm': url_osrm,
+            'atualizado_em': agora.isoformat(timespec='seconds'),
+        }, f)
+    os.replace(caminho_indice + '.tmp', caminho_indice)
+    geracao_anterior = set(indice['arquivos'].values()) if indice is not None else set()
+    _remover_geracoes_antigas(diretorio, set(arquivos.values()) | geracao_anterior)
+
+    return {'roteados': len(novos), 'removidos': len(set(existentes) - set(chaves)), 'mantidos': len(chaves) - len(novos)}
+
+
+def carregar_isocronas(diretorio=DIRETORIO_ISOCRONAS):
+    """
+    Abre as isócronas por memory-map (somente leitura). Retorna None se
+    `python isocronas.py` ainda não foi rodado.
+    """
+    for tentativa in range(TENTATIVAS_LEITURA):
+        indice = _ler_indice(diretorio)
+        if indice is None:
+            return None
+        try:
+            vertices = np.load(os.path.join(diretorio, indice['arquivos']['vertices']), mmap_mode='r')
+            caixas = np.load(os.path.join(diretorio, indice['arquivos']['caixas']), mmap_mode='r')
+        except FileNotFoundError:
+            # Geração apagada por uma atualização concluída depois da leitura do índice: relê o índice
+            if tentativa == TENTATIVAS_LEITURA - 1:
+                raise
+            continue
+        return {
+            'vertices': vertices,
+            'caixas': caixas,
+            'limites': indice['limites'],
+            'linha_tecnico': {chave: k for k, chave in enumerate(indice['tecnicos'])},
+            'atualizado_em': indice.get('atualizado_em'),
+        }
+
+
+def linhas_isocronas(isocronas, df_tecnicos):
+    """Linha de cada técnico no arquivo de isócronas (-1 = sem isócrona: novo ou com endereço alterado)."""
+    return np.array([isocronas['linha_tecnico'].get(chave, -1) for chave in chaves_tecnicos(df_tecnicos)], dtype=np.int64)
+
+
+def tecnicos_na_isocrona(isocronas, lat, lng, df_tecnicos, limite_min):
+    """
+    Matriz booleana chamados x técnicos: o chamado está dentro da isócrona de `limite_min`
+    do técnico, sem nenhuma chamada de rede. Os retângulos envolventes descartam quase
+    todos os pares de uma vez; só os restantes passam pelo teste ponto-no-polígono.
+    Técnicos sem isócrona ficam com a coluna inteira em False.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    k = isocronas['limites'].index(limite_min)
+    linhas = linhas_isocronas(isocronas, df_tecnicos)
+    dentro = np.zeros((len(lat), len(linhas)), dtype=bool)
+    com_isocrona = np.flatnonzero(linhas >= 0)
+    if not len(com_isocrona) or not len(lat):
+        return dentro
+
+    caixas = np.asarray(isocronas['caixas'][linhas[com_isocrona], k], dtype=float)
+    na_caixa = (
+        (lng[:, None] >= caixas[None, :, 0]) & (lat[:, None] >= caixas[None, :, 1])
+        & (lng[:, None] <= caixas[None, :, 2]) & (lat[:, None] <= caixas[None, :, 3])
+    )
+    for c in np.flatnonzero(na_caixa.any(axis=0)):
+        pontos = np.flatnonzero(na_caixa[:, c])
+        anel = np.asarray(isocronas['vertices'][linhas[com_isocrona[c]], k], dtype=float)
+        dentro[pontos, com_isocrona[c]] = dentro_dos_aneis(lat[pontos], lng[pontos], [anel])
+    return dentro
+
+
+def geojson_isocronas(isocronas, df_tecnicos, limite_min):
+    """FeatureCollection com a isócrona de `limite_min` de cada técnico (properties.tecnico), para desenhar no mapa."""
+    k = isocronas['limites'].index(limite_min)
+    feicoes = []
+    for linha, nome in zip(linhas_isocronas(isocronas, df_tecnicos), df_tecnicos['tecnico']):
+        if linha < 0:
+            continue
+        anel = np.asarray(isocronas['vertices'][linha, k], dtype=float).round(5).tolist()
+        feicoes.append({
+            'type': 'Feature', 'id': str(nome), 'properties': {'tecnico': str(nome), 'limite_min': limite_min},
+            'geometry': {'type': 'Polygon', 'coordinates': [anel + anel[:1]]},
+        })
+    return {'type': 'FeatureCollection', 'features': feicoes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera/atualiza as isócronas de tempo de carro de cada técnico.")
+    parser.add_argument('tecnicos', nargs='?', default='tecnicos.xlsx', help="Planilha de técnicos")
+    parser.add_argument('--osrm', default=OSRM_URL_LOCAL, help="URL do servidor OSRM próprio")
+    parser.add_argument('--limites', type=int, nargs='+', default=LIMITES_MIN, help="Limites em minutos")
+    parser.add_argument('--destino', default=DIRETORIO_ISOCRONAS, help="Diretório das isócronas")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.tecnicos):
+        sys.exit(f"Planilha de técnicos não encontrada: {args.tecnicos}")
+    df_tecnicos = pd.read_excel(args.tecnicos)
+    df_tecnicos['qualidade_coord'] = avaliar_coordenadas(df_tecnicos)['qualidade_coord']
+    df_tecnicos = df_tecnicos[coordenadas_confiaveis(df_tecnicos)]
+
+    progresso = Progresso([BarraTqdm(unit='técnico')], etapas=[ETAPA_ROTEAMENTO])
+    resumo = atualizar_isocronas(
+        df_tecnicos, args.destino, sorted(args.limites), args.osrm,
+        ao_avancar=lambda i, total: progresso.atualizar(ETAPA_ROTEAMENTO, i + 1, total)
+    )
+    progresso.fechar()
+    print(f"Isócronas atualizadas em {args.destino}: {resumo}")
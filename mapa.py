@@ -0,0 +1,194 @@
+import json
+import numpy as np
+import pandas as pd
+
+from resultados import STATUS_ALOCADO
+
+# --- VARIÁVEIS GLOBAIS ---
+# Coordenadas enviadas ao navegador com 4 casas (~11 m): o JSON do mapa fica bem menor
+CASAS_DECIMAIS_MAPA = 4
+ESTILO_MAPA = 'light'  # mapa base da Carto, sem token
+COR_TECNICO = [108, 117, 125, 150]
+COR_TECNICO_DESTAQUE = [40, 167, 69, 230]
+COR_CHAMADO = [0, 123, 255, 230]
+COR_CHAMADO_NAO_ALOCADO = [220, 53, 69, 200]
+COR_ARCO = [40, 167, 69, 160]
+COR_ISOCRONA = [40, 167, 69, 40]
+# Mapa agregado por células: densidade de chamados ou chamados x cobertura dos técnicos
+MODO_DENSIDADE = 'densidade'
+MODO_COBERTURA = 'cobertura'
+ROTULOS_MODO_GRADE = {MODO_DENSIDADE: 'Densidade de chamados', MODO_COBERTURA: 'Chamados x cobertura'}
+COR_DENSIDADE_BAIXA = [255, 237, 160, 120]
+COR_DENSIDADE_ALTA = [189, 0, 38, 220]
+COR_CELULA_COBERTA = [40, 167, 69, 0]
+COR_CELULA_DESCOBERTA = [220, 53, 69, 0]
+COR_CELULA_SO_TECNICOS = [0, 123, 255, 70]
+# Acima disso, só as células com mais chamados vão para o mapa (~1,5 MB de JSON)
+MAX_CELULAS_MAPA = 20000
+
+# --- FUNÇÕES ---
+
+def _deck(**kwargs):
+    """
+    pdk.Deck serializado sem indentação: o pydeck gera o JSON com indent=2, o que mais que
+    dobra o tamanho das listas de coordenadas enviadas ao navegador pelo st.pydeck_chart.
+    O JSON do próprio Deck.to_json() é só recompactado, sem depender da serialização interna.
+    """
+    import pydeck as pdk
+
+    class DeckCompacto(pdk.Deck):
+        def to_json(self):
+            return json.dumps(json.loads(super().to_json()), separators=(',', ':'))
+
+    return DeckCompacto(**kwargs)
+
+
+def _posicoes(lat, lng):
+    """Array (n x 2) [lng, lat] por ponto (ordem do deck.gl), arredondado, e a máscara dos pontos válidos."""
+    pontos = np.round(np.column_stack([np.asarray(lng, dtype=float), np.asarray(lat, dtype=float)]), CASAS_DECIMAIS_MAPA)
+    return pontos, np.isfinite(pontos).all(axis=1)
+
+
+def _camada_pontos(lat, lng, cor, raio_px, nomes=None):
+    """ScatterplotLayer com uma cor única (sem array de cores por ponto) e nome só se a camada tiver tooltip."""
+    import pydeck as pdk
+
+    posicoes, validos = _posicoes(lat, lng)
+    dados = pd.DataFrame({'p': posicoes[validos].tolist()})
+    if nomes is not None:
+        dados['n'] = pd.Series(nomes, dtype='string').to_numpy()[validos]
+    return pdk.Layer(
+        'ScatterplotLayer', dados, get_position='p', get_fill_color=cor, radius_units='pixels',
+        get_radius=raio_px, pickable=nomes is not None,
+    )
+
+
+def _camada_arcos(lat_origem, lng_origem, lat_destino, lng_destino, nomes=None):
+    """ArcLayer de cada origem ao seu destino (pares sem coordenadas são descartados)."""
+    import pydeck as pdk
+
+    origens, validos_o = _posicoes(lat_origem, lng_origem)
+    destinos, validos_d = _posicoes(lat_destino, lng_destino)
+    validos = validos_o & validos_d
+    dados = pd.DataFrame({'o': origens[validos].tolist(), 'd': destinos[validos].tolist()})
+    if nomes is not None:
+        dados['n'] = pd.Series(nomes, dtype='string').to_numpy()[validos]
+    return pdk.Layer(
+        'ArcLayer', dados, get_source_position='o', get_target_position='d',
+        get_source_color=COR_CHAMADO, get_target_color=COR_ARCO, get_width=2, pickable=nomes is not None,
+    )
+
+
+def _vista(lat, lng):
+    """Enquadramento que mostra todos os pontos: centro do retângulo envolvente e zoom pela maior extensão."""
+    import pydeck as pdk
+
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    validos = np.isfinite(lat) & np.isfinite(lng)
+    if not validos.any():
+        return pdk.ViewState(latitude=-15.8, longitude=-47.9, zoom=3.5)  # Brasil inteiro
+    lat, lng = lat[validos], lng[validos]
+    extensao = max(np.ptp(lng), np.ptp(lat) * 1.5, 0.05)
+    zoom = float(np.clip(np.log2(360 / extensao) - 0.5, 3, 13))
+    return pdk.ViewState(latitude=float((lat.min() + lat.max()) / 2), longitude=float((lng.min() + lng.max()) / 2), zoom=zoom)
+
+
+def mapa_busca(localizacao_cliente, tecnicos_proximos, df_tecnicos, geojson_isocronas=None):
+    """
+    Mapa da busca individual: todos os técnicos (cinza), os encontrados (verde) com um
+    arco até o chamado, o chamado e, na busca por tempo, as isócronas dos encontrados.
+    """
+    import pydeck as pdk
+
+    lat_c, lng_c = localizacao_cliente['lat'], localizacao_cliente['lng']
+    lat_t = tecnicos_proximos['latitude'].to_numpy(dtype=float)
+    lng_t = tecnicos_proximos['longitude'].to_numpy(dtype=float)
+    camadas = [
+        _camada_pontos(pd.to_numeric(df_tecnicos['latitude'], errors='coerce'), pd.to_numeric(df_tecnicos['longitude'], errors='coerce'),
+                       COR_TECNICO, 4, df_tecnicos['tecnico']),
+        _camada_arcos(np.full(len(lat_t), lat_c), np.full(len(lat_t), lng_c), lat_t, lng_t, tecnicos_proximos['tecnico']),
+        _camada_pontos(lat_t, lng_t, COR_TECNICO_DESTAQUE, 7, tecnicos_proximos['tecnico']),
+        _camada_pontos([lat_c], [lng_c], COR_CHAMADO, 9),
+    ]
+    if geojson_isocronas is not None:
+        camadas.insert(0, pdk.Layer('GeoJsonLayer', geojson_isocronas, get_fill_color=COR_ISOCRONA,
+                                    get_line_color=COR_TECNICO_DESTAQUE, line_width_min_pixels=1))
+    return _deck(layers=camadas, initial_view_state=_vista(np.append(lat_t, lat_c), np.append(lng_t, lng_c)),
+                    map_style=ESTILO_MAPA, tooltip={'text': '{n}'})
+
+
+def mapa_lote(df_resultado, df_tecnicos):
+    """
+    Mapa do lote: chamados alocados (azul) e não alocados (vermelho), técnicos e um arco
+    de cada chamado alocado até o seu técnico. `df_tecnicos` é a tabela em que
+    'Indice_Tecnico' foi calculado (técnicos com coordenadas confiáveis do processamento).
+    Cada camada tem uma cor fixa e só as colunas que o deck.gl usa; o nome (tooltip)
+    vai apenas na camada de técnicos.
+    """
+    lat = df_resultado['Latitude_Chamado'].to_numpy(dtype=float)
+    lng = df_resultado['Longitude_Chamado'].to_numpy(dtype=float)
+    alocado = (df_resultado['Status'] == STATUS_ALOCADO).to_numpy() & (df_resultado['Indice_Tecnico'].to_numpy() >= 0)
+    j = df_resultado['Indice_Tecnico'].to_numpy()[alocado]
+    lat_tec = pd.to_numeric(df_tecnicos['latitude'], errors='coerce').to_numpy(dtype=float)
+    lng_tec = pd.to_numeric(df_tecnicos['longitude'], errors='coerce').to_numpy(dtype=float)
+
+    camadas = [
+        _camada_pontos(lat_tec, lng_tec, COR_TECNICO, 4, df_tecnicos['tecnico']),
+        _camada_pontos(lat[~alocado], lng[~alocado], COR_CHAMADO_NAO_ALOCADO, 3),
+        _camada_pontos(lat[alocado], lng[alocado], COR_CHAMADO, 3),
+        _camada_arcos(lat[alocado], lng[alocado], lat_tec[j], lng_tec[j]),
+    ]
+    return _deck(layers=camadas, initial_view_state=_vista(lat, lng), map_style=ESTILO_MAPA, tooltip={'text': '{n}'})
+
+
+def _cores_por_intensidade(intensidade, cor_baixa, cor_alta):
+    """Cor RGBA de cada célula interpolada entre `cor_baixa` e `cor_alta` (intensidade de 0 a 1)."""
+    intensidade = np.clip(np.nan_to_num(np.asarray(intensidade, dtype=float)), 0, 1)[:, None]
+    return np.round(np.array(cor_baixa) * (1 - intensidade) + np.array(cor_alta) * intensidade).astype(int)
+
+
+def mapa_grade(grade, zoom, tamanho, modo=MODO_DENSIDADE, max_celulas=MAX_CELULAS_MAPA):
+    """
+    Mapa das células agregadas (`grade.agregar_grade` de um nível de zoom), um quadrado
+    de `tamanho` graus por célula ocupada (no máximo `max_celulas`, as com mais chamados),
+    aberto no `zoom` do nível sobre a célula com mais chamados se tudo não couber. `modo`:
+    - MODO_DENSIDADE: cor pelo volume de chamados (escala logarítmica);
+    - MODO_COBERTURA: células com chamados em verde (técnico a até o raio) ou vermelho
+      (descobertas), com a opacidade pelo volume; células só com técnicos em azul.
+    """
+    import pydeck as pdk
+
+    if len(grade) > max_celulas:
+        grade = grade.nlargest(max_celulas, ['chamados', 'tecnicos'])
+    lat, lng = grade['lat'].to_numpy(dtype=float), grade['lng'].to_numpy(dtype=float)
+    chamados = grade['chamados'].to_numpy()
+    volume = np.log1p(chamados) / np.log1p(max(chamados.max(), 1)) if len(grade) else np.zeros(0)
+
+    if modo == MODO_COBERTURA:
+        cores = np.where(grade['coberto'].to_numpy()[:, None], COR_CELULA_COBERTA, COR_CELULA_DESCOBERTA)
+        cores[:, 3] = np.round(60 + 170 * volume)
+    else:
+        cores = _cores_por_intensidade(volume, COR_DENSIDADE_BAIXA, COR_DENSIDADE_ALTA)
+    cores[chamados == 0] = COR_CELULA_SO_TECNICOS
+
+    # Só o canto sudoeste de cada célula vai para o navegador; o quadrado é montado pelo deck.gl
+    dados = pd.DataFrame({
+        'x': np.round(lng, CASAS_DECIMAIS_MAPA),
+        'y': np.round(lat, CASAS_DECIMAIS_MAPA),
+        'c': cores.tolist(),
+        'chamados': chamados,
+        'tecnicos': grade['tecnicos'].to_numpy(),
+        'd': grade['distancia_km'].round().astype('Int64').astype('string').fillna('-').to_numpy(),
+    })
+    s = round(tamanho, 8)
+    camada = pdk.Layer('PolygonLayer', dados, get_polygon=f'[[x, y], [x + {s}, y], [x + {s}, y + {s}], [x, y + {s}]]',
+                       get_fill_color='c', stroked=False, pickable=True)
+    vista = _vista(lat + tamanho / 2, lng + tamanho / 2)
+    if len(grade) and vista.zoom < zoom - 1:
+        maior = int(np.argmax(chamados))
+        vista = pdk.ViewState(latitude=float(lat[maior] + tamanho / 2), longitude=float(lng[maior] + tamanho / 2), zoom=zoom)
+    return _deck(
+        layers=[camada], initial_view_state=vista, map_style=ESTILO_MAPA,
+        tooltip={'text': '{chamados} chamado(s), {tecnicos} técnico(s)\nTécnico mais próximo: {d} km'},
+    )
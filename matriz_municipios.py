@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+from roteamento import haversine_vetorizado, consultar_tabela_osrm
+from municipios import ARQUIVO_MUNICIPIOS, carregar_municipios, normalizar_nome
+from coordenadas import avaliar_coordenadas, coordenadas_confiaveis
+from progresso import ETAPA_ROTEAMENTO, BarraTqdm, Progresso
+
+# --- CONFIGURAÇÃO ---
+# Matriz técnico x município pré-calculada (job offline contra um OSRM próprio):
+# - distancias_km.npy: float32 (técnicos x municípios), inf = sem rota;
+# - tempos_min.npy: uint16 em minutos, SEM_ROTA_MIN = sem rota;
+# - indice.json: código IBGE de cada coluna e chave/coordenadas do técnico de cada linha.
+DIRETORIO_MATRIZ = os.path.join('dados', 'matriz_municipios')
+ARQUIVO_INDICE = 'indice.json'
+ARQUIVO_DISTANCIAS = 'distancias_km.npy'
+ARQUIVO_TEMPOS = 'tempos_min.npy'
+SEM_ROTA_MIN = np.iinfo(np.uint16).max
+# Servidor OSRM próprio (osrm-routed --max-table-size alto); o público limita a 100 coordenadas
+OSRM_URL_LOCAL = os.environ.get('OSRM_URL_LOCAL', 'http://localhost:5000')
+OSRM_MAX_COORDENADAS_LOCAL = 1000
+CASAS_DECIMAIS_CHAVE = 5
+
+# --- FUNÇÕES ---
+
+def chaves_tecnicos(df_tecnicos):
+    """
+    Chave de cada técnico na matriz: nome normalizado + coordenadas arredondadas.
+    Técnico que muda de endereço ganha uma chave nova (e uma nova linha na próxima atualização).
+    """
+    lat = pd.to_numeric(df_tecnicos['latitude'], errors='coerce').round(CASAS_DECIMAIS_CHAVE)
+    lng = pd.to_numeric(df_tecnicos['longitude'], errors='coerce').round(CASAS_DECIMAIS_CHAVE)
+    nomes = df_tecnicos['tecnico'].map(normalizar_nome)
+    return [f"{n}|{a:.{CASAS_DECIMAIS_CHAVE}f}|{b:.{CASAS_DECIMAIS_CHAVE}f}" for n, a, b in zip(nomes, lat, lng)]
+
+
+def _ler_indice(diretorio):
+    caminho = os.path.join(diretorio, ARQUIVO_INDICE)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def atualizar_matriz(df_tecnicos, df_municipios, diretorio=DIRETORIO_MATRIZ, url_osrm=OSRM_URL_LOCAL,
+                     max_coordenadas=OSRM_MAX_COORDENADAS_LOCAL, ao_avancar=None):
+    """
+    Cria ou atualiza a matriz em `diretorio`. Só os técnicos novos (ou que mudaram de
+    coordenadas) são roteados; as linhas de técnicos removidos são liberadas e
+    reaproveitadas. Se o cadastro de municípios mudar, a matriz é refeita do zero.
+    `ao_avancar(i, total)` é chamado após cada técnico roteado.
+    Retorna {'roteados', 'removidos', 'mantidos'}.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    df_tecnicos = df_tecnicos.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    chaves = chaves_tecnicos(df_tecnicos)
+    codigos = [int(c) for c in df_municipios['codigo_ibge']]
+    destinos = list(zip(df_municipios['latitude'].astype(float), df_municipios['longitude'].astype(float)))
+
+    indice = _ler_indice(diretorio)
+    if indice is None or indice['municipios'] != codigos:
+        indice = {'municipios': codigos, 'tecnicos': []}
+    linhas = indice['tecnicos']  # chave por linha (None = linha livre)
+
+    atuais = set(chaves)
+    removidos = [k for k, chave in enumerate(linhas) if chave is not None and chave not in atuais]
+    for k in removidos:
+        linhas[k] = None
+    existentes = set(linhas)
+    novos = [(chave, i) for i, chave in enumerate(chaves) if chave not in existentes]
+    novos = list(dict(novos).items())  # técnicos duplicados (mesmo nome e endereço) viram uma linha
+
+    # Reaproveita linhas livres e cresce o arquivo só se necessário
+    livres = [k for k, chave in enumerate(linhas) if chave is None]
+    destino_linhas = livres[:len(novos)] + list(range(len(linhas), len(linhas) + max(0, len(novos) - len(livres))))
+    linhas.extend([None] * max(0, len(novos) - len(livres)))
+    n_linhas, n_municipios = max(len(linhas), 1), len(codigos)
+
+    distancias = _abrir_para_escrita(diretorio, ARQUIVO_DISTANCIAS, (n_linhas, n_municipios), np.float32, np.inf)
+    tempos = _abrir_para_escrita(diretorio, ARQUIVO_TEMPOS, (n_linhas, n_municipios), np.uint16, SEM_ROTA_MIN)
+    for k in removidos:
+        distancias[k] = np.inf
+        tempos[k] = SEM_ROTA_MIN
+
+    for passo, ((chave, i), k) in enumerate(zip(novos, destino_linhas)):
+        d, t = consultar_tabela_osrm(
+            float(df_tecnicos.at[i, 'latitude']), float(df_tecnicos.at[i, 'longitude']), destinos,
+            url_osrm=url_osrm, max_coordenadas=max_coordenadas, timeout=120
+        )
+        distancias[k] = d.astype(np.float32)
+        tempos[k] = np.where(np.isfinite(t), np.minimum(np.round(t / 60), SEM_ROTA_MIN - 1), SEM_ROTA_MIN).astype(np.uint16)
+        linhas[k] = chave
+        if ao_avancar is not None:
+            ao_avancar(passo, len(novos))
+
+    distancias.flush()
+    tempos.flush()
+    indice.update({'tecnicos': linhas, 'osrm': url_osrm, 'atualizado_em': datetime.now().isoformat(timespec='seconds')})
+    # Índice gravado por último e por troca atômica: sua data de modificação é a versão da matriz
+    caminho_indice = os.path.join(diretorio, ARQUIVO_INDICE)
+    with open(caminho_indice + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(indice, f)
+    os.replace(caminho_indice + '.tmp', caminho_indice)
+
+    return {'roteados': len(novos), 'removidos': len(removidos), 'mantidos': len(atuais) - len(novos)}
+
+
+def _abrir_para_escrita(diretorio, nome, forma, dtype, vazio):
+    """Abre o .npy em modo leitura/escrita, recriando-o (e copiando o conteúdo) se a forma mudou."""
+    caminho = os.path.join(diretorio, nome)
+    antigo = np.load(caminho, mmap_mode='r') if os.path.exists(caminho) else None
+    if antigo is not None and antigo.shape == forma and antigo.dtype == dtype:
+        del antigo
+        return np.load(caminho, mmap_mode='r+')
+
+    novo_caminho = caminho + '.tmp'
+    novo = np.lib.format.open_memmap(novo_caminho, mode='w+', dtype=dtype, shape=forma)
+    novo[:] = vazio
+    if antigo is not None and antigo.shape[1] == forma[1]:
+        n = min(antigo.shape[0], forma[0])
+        novo[:n] = antigo[:n]
+    novo.flush()
+    del novo, antigo
+    os.replace(novo_caminho, caminho)
+    return np.load(caminho, mmap_mode='r+')
+
+
+def versao_matriz(diretorio=DIRETORIO_MATRIZ):
+    """Data de modificação do índice da matriz (0 sem matriz), para reabrir o memory-map após uma atualização."""
+    caminho = os.path.join(diretorio, ARQUIVO_INDICE)
+    return os.path.getmtime(caminho) if os.path.exists(caminho) else 0
+
+
+def carregar_matriz(diretorio=DIRETORIO_MATRIZ):
+    """
+    Abre a matriz em modo somente leitura por memory-map (nada é lido do disco até a consulta).
+    Retorna None se a matriz ainda não foi gerada.
+    """
+    indice = _ler_indice(diretorio)
+    if indice is None:
+        return None
+    return {
+        'distancias': np.load(os.path.join(diretorio, ARQUIVO_DISTANCIAS), mmap_mode='r'),
+        'tempos': np.load(os.path.join(diretorio, ARQUIVO_TEMPOS), mmap_mode='r'),
+        'coluna_municipio': {c: j for j, c in enumerate(indice['municipios'])},
+        'linha_tecnico': {chave: k for k, chave in enumerate(indice['tecnicos']) if chave is not None},
+        'atualizado_em': indice.get('atualizado_em'),
+    }
+
+
+def tecnicos_fora_da_matriz(matriz, df_tecnicos):
+    """Quantidade de técnicos sem linha na matriz (novos ou com endereço alterado)."""
+    return sum(chave not in matriz['linha_tecnico'] for chave in chaves_tecnicos(df_tecnicos))
+
+
+def montar_matriz_municipios(matriz, codigos_ibge, lat_chamados, lng_chamados, df_tecnicos, max_distance_km,
+                             fator_folga=1.5, elegiveis=None, estimar=None):
+    """
+    Equivalente a `roteamento.montar_matriz_chamados` na precisão de município, sem
+    nenhuma chamada de rede: a distância/tempo de cada chamado é a do centroide do seu
+    município (`codigos_ibge`, NA quando não identificado), lida da matriz pré-calculada.
+    Técnicos fora da matriz ficam com infinito ou, com `estimar`, com a estimativa pela
+    distância aérea.
+    Retorna (dist_km, tempo_s, n_candidatos_aereos, estimado).
+    """
+    n, m = len(codigos_ibge), len(df_tecnicos)
+    dist_km = np.full((n, m), np.inf, dtype=np.float32)
+    tempo_s = np.full((n, m), np.inf, dtype=np.float32)
+
+    aereo = haversine_vetorizado(
+        np.asarray(lat_chamados, dtype=float)[:, None], np.asarray(lng_chamados, dtype=float)[:, None],
+        pd.to_numeric(df_tecnicos['latitude'], errors='coerce').to_numpy(dtype=float)[None, :],
+        pd.to_numeric(df_tecnicos['longitude'], errors='coerce').to_numpy(dtype=float)[None, :],
+    )
+    candidatos = aereo <= max_distance_km * np.asarray(fator_folga, dtype=float)
+    if elegiveis is not None:
+        candidatos &= elegiveis
+    n_candidatos_aereos = candidatos.sum(axis=1)
+
+    colunas = np.array([matriz['coluna_municipio'].get(int(c), -1) if pd.notna(c) else -1 for c in codigos_ibge], dtype=np.int64)
+    linhas = np.array([matriz['linha_tecnico'].get(chave, -1) for chave in chaves_tecnicos(df_tecnicos)], dtype=np.int64)
+    com_municipio = np.flatnonzero(colunas >= 0)
+    na_matriz = np.flatnonzero(linhas >= 0)
+    if len(com_municipio) and len(na_matriz):
+        # Leitura em bloco do memory-map: só as linhas dos técnicos e as colunas dos municípios usados
+        bloco = np.ix_(linhas[na_matriz], colunas[com_municipio])
+        dist_km[np.ix_(com_municipio, na_matriz)] = matriz['distancias'][bloco].T
+        minutos = matriz['tempos'][bloco].T
+        tempo_s[np.ix_(com_municipio, na_matriz)] = np.where(minutos == SEM_ROTA_MIN, np.inf, minutos.astype(np.float32) * 60)
+
+    estimado = np.zeros((n, m), dtype=bool)
+    if estimar is not None:
+        estimado = candidatos & ~np.isfinite(dist_km) & (colunas >= 0)[:, None]
+        if estimado.any():
+            d_est, t_est = estimar(aereo)
+            dist_km[estimado] = d_est[estimado]
+            tempo_s[estimado] = t_est[estimado]
+
+    fora = ~candidatos | (dist_km > max_distance_km)
+    dist_km[fora] = np.inf
+    tempo_s[fora] = np.inf
+    estimado &= ~fora
+    return dist_km, tempo_s, n_candidatos_aereos, estimado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera/atualiza a matriz técnico x município de distância e tempo de carro.")
+    parser.add_argument('tecnicos', nargs='?', default='tecnicos.xlsx', help="Planilha de técnicos")
+    parser.add_argument('--osrm', default=OSRM_URL_LOCAL, help="URL do servidor OSRM próprio")
+    parser.add_argument('--municipios', default=ARQUIVO_MUNICIPIOS, help="Cadastro de municípios (python municipios.py)")
+    parser.add_argument('--destino', default=DIRETORIO_MATRIZ, help="Diretório da matriz")
+    args = parser.parse_args()
+
+    df_municipios = carregar_municipios(args.municipios)
+    if df_municipios.empty:
+        sys.exit(f"Cadastro de municípios não encontrado em {args.municipios}. Rode `python municipios.py` antes.")
+    df_tecnicos = pd.read_excel(args.tecnicos)
+    df_tecnicos['qualidade_coord'] = avaliar_coordenadas(df_tecnicos)['qualidade_coord']
+    df_tecnicos = df_tecnicos[coordenadas_confiaveis(df_tecnicos)]
+
+    progresso = Progresso([BarraTqdm(unit='técnico')], etapas=[ETAPA_ROTEAMENTO])
+    resumo = atualizar_matriz(
+        df_tecnicos, df_municipios, args.destino, args.osrm,
+        ao_avancar=lambda i, total: progresso.atualizar(ETAPA_ROTEAMENTO, i + 1, total)
+    )
+    progresso.fechar()
+    print(f"Matriz atualizada em {args.destino}: {resumo}")
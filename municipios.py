@@ -0,0 +1,217 @@
+import os
+import sys
+import difflib
+import unicodedata
+import string
+import pandas as pd
+import numpy as np
+
+# --- CONFIGURAÇÃO ---
+# Cadastro de municípios do IBGE com centroides (formato do projeto kelvins/municipios-brasileiros):
+# codigo_ibge,nome,latitude,longitude,capital,codigo_uf,siafi_id,ddd,fuso_horario
+ARQUIVO_MUNICIPIOS = os.path.join('dados', 'municipios.csv')
+URL_MUNICIPIOS = "https://raw.githubusercontent.com/kelvins/municipios-brasileiros/main/csv/municipios.csv"
+
+CODIGOS_UF = {
+    11: 'RO', 12: 'AC', 13: 'AM', 14: 'RR', 15: 'PA', 16: 'AP', 17: 'TO',
+    21: 'MA', 22: 'PI', 23: 'CE', 24: 'RN', 25: 'PB', 26: 'PE', 27: 'AL', 28: 'SE', 29: 'BA',
+    31: 'MG', 32: 'ES', 33: 'RJ', 35: 'SP',
+    41: 'PR', 42: 'SC', 43: 'RS',
+    50: 'MS', 51: 'MT', 52: 'GO', 53: 'DF',
+}
+# Abaixo desse grau de semelhança o nome não é associado a nenhum município
+SIMILARIDADE_MINIMA = 0.8
+CANDIDATOS_POR_BUSCA = 5
+
+_PONTUACAO = bytes(ord(' ') if chr(i) in string.punctuation else i for i in range(256))
+
+# --- FUNÇÕES ---
+
+def normalizar_nome(nome):
+    """'São Raimundo Nonato' / 'SAO RAIMUNDO NONATO' / 'Sao Raimundo-Nonato' -> 'sao raimundo nonato'."""
+    if nome is None or (isinstance(nome, float) and np.isnan(nome)):
+        return ''
+    texto = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').lower()
+    return ' '.join(texto.translate(_PONTUACAO).decode().split())
+
+
+def normalizar_uf(uf):
+    """Sigla da UF em maiúsculas ('' quando não é uma UF válida)."""
+    uf = normalizar_nome(uf).upper().replace(' ', '')
+    return uf if uf in CODIGOS_UF.values() else ''
+
+
+def colunas_cidade_uf(df):
+    """Nomes das colunas de cidade e UF de uma planilha (ex.: 'cidade'/'uf' ou 'CIDADE'/'ESTADO')."""
+    por_nome = {normalizar_nome(c): c for c in df.columns}
+    cidade = next((por_nome[c] for c in ('cidade', 'municipio') if c in por_nome), None)
+    uf = next((por_nome[c] for c in ('uf', 'estado') if c in por_nome), None)
+    return cidade, uf
+
+
+def carregar_municipios(arquivo=ARQUIVO_MUNICIPIOS):
+    """
+    Lê o cadastro de municípios (nome, uf, codigo_ibge, latitude, longitude).
+    Sem o arquivo, retorna um DataFrame vazio; rode `python municipios.py` para baixá-lo.
+    """
+    colunas = ['codigo_ibge', 'nome', 'uf', 'latitude', 'longitude']
+    if not os.path.exists(arquivo):
+        return pd.DataFrame(columns=colunas)
+    df = pd.read_csv(arquivo)
+    df['uf'] = df['codigo_uf'].map(CODIGOS_UF)
+    return df[colunas].dropna(subset=['nome', 'uf']).reset_index(drop=True)
+
+
+def referencia_dos_tecnicos(df_tecnicos):
+    """
+    Referência alternativa quando o cadastro do IBGE não está disponível: as cidades da
+    planilha de técnicos, com o centroide das coordenadas dos técnicos de cada cidade.
+    """
+    df = pd.DataFrame({
+        'nome': df_tecnicos.get('cidade', pd.Series(dtype=object)),
+        'uf': df_tecnicos.get('uf', pd.Series(dtype=object)).map(normalizar_uf),
+        'latitude': pd.to_numeric(df_tecnicos.get('latitude'), errors='coerce'),
+        'longitude': pd.to_numeric(df_tecnicos.get('longitude'), errors='coerce'),
+    })
+    df['chave'] = df['nome'].map(normalizar_nome)
+    df = df[(df['chave'] != '') & (df['uf'] != '')]
+    ref = df.groupby(['uf', 'chave'], sort=False).agg(
+        nome=('nome', lambda s: s.mode().iloc[0]),  # grafia mais frequente
+        latitude=('latitude', 'mean'),
+        longitude=('longitude', 'mean'),
+    ).reset_index()
+    ref['codigo_ibge'] = pd.NA
+    return ref[['codigo_ibge', 'nome', 'uf', 'latitude', 'longitude']]
+
+
+def _trigramas(nome):
+    """Trigramas de caracteres com bordas ('  sao raimundo ') para a busca aproximada."""
+    texto = f"  {nome} "
+    return {texto[k:k + 3] for k in range(len(texto) - 2)}
+
+
+def construir_indice(df_municipios):
+    """
+    Índice pré-calculado para reconciliar nomes de cidades em lote:
+    - 'exato': (uf, nome normalizado) -> posição no cadastro;
+    - 'trigramas': uf -> {trigrama: array de posições} (índice invertido por UF, '' = Brasil todo);
+    - 'n_trigramas': quantidade de trigramas de cada município (para o coeficiente de Dice);
+    - 'uf_unica': nome normalizado -> UF, só dos nomes que existem numa única UF.
+    """
+    df = df_municipios.reset_index(drop=True).copy()
+    df['chave'] = df['nome'].map(normalizar_nome)
+
+    exato = {(uf, chave): i for i, (uf, chave) in enumerate(zip(df['uf'], df['chave']))}
+    trigramas_por_linha = [_trigramas(c) for c in df['chave']]
+
+    invertido = {}
+    for i, (uf, tris) in enumerate(zip(df['uf'], trigramas_por_linha)):
+        for escopo in (uf, ''):
+            por_tri = invertido.setdefault(escopo, {})
+            for t in tris:
+                por_tri.setdefault(t, []).append(i)
+    invertido = {escopo: {t: np.array(ids, dtype=np.int32) for t, ids in por_tri.items()}
+                 for escopo, por_tri in invertido.items()}
+
+    ufs_por_nome = df.groupby('chave')['uf'].unique()
+    uf_unica = {nome: ufs[0] for nome, ufs in ufs_por_nome.items() if nome and len(ufs) == 1}
+
+    return {
+        'municipios': df,
+        'exato': exato,
+        'trigramas': invertido,
+        'n_trigramas': np.array([len(t) for t in trigramas_por_linha], dtype=np.int32),
+        'uf_unica': uf_unica,
+    }
+
+
+def buscar_municipio(indice, nome, uf=''):
+    """
+    Localiza um município por nome (e UF, se informada).
+    Retorna (posição no cadastro, similaridade) ou (None, 0.0).
+    """
+    chave = normalizar_nome(nome)
+    uf = normalizar_uf(uf)
+    if not chave:
+        return None, 0.0
+
+    posicao = indice['exato'].get((uf, chave))
+    if posicao is not None:
+        return posicao, 1.0
+
+    por_tri = indice['trigramas'].get(uf) or indice['trigramas'].get('')
+    if not por_tri:
+        return None, 0.0
+
+    tris = _trigramas(chave)
+    listas = [por_tri[t] for t in tris if t in por_tri]
+    if not listas:
+        return None, 0.0
+
+    # Coeficiente de Dice sobre trigramas: 2 * comuns / (total consulta + total candidato)
+    ids, comuns = np.unique(np.concatenate(listas), return_counts=True)
+    dice = 2 * comuns / (len(tris) + indice['n_trigramas'][ids])
+    melhores = ids[np.argsort(-dice)[:CANDIDATOS_POR_BUSCA]]
+
+    # Confirma os melhores candidatos com a semelhança de sequência (tolerante a letras trocadas)
+    chaves = indice['municipios']['chave']
+    notas = [difflib.SequenceMatcher(None, chave, chaves.iat[i]).ratio() for i in melhores]
+    k = int(np.argmax(notas))
+    if notas[k] < SIMILARIDADE_MINIMA:
+        return None, float(notas[k])
+    return int(melhores[k]), float(notas[k])
+
+
+def reconciliar_cidades(indice, cidades, ufs=None):
+    """
+    Mapeia, em lote, nomes de cidade com grafias variadas ('PORTO VELHO', 'Porto velho',
+    'ICÒ', 'Sao Raiumundo Nonato') para o município canônico. Cada par (cidade, UF)
+    distinto é resolvido uma única vez.
+    Retorna um DataFrame alinhado à entrada com 'municipio', 'uf_municipio', 'codigo_ibge',
+    'latitude_municipio', 'longitude_municipio' e 'similaridade' (NaN/vazio sem correspondência).
+    """
+    cidades = pd.Series(cidades).reset_index(drop=True)
+    ufs = pd.Series([''] * len(cidades)) if ufs is None else pd.Series(ufs).reset_index(drop=True)
+    pares = pd.DataFrame({'chave': cidades.map(normalizar_nome), 'uf': ufs.map(normalizar_uf)})
+
+    codigos, unicos = pd.factorize(pares['chave'] + '|' + pares['uf'])
+    resolvidos = [buscar_municipio(indice, *par.split('|', 1)) for par in unicos]
+
+    municipios = indice['municipios']
+    posicoes = np.array([p if p is not None else -1 for p, _ in resolvidos], dtype=np.int64)[codigos] if len(unicos) else np.array([], dtype=np.int64)
+    similaridade = np.array([s for _, s in resolvidos], dtype=float)[codigos] if len(unicos) else np.array([])
+    achou = posicoes >= 0
+    linhas = municipios.iloc[np.where(achou, posicoes, 0)] if len(municipios) else None
+
+    def coluna(nome):
+        if linhas is None:
+            return pd.Series(pd.NA, index=cidades.index, dtype=object)
+        return pd.Series(linhas[nome].to_numpy(), index=cidades.index).where(achou)
+
+    return pd.DataFrame({
+        'municipio': coluna('nome'),
+        'uf_municipio': coluna('uf'),
+        'codigo_ibge': pd.to_numeric(coluna('codigo_ibge'), errors='coerce').astype('Int64'),
+        'latitude_municipio': pd.to_numeric(coluna('latitude'), errors='coerce'),
+        'longitude_municipio': pd.to_numeric(coluna('longitude'), errors='coerce'),
+        'similaridade': np.where(achou, similaridade, np.nan),
+    })
+
+
+def baixar_municipios(destino=ARQUIVO_MUNICIPIOS):
+    """Baixa o cadastro de municípios com centroides para `destino`."""
+    import requests
+
+    response = requests.get(URL_MUNICIPIOS, timeout=60)
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+    with open(destino, 'wb') as f:
+        f.write(response.content)
+    return destino
+
+
+if __name__ == "__main__":
+    destino = sys.argv[1] if len(sys.argv) > 1 else ARQUIVO_MUNICIPIOS
+    print(f"Baixando o cadastro de municípios para: {destino}")
+    baixar_municipios(destino)
+    print(f"Municípios carregados: {len(carregar_municipios(destino))}")
@@ -0,0 +1,190 @@
+import time
+import pandas as pd
+
+# --- VARIÁVEIS GLOBAIS ---
+# No máximo 4 atualizações por segundo: cada atualização do st.progress é uma mensagem
+# pelo websocket, e uma por chamado pesa em lotes grandes
+FREQUENCIA_HZ = 4
+
+ETAPA_GEOCODIFICACAO = 'geocodificacao'
+ETAPA_ROTEAMENTO = 'roteamento'
+ETAPA_ALOCACAO = 'alocacao'
+ETAPA_SEQUENCIAMENTO = 'sequenciamento'
+ROTULOS_ETAPA = {
+    ETAPA_GEOCODIFICACAO: 'Geocodificação',
+    ETAPA_ROTEAMENTO: 'Rotas',
+    ETAPA_ALOCACAO: 'Alocação',
+    ETAPA_SEQUENCIAMENTO: 'Sequenciamento',
+}
+ETAPAS_LOTE = [ETAPA_GEOCODIFICACAO, ETAPA_ROTEAMENTO, ETAPA_ALOCACAO, ETAPA_SEQUENCIAMENTO]
+
+SITUACAO_PENDENTE = 'Pendente'
+SITUACAO_EM_ANDAMENTO = 'Em andamento'
+SITUACAO_CONCLUIDA = 'Concluída'
+
+# --- FUNÇÕES ---
+
+def formatar_duracao(segundos):
+    """'1h02m', '3m05s' ou '12s' (vazio se desconhecido)."""
+    if segundos is None or segundos != segundos or segundos == float('inf'):
+        return ''
+    segundos = int(round(segundos))
+    if segundos >= 3600:
+        return f"{segundos // 3600}h{segundos % 3600 // 60:02d}m"
+    if segundos >= 60:
+        return f"{segundos // 60}m{segundos % 60:02d}s"
+    return f"{segundos}s"
+
+
+class Progresso:
+    """
+    Progresso de um processamento em etapas (ex.: geocodificação, rotas, alocação), com a
+    contagem, a vazão e o tempo restante de cada etapa. Os mesmos eventos alimentam vários
+    destinos (barra do Streamlit, barra do tqdm, tabela de situação), limitados a
+    `frequencia_hz` atualizações por segundo; início e fim de etapa sempre são repassados.
+
+    Um destino é qualquer objeto com `atualizar(progresso, etapa)` e `fechar(progresso)`.
+    """
+
+    def __init__(self, destinos, etapas=ETAPAS_LOTE, frequencia_hz=FREQUENCIA_HZ, relogio=time.monotonic):
+        self.destinos = list(destinos)
+        self.intervalo = 1 / frequencia_hz
+        self._relogio = relogio
+        self._ultima_emissao = None
+        self.etapas = {etapa: {'concluidos': 0, 'total': 0, 'inicio': None, 'fim': None} for etapa in etapas}
+
+    def iniciar(self, etapa, total):
+        """Início da etapa com `total` itens (zera a contagem e o relógio da etapa)."""
+        self.etapas[etapa].update(concluidos=0, total=int(total), inicio=self._relogio(), fim=None)
+        self._emitir(etapa, forcar=True)
+
+    def atualizar(self, etapa, concluidos, total=None):
+        """Itens concluídos na etapa (e o total, se só for conhecido agora). Inicia a etapa se preciso."""
+        estado = self.etapas[etapa]
+        if estado['inicio'] is None:
+            estado['inicio'] = self._relogio()
+        if total is not None:
+            estado['total'] = int(total)
+        estado['concluidos'] = int(concluidos)
+        self._emitir(etapa, forcar=estado['concluidos'] >= estado['total'])
+
+    def avancar(self, etapa, n=1):
+        """Mais `n` itens concluídos na etapa."""
+        self.atualizar(etapa, self.etapas[etapa]['concluidos'] + n)
+
+    def concluir(self, etapa, concluidos=None):
+        """Fim da etapa (por padrão com todos os itens concluídos)."""
+        estado = self.etapas[etapa]
+        if estado['inicio'] is None:
+            estado['inicio'] = self._relogio()
+        estado['concluidos'] = estado['total'] if concluidos is None else int(concluidos)
+        estado['total'] = max(estado['total'], estado['concluidos'])
+        estado['fim'] = self._relogio()
+        self._emitir(etapa, forcar=True)
+
+    def fechar(self):
+        """Encerra todos os destinos (ex.: remove a barra da tela, fecha a barra do tqdm)."""
+        for destino in self.destinos:
+            destino.fechar(self)
+
+    def situacao(self, etapa):
+        """Estado da etapa: concluidos, total, fracao, itens_por_s, restante_s (None se desconhecido) e situacao."""
+        estado = self.etapas[etapa]
+        concluidos, total = estado['concluidos'], estado['total']
+        if estado['inicio'] is None:
+            return {'concluidos': 0, 'total': total, 'fracao': 0.0, 'itens_por_s': None, 'restante_s': None,
+                    'situacao': SITUACAO_PENDENTE}
+        decorrido = (estado['fim'] if estado['fim'] is not None else self._relogio()) - estado['inicio']
+        itens_por_s = concluidos / decorrido if decorrido > 0 and concluidos else None
+        restante = (total - concluidos) / itens_por_s if itens_por_s else None
+        return {
+            'concluidos': concluidos,
+            'total': total,
+            'fracao': min(concluidos / total, 1.0) if total else 1.0,
+            'itens_por_s': itens_por_s,
+            'restante_s': 0.0 if estado['fim'] is not None else restante,
+            'situacao': SITUACAO_CONCLUIDA if estado['fim'] is not None else SITUACAO_EM_ANDAMENTO,
+        }
+
+    def texto(self, etapa):
+        """Resumo de uma linha: 'Rotas: 120 de 400 · 35.2/s · restam ~8s'."""
+        s = self.situacao(etapa)
+        partes = [f"{ROTULOS_ETAPA.get(etapa, etapa)}: {s['concluidos']} de {s['total']}"]
+        if s['itens_por_s']:
+            partes.append(f"{s['itens_por_s']:.1f}/s")
+        if s['situacao'] == SITUACAO_EM_ANDAMENTO and s['restante_s'] is not None:
+            partes.append(f"restam ~{formatar_duracao(s['restante_s'])}")
+        return ' · '.join(partes)
+
+    def tabela(self):
+        """Situação de todas as etapas (tabela de acompanhamento do processamento)."""
+        linhas = []
+        for etapa in self.etapas:
+            s = self.situacao(etapa)
+            linhas.append({
+                'Etapa': ROTULOS_ETAPA.get(etapa, etapa),
+                'Situação': s['situacao'],
+                'Concluídos': s['concluidos'],
+                'Total': s['total'],
+                'Itens/s': round(s['itens_por_s'], 1) if s['itens_por_s'] else None,
+                'Tempo Restante': formatar_duracao(s['restante_s']) if s['situacao'] == SITUACAO_EM_ANDAMENTO else '',
+            })
+        return pd.DataFrame(linhas)
+
+    def _emitir(self, etapa, forcar=False):
+        agora = self._relogio()
+        if not forcar and self._ultima_emissao is not None and agora - self._ultima_emissao < self.intervalo:
+            return
+        self._ultima_emissao = agora
+        for destino in self.destinos:
+            destino.atualizar(self, etapa)
+
+
+class BarraStreamlit:
+    """Destino: um st.progress (criado por quem chama), com o texto da etapa atual."""
+
+    def __init__(self, barra):
+        self.barra = barra
+
+    def atualizar(self, progresso, etapa):
+        self.barra.progress(progresso.situacao(etapa)['fracao'], text=progresso.texto(etapa))
+
+    def fechar(self, progresso):
+        self.barra.empty()
+
+
+class TabelaSituacao:
+    """Destino: tabela com a situação de todas as etapas num st.empty(), mantida na tela ao fechar."""
+
+    def __init__(self, espaco):
+        self.espaco = espaco
+
+    def atualizar(self, progresso, etapa):
+        self.espaco.dataframe(progresso.tabela(), hide_index=True)
+
+    def fechar(self, progresso):
+        self.atualizar(progresso, None)
+
+
+class BarraTqdm:
+    """Destino: uma barra do tqdm por etapa no terminal (scripts de linha de comando)."""
+
+    def __init__(self, **opcoes_tqdm):
+        self.opcoes = opcoes_tqdm
+        self.barras = {}
+
+    def atualizar(self, progresso, etapa):
+        from tqdm import tqdm
+
+        s = progresso.situacao(etapa)
+        barra = self.barras.get(etapa)
+        if barra is None:
+            barra = self.barras[etapa] = tqdm(total=s['total'], desc=ROTULOS_ETAPA.get(etapa, etapa), **self.opcoes)
+        barra.total = s['total']
+        barra.update(s['concluidos'] - barra.n)
+        if s['situacao'] == SITUACAO_CONCLUIDA:
+            barra.close()
+
+    def fechar(self, progresso):
+        for barra in self.barras.values():
+            barra.close()
@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+
+# --- VARIÁVEIS GLOBAIS ---
+# Códigos de status do lote (categóricos). O texto exibido vem de `rotulos_status`.
+STATUS_ALOCADO = 'ALOCADO'
+STATUS_ENDERECO_VAZIO = 'ERRO_ENDERECO_VAZIO'
+STATUS_FALHA_GEOCOD = 'ERRO_GEOCODIFICACAO'
+STATUS_SEM_ELEGIVEIS = 'SEM_ELEGIVEIS'
+STATUS_FORA_RAIO_AEREO = 'FORA_RAIO_AEREO'
+STATUS_SEM_CAPACIDADE = 'SEM_CAPACIDADE'
+STATUS_FORA_RAIO_REAL = 'FORA_RAIO_REAL'
+CODIGOS_STATUS = [STATUS_ALOCADO, STATUS_ENDERECO_VAZIO, STATUS_FALHA_GEOCOD, STATUS_SEM_ELEGIVEIS,
+                  STATUS_FORA_RAIO_AEREO, STATUS_SEM_CAPACIDADE, STATUS_FORA_RAIO_REAL]
+STATUS_ERRO = [STATUS_ENDERECO_VAZIO, STATUS_FALHA_GEOCOD]
+
+# --- FUNÇÕES ---
+
+def classificar_status(tecnico_idx, endereco_vazio, falha_geocod, sem_elegiveis, n_candidatos_aereos, dist_km):
+    """Status de cada chamado em uma única passada vetorizada (a primeira condição verdadeira vence)."""
+    condicoes = [
+        tecnico_idx >= 0,
+        endereco_vazio,
+        falha_geocod,
+        sem_elegiveis,
+        n_candidatos_aereos == 0,
+        np.isfinite(dist_km).any(axis=1),
+    ]
+    codigos = np.select(condicoes, CODIGOS_STATUS[:-1], default=STATUS_FORA_RAIO_REAL)
+    return pd.Categorical(codigos, categories=CODIGOS_STATUS)
+
+
+def montar_resultado_lote(df_chamados, df_tecnicos, lat_chamados, lng_chamados, tecnico_idx, dia_idx,
+                          carga, dist_km, tempo_s, status, custo_por_km, data_inicio, estimado=None):
+    """
+    Monta o resultado do lote como um DataFrame tipado, coluna a coluna:
+    distância/tempo/custo numéricos (NaN quando não alocado), status categórico,
+    índice do técnico inteiro (-1 = nenhum), dia de atendimento Int64 e
+    'Rota_Estimada' (distância estimada sem o OSRM, matriz booleana `estimado`).
+    A formatação (R$, 'N/A', textos de status) fica para a exibição/exportação.
+    """
+    n = len(df_chamados)
+    alocado = tecnico_idx >= 0
+    j = np.where(alocado, tecnico_idx, 0)
+    linhas = np.arange(n)
+
+    def do_tecnico(coluna):
+        if n == 0 or coluna not in df_tecnicos.columns or df_tecnicos.empty:
+            return pd.Series(pd.NA, index=range(n), dtype='string')
+        valores = df_tecnicos[coluna].astype('string').to_numpy()[j]
+        return pd.Series(valores, dtype='string').where(alocado)
+
+    if df_tecnicos.empty:
+        distancia = tempo_min = np.full(n, np.nan)
+        rota_estimada = np.zeros(n, dtype=bool)
+    else:
+        distancia = np.where(alocado, dist_km[linhas, j], np.nan).astype(float)
+        tempo_min = np.where(alocado, np.floor(tempo_s[linhas, j] / 60), np.nan).astype(float)
+        rota_estimada = alocado & estimado[linhas, j] if estimado is not None else np.zeros(n, dtype=bool)
+
+    dia = pd.array(np.where(alocado, dia_idx + 1, 0), dtype='Int64')
+    dia[~alocado] = pd.NA
+
+    df = df_chamados.reset_index(drop=True).copy()
+    df = df.assign(**{
+        'Status': status,
+        'Indice_Tecnico': tecnico_idx.astype(np.int64),
+        'Técnico_Mais_Próximo': do_tecnico('tecnico'),
+        'Coordenador_Técnico': do_tecnico('coordenador'),
+        'UF_Técnico': do_tecnico('uf'),
+        'Distância_km': distancia,
+        'Tempo_Estimado_min': tempo_min,
+        'Rota_Estimada': rota_estimada,
+        'Custo_Estimado_RS': distancia * custo_por_km,
+        'Dia_Atendimento': dia,
+        'Data_Atendimento': pd.Timestamp(data_inicio) + pd.to_timedelta(dia.astype('float') - 1, unit='D'),
+        'Chamados_Alocados_Tecnico': np.where(alocado, carga[j] if len(carga) else 0, 0).astype(np.int64),
+        'Latitude_Chamado': np.asarray(lat_chamados, dtype=float),
+        'Longitude_Chamado': np.asarray(lng_chamados, dtype=float),
+    })
+    return df
+
+
+def resumir_status(status):
+    """Contagem de chamados por código de status (inclui códigos sem ocorrência)."""
+    return pd.Series(status).value_counts().reindex(CODIGOS_STATUS, fill_value=0)
+
+
+def rotulos_status(max_distance_km, raio_aereo_km, n_dias):
+    """Texto exibido para cada código de status, com os parâmetros da execução."""
+    return {
+        STATUS_ALOCADO: f'Atendimento Alocado (Raio: {max_distance_km} km)',
+        STATUS_ENDERECO_VAZIO: 'ERRO: Endereço vazio',
+        STATUS_FALHA_GEOCOD: 'ERRO: Falha na Geocodificação',
+        STATUS_SEM_ELEGIVEIS: 'Nenhum técnico ativo com as habilidades exigidas',
+        STATUS_FORA_RAIO_AEREO: f'Nenhum técnico no raio AÉREO de {raio_aereo_km:.0f} km',
+        STATUS_SEM_CAPACIDADE: f'Nenhum técnico disponível no raio (Todos no limite de capacidade diária em {n_dias} dia(s))',
+        STATUS_FORA_RAIO_REAL: f'Nenhum técnico no raio de {max_distance_km} km (Real)',
+    }
+
+
+def formatar_resultado(df, rotulos, texto=False):
+    """
+    Prepara o resultado tipado para exibição/exportação.
+    Troca os códigos de status pelos textos (renomeando apenas as categorias) e, com
+    `texto=True`, converte distância/custo/tempo para strings com 'N/A' (planilhas legadas).
+    """
+    df = df.drop(columns=['Indice_Tecnico', 'Latitude_Chamado', 'Longitude_Chamado'], errors='ignore')
+    df['Status'] = df['Status'].cat.rename_categories(rotulos)
+    if not texto:
+        return df
+
+    alocado = df['Distância_km'].notna()
+    df['Distância_km'] = df['Distância_km'].map('{:.2f}'.format).where(alocado, 'N/A')
+    df['Custo_Estimado_RS'] = df['Custo_Estimado_RS'].map('R$ {:.2f}'.format).where(alocado, 'N/A')
+    df['Tempo_Estimado_min'] = df['Tempo_Estimado_min'].map(lambda m: f"{m:.0f} min").where(alocado, 'N/A')
+    for col in ['Técnico_Mais_Próximo', 'Coordenador_Técnico', 'UF_Técnico']:
+        df[col] = df[col].fillna('N/A')
+    return df.rename(columns={'Tempo_Estimado_min': 'Tempo_Estimado'})
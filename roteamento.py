@@ -0,0 +1,207 @@
+import streamlit as st
+import numpy as np
+
+# --- VARIÁVEIS GLOBAIS ---
+R_TERRA_KM = 6371.0
+OSRM_URL = "http://router.project-osrm.org"
+# Limite de coordenadas por requisição aceito pelo servidor público do OSRM
+OSRM_MAX_COORDENADAS = 100
+# Linhas da matriz de distâncias calculadas por vez na busca do vizinho mais próximo
+BLOCO_VIZINHO = 2048
+
+# --- FUNÇÕES ---
+
+def haversine_vetorizado(lat1, lon1, lat2, lon2):
+    """
+    Versão vetorizada (NumPy) da distância Haversine em km.
+    Aceita escalares ou arrays e segue as regras de broadcasting do NumPy,
+    então (n, 1) x (1, m) gera a matriz n x m de distâncias aéreas.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    return 2 * R_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def tecnico_mais_proximo(lat, lng, lat_tecnicos, lng_tecnicos, tamanho_bloco=BLOCO_VIZINHO):
+    """
+    Vizinho mais próximo (distância aérea) de cada ponto, em blocos de linhas da matriz
+    de distâncias para limitar a memória. Retorna (índice do técnico, distância em km),
+    com -1 / NaN para pontos sem coordenadas ou sem técnicos.
+    """
+    n = len(lat)
+    indice = np.full(n, -1, dtype=np.int64)
+    distancia = np.full(n, np.nan)
+    validos = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lng))
+    if len(lat_tecnicos) == 0 or len(validos) == 0:
+        return indice, distancia
+
+    for inicio in range(0, len(validos), tamanho_bloco):
+        linhas = validos[inicio:inicio + tamanho_bloco]
+        dist = haversine_vetorizado(lat[linhas, None], lng[linhas, None], lat_tecnicos[None, :], lng_tecnicos[None, :])
+        mais_proximo = dist.argmin(axis=1)
+        indice[linhas] = mais_proximo
+        distancia[linhas] = dist[np.arange(len(linhas)), mais_proximo]
+    return indice, distancia
+
+
+def consultar_tabela_osrm(origem_lat, origem_lng, destinos, url_osrm=OSRM_URL, max_coordenadas=OSRM_MAX_COORDENADAS, timeout=15):
+    """
+    Distância (km) e tempo (s) de carro de uma origem para vários destinos (pares (lat, lng)),
+    pelo serviço /table do OSRM em `url_osrm`, em blocos de até `max_coordenadas` coordenadas.
+    Destinos sem rota (ou com falha da API) retornam infinito.
+    """
+    import requests
+
+    n = len(destinos)
+    distancias = np.full(n, np.inf)
+    tempos = np.full(n, np.inf)
+
+    # O OSRM recebe "lng,lat" e limita o número de coordenadas por chamada
+    passo = max_coordenadas - 1
+    for inicio in range(0, n, passo):
+        bloco = destinos[inicio:inicio + passo]
+        coords = [f"{origem_lng},{origem_lat}"] + [f"{lng},{lat}" for lat, lng in bloco]
+        url = f"{url_osrm}/table/v1/driving/{';'.join(coords)}"
+        params = {
+            "sources": "0",
+            "destinations": ";".join(str(k) for k in range(1, len(bloco) + 1)),
+            "annotations": "distance,duration"
+        }
+
+        try:
+            response = requests.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            continue
+
+        if data.get("code") != "Ok":
+            continue
+
+        linha_dist = data.get("distances", [[]])[0]
+        linha_tempo = data.get("durations", [[]])[0]
+        for k, (d, t) in enumerate(zip(linha_dist, linha_tempo)):
+            if d is not None:
+                distancias[inicio + k] = d / 1000
+            if t is not None:
+                tempos[inicio + k] = t
+
+    return distancias, tempos
+
+
+@st.cache_data(show_spinner=False)
+def get_tabela_osrm(origem_lat, origem_lng, destinos):
+    """
+    Obtém, em UMA requisição ao serviço /table do OSRM, a distância (km) e o tempo (s)
+    de carro entre uma origem e vários destinos.
+    `destinos` é uma tupla de pares (lat, lng) para que o resultado possa ser cacheado.
+    Destinos sem rota retornam infinito, como em `get_route_distance_osrm`.
+    """
+    return consultar_tabela_osrm(origem_lat, origem_lng, destinos)
+
+
+def montar_matriz_chamados(lat_chamados, lng_chamados, lat_tecnicos, lng_tecnicos, max_distance_km,
+                           fator_folga=1.5, elegiveis=None, ao_rotear=None, estimar=None, ao_obter_rotas=None):
+    """
+    Monta a matriz chamados x técnicos de distância de carro (km) e tempo (s).
+
+    1. Pré-filtro Haversine vetorizado para todos os pares (sem chamada de API).
+       `fator_folga` multiplica o raio: escalar ou um valor por técnico.
+    2. Uma chamada /table do OSRM por chamado, apenas para os candidatos no raio aéreo.
+    3. Candidatos sem rota (OSRM fora do ar) recebem a estimativa `estimar(aereo_km)`
+       -> (dist_km, tempo_s), se informada, em vez de serem descartados.
+    4. Pares fora do raio real recebem infinito.
+
+    `elegiveis` (matriz booleana opcional) descarta pares inelegíveis antes do roteamento.
+    Chamados sem coordenada (NaN) ficam com a linha inteira em infinito.
+    `ao_rotear(i, total)` é chamado após cada chamado roteado (ex.: barra de progresso) e
+    `ao_obter_rotas(i, colunas, dist_km, tempo_s)` recebe as rotas reais de cada chamado.
+    Retorna (dist_km, tempo_s, n_candidatos_aereos, estimado), `estimado` booleana n x m.
+    """
+    lat_chamados = np.asarray(lat_chamados, dtype=float)
+    lng_chamados = np.asarray(lng_chamados, dtype=float)
+    lat_tecnicos = np.asarray(lat_tecnicos, dtype=float)
+    lng_tecnicos = np.asarray(lng_tecnicos, dtype=float)
+
+    n, m = len(lat_chamados), len(lat_tecnicos)
+    dist_km = np.full((n, m), np.inf, dtype=np.float32)
+    tempo_s = np.full((n, m), np.inf, dtype=np.float32)
+
+    # 1. PRÉ-FILTRO AÉREO (n x m de uma vez)
+    aereo = haversine_vetorizado(lat_chamados[:, None], lng_chamados[:, None],
+                                 lat_tecnicos[None, :], lng_tecnicos[None, :])
+    candidatos = aereo <= max_distance_km * np.asarray(fator_folga, dtype=float)  # NaN -> False
+    if elegiveis is not None:
+        candidatos &= elegiveis
+    n_candidatos_aereos = candidatos.sum(axis=1)
+
+    # 2. ROTAS REAIS APENAS PARA OS CANDIDATOS
+    linhas = np.flatnonzero(n_candidatos_aereos)
+    for k, i in enumerate(linhas):
+        cols = np.flatnonzero(candidatos[i])
+        destinos = tuple((float(lat_tecnicos[j]), float(lng_tecnicos[j])) for j in cols)
+        d, t = get_tabela_osrm(float(lat_chamados[i]), float(lng_chamados[i]), destinos)
+        dist_km[i, cols] = d
+        tempo_s[i, cols] = t
+        if ao_obter_rotas is not None:
+            ao_obter_rotas(i, cols, d, t)
+        if ao_rotear is not None:
+            ao_rotear(k, len(linhas))
+
+    # 3. MODO DEGRADADO: ESTIMATIVA PELA DISTÂNCIA AÉREA ONDE O OSRM NÃO RESPONDEU
+    estimado = np.zeros((n, m), dtype=bool)
+    if estimar is not None:
+        estimado = candidatos & ~np.isfinite(dist_km)
+        if estimado.any():
+            d_est, t_est = estimar(aereo)
+            dist_km[estimado] = d_est[estimado]
+            tempo_s[estimado] = t_est[estimado]
+
+    # 4. FILTRO PELO RAIO REAL
+    fora_do_raio = dist_km > max_distance_km
+    dist_km[fora_do_raio] = np.inf
+    tempo_s[fora_do_raio] = np.inf
+    estimado &= ~fora_do_raio
+
+    return dist_km, tempo_s, n_candidatos_aereos, estimado
+
+
+@st.cache_data(show_spinner=False)
+def get_matriz_osrm(pontos):
+    """
+    Matriz completa de distância (km) e tempo (s) de carro entre todos os `pontos`
+    (tupla de pares (lat, lng)) em uma única chamada ao /table do OSRM.
+    Pares sem rota (ou falha da API) ficam com infinito.
+    """
+    import requests
+
+    n = len(pontos)
+    distancias = np.full((n, n), np.inf)
+    tempos = np.full((n, n), np.inf)
+    if n == 0 or n > OSRM_MAX_COORDENADAS:
+        return distancias, tempos
+
+    coords = ";".join(f"{lng},{lat}" for lat, lng in pontos)
+    url = f"{OSRM_URL}/table/v1/driving/{coords}"
+
+    try:
+        response = requests.get(url, params={"annotations": "distance,duration"}, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return distancias, tempos
+
+    if data.get("code") != "Ok":
+        return distancias, tempos
+
+    d = np.array(data.get("distances", []), dtype=float)  # None -> nan
+    t = np.array(data.get("durations", []), dtype=float)
+    if d.shape == (n, n):
+        distancias = np.where(np.isnan(d), np.inf, d / 1000)
+    if t.shape == (n, n):
+        tempos = np.where(np.isnan(t), np.inf, t)
+    return distancias, tempos
@@ -0,0 +1,163 @@
+import time
+import pandas as pd
+import numpy as np
+
+from roteamento import haversine_vetorizado, get_matriz_osrm
+
+# --- VARIÁVEIS GLOBAIS ---
+# Usados apenas quando o OSRM não devolve a rota de algum trecho
+FATOR_DESVIO_PADRAO = 1.3   # distância de carro ~ 1.3x a distância aérea
+VELOCIDADE_MEDIA_KMH = 60.0
+
+# --- FUNÇÕES ---
+
+def custo_rota(rota, matriz):
+    """Soma dos trechos de uma rota fechada (a rota já começa e termina na base, índice 0)."""
+    rota = np.asarray(rota)
+    return float(matriz[rota[:-1], rota[1:]].sum())
+
+
+def vizinho_mais_proximo(matriz):
+    """Rota inicial: sai da base (0), vai sempre à parada mais próxima ainda não visitada e volta."""
+    n = len(matriz)
+    visitado = np.zeros(n, dtype=bool)
+    visitado[0] = True
+    rota = [0]
+    for _ in range(n - 1):
+        linha = np.where(visitado, np.inf, matriz[rota[-1]])
+        proximo = int(np.argmin(linha))
+        rota.append(proximo)
+        visitado[proximo] = True
+    rota.append(0)
+    return rota
+
+
+def melhorar_rota(rota, matriz, orcamento_s=0.05):
+    """
+    Busca local 2-opt + Or-opt (move blocos de 1 a 3 paradas) até não haver melhora
+    ou o orçamento de tempo acabar. O custo é recalculado por inteiro a cada movimento,
+    o que mantém a busca correta para matrizes assimétricas (ida != volta).
+    """
+    limite = time.perf_counter() + orcamento_s
+    melhor = list(rota)
+    melhor_custo = custo_rota(melhor, matriz)
+    n = len(melhor)
+
+    melhorou = True
+    while melhorou and time.perf_counter() < limite:
+        melhorou = False
+
+        # 2-OPT: inverte o trecho melhor[i..k]
+        for i in range(1, n - 2):
+            for k in range(i + 1, n - 1):
+                candidata = melhor[:i] + melhor[i:k + 1][::-1] + melhor[k + 1:]
+                custo = custo_rota(candidata, matriz)
+                if custo < melhor_custo - 1e-9:
+                    melhor, melhor_custo, melhorou = candidata, custo, True
+            if time.perf_counter() >= limite:
+                break
+
+        # OR-OPT: reposiciona blocos de 1 a 3 paradas consecutivas
+        for tamanho in (1, 2, 3):
+            for i in range(1, n - tamanho):
+                bloco = melhor[i:i + tamanho]
+                resto = melhor[:i] + melhor[i + tamanho:]
+                for pos in range(1, len(resto)):
+                    if pos == i:
+                        continue
+                    candidata = resto[:pos] + bloco + resto[pos:]
+                    custo = custo_rota(candidata, matriz)
+                    if custo < melhor_custo - 1e-9:
+                        melhor, melhor_custo, melhorou = candidata, custo, True
+                        break
+            if time.perf_counter() >= limite:
+                break
+
+    return melhor, melhor_custo
+
+
+def matriz_paradas(lats, lngs, usar_osrm=True):
+    """
+    Matriz de distância (km) e tempo (s) entre a base do técnico (posição 0) e as paradas.
+    Usa o /table do OSRM e completa trechos sem rota com uma estimativa pela distância aérea
+    (só a estimativa, sem rede, com `usar_osrm=False`).
+    """
+    n = len(lats)
+    if usar_osrm:
+        dist_km, tempo_s = get_matriz_osrm(tuple((float(la), float(lo)) for la, lo in zip(lats, lngs)))
+    else:
+        dist_km, tempo_s = np.full((n, n), np.inf), np.full((n, n), np.inf)
+
+    faltando = ~np.isfinite(dist_km)
+    if faltando.any():
+        lats, lngs = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        aereo = haversine_vetorizado(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :])
+        dist_km = np.where(faltando, aereo * FATOR_DESVIO_PADRAO, dist_km)
+        tempo_s = np.where(faltando, dist_km / VELOCIDADE_MEDIA_KMH * 3600, tempo_s)
+    return dist_km, tempo_s
+
+
+def sequenciar_rotas(df_resultado, df_tecnicos, custo_por_km_rodado, orcamento_s=0.05, usar_osrm=True, ao_avancar=None):
+    """
+    Para cada técnico e dia, define a ordem de visita dos chamados alocados
+    (vizinho mais próximo + 2-opt/Or-opt) e calcula distância, tempo e custo real da rota,
+    saindo e voltando à base do técnico.
+
+    `df_resultado` precisa das colunas 'Indice_Tecnico', 'Dia_Atendimento',
+    'Latitude_Chamado', 'Longitude_Chamado' e 'Distância_km' (ida simples);
+    `df_tecnicos` é a tabela de técnicos indexada pela mesma posição de 'Indice_Tecnico'.
+    `ao_avancar(k, total)` é chamado após cada rota sequenciada (ex.: barra de progresso).
+    Retorna um DataFrame com uma linha por (dia, técnico).
+    """
+    colunas = ['Dia_Atendimento', 'Data_Atendimento', 'Técnico', 'Paradas', 'Sequência',
+               'Distância da Rota (km)', 'Tempo da Rota (min)', 'Custo da Rota (R$)',
+               'Custo Ida e Volta Individual (R$)', 'Economia (R$)']
+    alocados = df_resultado[df_resultado['Indice_Tecnico'].notna() & (df_resultado['Indice_Tecnico'] >= 0)]
+    if alocados.empty:
+        return pd.DataFrame(columns=colunas)
+
+    linhas = []
+    grupos = alocados.groupby(['Dia_Atendimento', 'Indice_Tecnico'], sort=True)
+    for k, ((dia, j), grupo) in enumerate(grupos):
+        tecnico = df_tecnicos.iloc[int(j)]
+        lats = np.r_[tecnico['latitude'], grupo['Latitude_Chamado'].to_numpy(dtype=float)]
+        lngs = np.r_[tecnico['longitude'], grupo['Longitude_Chamado'].to_numpy(dtype=float)]
+        dist_km, tempo_s = matriz_paradas(lats, lngs, usar_osrm)
+
+        rota = vizinho_mais_proximo(dist_km)
+        if len(rota) > 4:
+            rota, _ = melhorar_rota(rota, dist_km, orcamento_s)
+
+        distancia_rota = custo_rota(rota, dist_km)
+        paradas = [str(grupo['endereco'].iloc[p - 1]) for p in rota[1:-1]]
+        custo_individual = pd.to_numeric(grupo['Distância_km'], errors='coerce').sum() * 2 * custo_por_km_rodado
+
+        linhas.append({
+            'Dia_Atendimento': dia,
+            'Data_Atendimento': grupo['Data_Atendimento'].iloc[0],
+            'Técnico': tecnico['tecnico'],
+            'Paradas': len(grupo),
+            'Sequência': ' → '.join(paradas),
+            'Distância da Rota (km)': round(distancia_rota, 2),
+            'Tempo da Rota (min)': int(custo_rota(rota, tempo_s) // 60),
+            'Custo da Rota (R$)': round(distancia_rota * custo_por_km_rodado, 2),
+            'Custo Ida e Volta Individual (R$)': round(custo_individual, 2),
+        })
+        if ao_avancar is not None:
+            ao_avancar(k, grupos.ngroups)
+
+    df_rotas = pd.DataFrame(linhas)
+    df_rotas['Economia (R$)'] = (df_rotas['Custo Ida e Volta Individual (R$)'] - df_rotas['Custo da Rota (R$)']).round(2)
+    return df_rotas[colunas]
+
+
+def resumir_rotas_por_dia(df_rotas):
+    """Totais das rotas sequenciadas por dia (técnicos em rota, km, tempo e custo)."""
+    if df_rotas.empty:
+        return pd.DataFrame(columns=['Data_Atendimento', 'Técnicos em Rota', 'Distância Total (km)', 'Tempo Total (min)', 'Custo Total (R$)'])
+    return df_rotas.groupby('Data_Atendimento', sort=True).agg(**{
+        'Técnicos em Rota': ('Técnico', 'size'),
+        'Distância Total (km)': ('Distância da Rota (km)', 'sum'),
+        'Tempo Total (min)': ('Tempo da Rota (min)', 'sum'),
+        'Custo Total (R$)': ('Custo da Rota (R$)', 'sum'),
+    }).round(2).reset_index()